@@ -10,12 +10,12 @@ from m5.objects import (
 
 class ARTICache(ARTCache):
     def __init__(
-        self, flash_addr_range: AddrRange
+        self, flash_addr_range: AddrRange, size: str = "1KiB", assoc: int = 32
     ):
         super().__init__(
-            size="1KiB",
+            size=size,
             # num_sets = size / (block_size × num_blocks_per_sector × assoc)
-            assoc=32,
+            assoc=assoc,
             tag_latency=1,
             data_latency=1,
             response_latency=0,
@@ -34,10 +34,12 @@ class ARTICache(ARTCache):
         )
 
 class ARTDCache(NoncoherentCache):
-    def __init__(self, flash_addr_range: AddrRange):
-        self._size = "256B"
-        # Make it fully associative
-        self._assoc = 8
+    def __init__(
+        self, flash_addr_range: AddrRange, size: str = "256B", assoc: int = 8
+    ):
+        self._size = size
+        # Make it fully associative (8 ways of 32 bytes by default)
+        self._assoc = assoc
 
         self._response_latency = 0
         self._tag_latency = 1
@@ -1,4 +1,5 @@
 from typing import Optional
+import m5
 from m5.objects import (
     OpClass
 )
@@ -8,277 +9,213 @@ from m5.objects.BaseMinorCPU import *
 from gem5.components.processors.base_cpu_core import BaseCPUCore
 from gem5.components.processors.base_cpu_processor import BaseCPUProcessor
 from gem5.components.processors.cpu_types import CPUTypes
+from gem5.components.processors.simple_core import SimpleCore
 from gem5.isas import ISA
 from gem5.utils.override import overrides
 from gem5.utils.requires import requires
 
-def FPMaker(
-    _opClasses: list[str], 
-    _opLat: int, 
-    _timingDescription:str, 
-    _srcRegsRelativeLats: int, 
-    _extraAssumedLat: int
-)-> MinorFU:
-    class CustomFU(MinorFU):
-        opClasses = minorMakeOpClassSet(_opClasses)
-        opLat = _opLat
-        timings = [MinorFUTiming(
-            description=_timingDescription, 
-            srcRegsRelativeLats=_srcRegsRelativeLats,
-            extraAssumedLat=_extraAssumedLat
-            )
-        ]
-    return CustomFU()
-
-def CortexM4FPUPool() -> list[MinorFU]:
-    # Floating point unit
-    # TODO: understand the exact opClasses supported by M4 FPU. Currently, we 
-    # allow the following opClasses which cover most of the floating point
-    # operations.
-
-    # Number of cycle is found in Cortex-M4 Technical Reference Manual
-    # Table 7-1  FPU instruction set.
-    # Combine with the Arm ISA in gem5/src/arch/arm/isa/insts/fp.isa, Cortex M4
-    # supports the following floating point operations:
-    # vabs.f32, vmov, vmrs, vneg
-    floatAbs = FPMaker(["SimdFloatMisc"], 1, "SimdFloatMisc", 2, 0)
+# ==== functional units ====
+# One row per opclass: (opclass, opLat, srcRegsRelativeLats, extraAssumedLat).
+# Minor issues an instruction into the first FU (in pool order) that provides
+# its opclass, and advances every FU each cycle, so the pool keeps one FU per
+# opclass the Cortex-M4 executes, ordered by how often the opclass is issued,
+# and shares FUs between the opclasses it never executes.
+
+# Integer instruction units
+# Number of cycle is found in Cortex-M4 Technical Reference Manual
+# Table 3-1  Cortex-M4 instruction set.
+CORTEX_M4_INT_FUS = [
+    ("IntAlu", 1, 1, 0),
+    # ldr, str
+    ("MemRead", 1, 2, 0),
+    ("MemWrite", 1, 2, 0),
+    ("IntMult", 2, 1, 0),
+    # TODO: confused on divide instruction so use the original MinorFU
+    # setting first
+    ("IntDiv", 9, 0, 0),
+    # orn
+    ("SimdAlu", 1, 2, 0),
+    ("SimdMultAcc", 1, 2, 0),
+]
+
+# Floating point unit
+# TODO: understand the exact opClasses supported by M4 FPU. Currently, we
+# allow the following opClasses which cover most of the floating point
+# operations.
+# Number of cycle is found in Cortex-M4 Technical Reference Manual
+# Table 7-1  FPU instruction set.
+# Combine with the Arm ISA in gem5/src/arch/arm/isa/insts/fp.isa, Cortex M4
+# supports the following floating point operations:
+# TODO: need to dig more precisely with vldm, vpop, vpush, vstm
+CORTEX_M4_FPU_FUS = [
+    # vldr.32
+    ("FloatMemRead", 2, 2, 0),
+    # vstr.32
+    ("FloatMemWrite", 2, 2, 0),
     # vadd.f32, vsub
-    floatAdd = FPMaker(["SimdFloatAdd"], 1, "SimdFloatAdd", 2, 0)
+    ("SimdFloatAdd", 1, 2, 0),
+    # vmul
+    ("SimdFloatMult", 1, 2, 0),
+    # vmla, vmls, vnmla, vnmls, vfma, vfms, vfnma, vfnms
+    ("SimdFloatMultAcc", 3, 2, 0),
+    # vabs.f32, vmov, vmrs, vneg
+    ("SimdFloatMisc", 1, 2, 0),
     # vcmp.f32 and vcmpe.f32
-    floatCmp = FPMaker(["SimdFloatCmp"], 1, "SimdFloatCmp", 2, 0)
+    ("SimdFloatCmp", 1, 2, 0),
     # vcvt.f32
-    floatCvt = FPMaker(["SimdFloatCvt"], 1, "SimdFloatCvt", 2, 0)
+    ("SimdFloatCvt", 1, 2, 0),
     # vdiv.f32
-    floatDiv = FPMaker(["SimdFloatDiv"], 14, "SimdFloatDiv", 2, 0)
-    # vmul
-    floatMul = FPMaker(["SimdFloatMult"], 1, "SimdFloatMult", 2, 0)
-    # vmla, vmls, vnmla, vnmls, vfma, vfms, vfnma, vfnms
-    floatMla = FPMaker(["SimdFloatMultAcc"], 3, "SimdFloatMultAcc", 2, 0)
+    ("SimdFloatDiv", 14, 2, 0),
     # vsqrt
-    floatSqrt = FPMaker(["SimdFloatSqrt"], 14, "SimdFloatSqrt", 2, 0)
-    # vldr.32
-    floatMemRead = FPMaker(
-        ["FloatMemRead"], 2, "FloatMemRead", 2, 0
-    )
-    # vstr.32
-    floatMemWrite = FPMaker(
-        ["FloatMemWrite"], 2, "FloatMemWrite", 2, 0 
-    )
+    ("SimdFloatSqrt", 14, 2, 0),
+]
 
-    # TODO: need to dig more precisely with vldm, vpop, vpush, vstm
+# Opclasses the AArch32 decoder can produce but whose Cortex-M4 mapping is
+# not verified yet
+CORTEX_M4_UNSURE_FUS = [
+    ("SimdAdd", 1, 2, 0),
+    ("SimdAddAcc", 1, 2, 0),
+    ("SimdCmp", 1, 2, 0),
+    ("SimdCvt", 1, 2, 0),
+    ("SimdMisc", 1, 2, 0),
+    ("SimdMult", 1, 2, 0),
+    ("SimdShift", 1, 2, 0),
+    ("SimdShiftAcc", 1, 2, 0),
+    ("SimdFloatAlu", 1, 2, 0),
+    ("IprAccess", 1, 2, 0),
+    ("InstPrefetch", 1, 2, 0),
+]
 
-    return [
-        floatAbs,
-        floatAdd,
-        floatCmp,
-        floatCvt,
-        floatDiv,
-        floatMul,
-        floatMla,
-        floatSqrt,
-        floatMemRead,
-        floatMemWrite,
-    ]
+# AArch64, SVE/SME and RISC-V vector opclasses. An ARMv7E-M binary never
+# executes them, so the ones with the same timing share one FU; they are only
+# there so that the pool covers every opclass.
+CORTEX_M4_UNUSED_FUS = [
+    ("FloatAdd", 1, 2, 0),
+    ("FloatCmp", 1, 2, 0),
+    ("FloatCvt", 1, 2, 0),
+    ("FloatMult", 1, 2, 0),
+    ("FloatMultAcc", 3, 2, 0),
+    ("FloatDiv", 14, 2, 0),
+    ("FloatMisc", 1, 2, 0),
+    ("FloatSqrt", 14, 2, 0),
+    ("SimdMatMultAcc", 1, 2, 0),
+    ("SimdDiv", 14, 2, 0),
+    ("SimdSqrt", 14, 2, 0),
+    ("SimdFloatMatMultAcc", 1, 2, 0),
+    ("SimdReduceAdd", 1, 2, 0),
+    ("SimdReduceAlu", 1, 2, 0),
+    ("SimdReduceCmp", 1, 2, 0),
+    ("SimdFloatReduceAdd", 1, 2, 0),
+    ("SimdFloatReduceCmp", 1, 2, 0),
+    ("SimdAes", 1, 2, 0),
+    ("SimdAesMix", 1, 2, 0),
+    ("SimdSha1Hash", 1, 2, 0),
+    ("SimdSha1Hash2", 1, 2, 0),
+    ("SimdSha256Hash", 1, 2, 0),
+    ("SimdSha256Hash2", 1, 2, 0),
+    ("SimdShaSigma2", 1, 2, 0),
+    ("SimdShaSigma3", 1, 2, 0),
+    ("SimdPredAlu", 1, 2, 0),
+    ("Matrix", 1, 2, 0),
+    ("MatrixMov", 1, 2, 0),
+    ("MatrixOP", 1, 2, 0),
+    ("SimdUnitStrideLoad", 1, 2, 0),
+    ("SimdUnitStrideStore", 1, 2, 0),
+    ("SimdUnitStrideMaskLoad", 1, 2, 0),
+    ("SimdUnitStrideMaskStore", 1, 2, 0),
+    ("SimdStridedLoad", 1, 2, 0),
+    ("SimdStridedStore", 1, 2, 0),
+    ("SimdIndexedLoad", 1, 2, 0),
+    ("SimdIndexedStore", 1, 2, 0),
+    ("SimdWholeRegisterLoad", 1, 2, 0),
+    ("SimdWholeRegisterStore", 1, 2, 0),
+    ("SimdUnitStrideFaultOnlyFirstLoad", 1, 2, 0),
+    ("SimdUnitStrideSegmentedLoad", 1, 2, 0),
+    ("SimdUnitStrideSegmentedStore", 1, 2, 0),
+    ("SimdUnitStrideSegmentedFaultOnlyFirstLoad", 1, 2, 0),
+    ("SimdStrideSegmentedLoad", 1, 2, 0),
+    ("SimdStrideSegmentedStore", 1, 2, 0),
+    ("SimdExt", 1, 2, 0),
+    ("SimdFloatExt", 1, 2, 0),
+    ("SimdConfig", 1, 2, 0),
+    # ("SimdBf16Cvt", 1, 2, 0),
+    # ("SimdBf16DotProd", 1, 2, 0),
+    # ("SimdBf16MatMultAcc", 1, 2, 0),
+    # ("SimdBf16MultAcc", 1, 2, 0),
+    # ("Bf16Cvt", 1, 2, 0),
+]
 
-def CortexM4IntFU() -> list[MinorFU]:
-    # Integer instruction units
-    # Number of cycle is found in Cortex-M4 Technical Reference Manual
-    # Table 3-1  Cortex-M4 instruction set. 
-    intSimple = FPMaker(["IntAlu"], 1, "IntAlu", 1, 0)
-    intMul = FPMaker(["IntMult"], 2, "IntMult", 1, 0)
-    # TODO: confused on divide instruction so use the original MinorFU setting 
-    # first
-    intDiv = FPMaker(["IntDiv"], 9, "IntDiv", 0, 0)
-    # orn
-    simdAlu = FPMaker(["SimdAlu"], 1, "SimdAlu", 2, 0)
-    simdMultAcc = FPMaker(["SimdMultAcc"], 1, "SimdMultAcc", 2, 0)
+# (opLat, srcRegsRelativeLats, extraAssumedLat) -> MinorFU subclass
+_fu_classes: dict[tuple[int, int, int], type] = {}
+
+def _fu_class(timing: tuple[int, int, int]) -> type:
+    # one class per distinct timing, shared by every core and every opclass
+    if timing not in _fu_classes:
+        _opLat, _srcRegsRelativeLats, _extraAssumedLat = timing
+        class CortexM4FU(MinorFU):
+            opLat = _opLat
+            timings = [MinorFUTiming(
+                description=f"lat{_opLat}",
+                srcRegsRelativeLats=_srcRegsRelativeLats,
+                extraAssumedLat=_extraAssumedLat
+                )
+            ]
+        _fu_classes[timing] = CortexM4FU
+    return _fu_classes[timing]
 
+def _make_fu(op_classes: list[str], timing: tuple[int, int, int]) -> MinorFU:
+    fu = _fu_class(timing)()
+    fu.opClasses = minorMakeOpClassSet(op_classes)
+    return fu
+
+def _apply_latencies(
+    table: list[tuple[str, int, int, int]], fu_latencies: dict[str, int]
+) -> list[tuple[str, int, int, int]]:
     return [
-        intSimple,
-        intMul,
-        intDiv,
-        simdAlu,
-        simdMultAcc
+        (op_class, fu_latencies.get(op_class, op_lat), src_lats, extra_lat)
+        for op_class, op_lat, src_lats, extra_lat in table
     ]
 
-def Unsure() -> list[MinorFU]:
-    FloatAdd = FPMaker(["FloatAdd"], 1, "FloatAdd", 2, 0)
-    FloatCmp = FPMaker(["FloatCmp"], 1, "FloatCmp", 2, 0)
-    FloatCvt = FPMaker(["FloatCvt"], 1, "FloatCvt", 2, 0)
-    FloatMult = FPMaker(["FloatMult"], 1, "FloatMult", 2, 0)
-    FloatMultAcc = FPMaker(["FloatMultAcc"], 3, "FloatMultAcc", 2, 0)
-    FloatDiv = FPMaker(["FloatDiv"], 14, "FloatDiv", 2, 0)
-    FloatMisc = FPMaker(["FloatMisc"], 1, "FloatMisc", 2, 0)
-    FloatSqrt = FPMaker(["FloatSqrt"], 14, "FloatSqrt", 2, 0)
-    SimdAdd = FPMaker(["SimdAdd"], 1, "SimdAdd", 2, 0)
-    SimdAddAcc = FPMaker(["SimdAddAcc"], 1, "SimdAddAcc", 2, 0)
-    SimdCmp = FPMaker(["SimdCmp"], 1, "SimdCmp", 2, 0)
-    SimdCvt = FPMaker(["SimdCvt"], 1, "SimdCvt", 2, 0)
-    SimdMisc = FPMaker(["SimdMisc"], 1, "SimdMisc", 2, 0)
-    SimdMult = FPMaker(["SimdMult"], 1, "SimdMult", 2, 0)
-    SimdMatMultAcc = FPMaker(["SimdMatMultAcc"], 1, "SimdMatMultAcc", 2, 0)
-    SimdShift = FPMaker(["SimdShift"], 1, "SimdShift", 2, 0)            
-    SimdShiftAcc = FPMaker(["SimdShiftAcc"], 1, "SimdShiftAcc", 2, 0)
-    SimdDiv = FPMaker(["SimdDiv"], 14, "SimdDiv", 2, 0)
-    SimdSqrt = FPMaker(["SimdSqrt"], 14, "SimdSqrt", 2, 0)
-    SimdFloatAlu = FPMaker(["SimdFloatAlu"], 1, "SimdFloatAlu", 2, 0)
-    SimdFloatMatMultAcc = FPMaker(["SimdFloatMatMultAcc"], 1, "SimdFloatMatMultAcc", 2, 0)
-    SimdReduceAdd = FPMaker(["SimdReduceAdd"], 1, "SimdReduceAdd", 2, 0)
-    SimdReduceAlu = FPMaker(["SimdReduceAlu"], 1, "SimdReduceAlu", 2, 0)
-    SimdReduceCmp = FPMaker(["SimdReduceCmp"], 1, "SimdReduceCmp", 2, 0)
-    SimdFloatReduceAdd = FPMaker(["SimdFloatReduceAdd"], 1, "SimdFloatReduceAdd", 2, 0)
-    SimdFloatReduceCmp = FPMaker(["SimdFloatReduceCmp"], 1, "SimdFloatReduceCmp", 2, 0)
-    SimdAes = FPMaker(["SimdAes"], 1, "SimdAes", 2, 0)
-    SimdAesMix = FPMaker(["SimdAesMix"], 1, "SimdAesMix", 2, 0)
-    SimdSha1Hash = FPMaker(["SimdSha1Hash"], 1, "SimdSha1Hash", 2, 0)
-    SimdSha1Hash2 = FPMaker(["SimdSha1Hash2"], 1, "SimdSha1Hash2", 2, 0)
-    SimdSha256Hash = FPMaker(["SimdSha256Hash"], 1, "SimdSha256Hash", 2, 0)
-    SimdSha256Hash2 = FPMaker(["SimdSha256Hash2"], 1, "SimdSha256Hash2", 2, 0)
-    SimdShaSigma2 = FPMaker(["SimdShaSigma2"], 1, "SimdShaSigma2", 2, 0) 
-    SimdShaSigma3 = FPMaker(["SimdShaSigma3"], 1, "SimdShaSigma3", 2, 0)
-    SimdPredAlu = FPMaker(["SimdPredAlu"], 1, "SimdPredAlu", 2, 0)
-    Matrix = FPMaker(["Matrix"], 1, "Matrix", 2, 0)
-    MatrixMov = FPMaker(["MatrixMov"], 1, "MatrixMov", 2, 0)
-    MatrixOP = FPMaker(["MatrixOP"], 1, "MatrixOP", 2, 0)
-    MemRead = FPMaker(["MemRead"], 1, "MemRead", 2, 0)
-    MemWrite = FPMaker(["MemWrite"], 1, "MemWrite", 2, 0)
-    IprAccess = FPMaker(["IprAccess"], 1, "IprAccess", 2, 0)
-    InstPrefetch = FPMaker(["InstPrefetch"], 1, "InstPrefetch", 2, 0)
-    SimdUnitStrideLoad = FPMaker(
-        ["SimdUnitStrideLoad"], 1, "SimdUnitStrideLoad", 2, 0
-    )
-    SimdUnitStrideStore = FPMaker(
-        ["SimdUnitStrideStore"], 1, "SimdUnitStrideStore", 2, 0
-    )
-    SimdUnitStrideMaskLoad = FPMaker(
-        ["SimdUnitStrideMaskLoad"], 1, "SimdUnitStrideMaskLoad", 2, 0
-    )
-    SimdUnitStrideMaskStore = FPMaker(
-        ["SimdUnitStrideMaskStore"], 1, "SimdUnitStrideMaskStore", 2, 0
-    )
-    SimdStridedLoad = FPMaker(
-        ["SimdStridedLoad"], 1, "SimdStridedLoad", 2, 0
-    )
-    SimdStridedStore = FPMaker(
-        ["SimdStridedStore"], 1, "SimdStridedStore", 2, 0
-    )
-    SimdIndexedLoad = FPMaker(
-        ["SimdIndexedLoad"], 1, "SimdIndexedLoad", 2, 0
-    )
-    SimdIndexedStore = FPMaker(
-        ["SimdIndexedStore"], 1, "SimdIndexedStore", 2, 0
-    )
-    SimdWholeRegisterLoad = FPMaker(
-        ["SimdWholeRegisterLoad"], 1, "SimdWholeRegisterLoad", 2, 0
-    )
-    SimdWholeRegisterStore = FPMaker(
-        ["SimdWholeRegisterStore"], 1, "SimdWholeRegisterStore", 2, 0
-    )
-    SimdUnitStrideFaultOnlyFirstLoad = FPMaker(
-        ["SimdUnitStrideFaultOnlyFirstLoad"], 1, 
-        "SimdUnitStrideFaultOnlyFirstLoad", 2, 0
-    )
-    SimdUnitStrideSegmentedLoad = FPMaker(
-        ["SimdUnitStrideSegmentedLoad"], 1, "SimdUnitStrideSegmentedLoad", 2, 0
-    )
-    SimdUnitStrideSegmentedStore = FPMaker(
-        ["SimdUnitStrideSegmentedStore"], 1, "SimdUnitStrideSegmentedStore", 2,
-        0
-    )
-    SimdUnitStrideSegmentedFaultOnlyFirstLoad = FPMaker(
-        ["SimdUnitStrideSegmentedFaultOnlyFirstLoad"], 1,
-        "SimdUnitStrideSegmentedFaultOnlyFirstLoad", 2, 0
-    )
-    SimdStrideSegmentedLoad = FPMaker(
-        ["SimdStrideSegmentedLoad"], 1, "SimdStrideSegmentedLoad", 2, 0
-    )
-    SimdStrideSegmentedStore = FPMaker(
-        ["SimdStrideSegmentedStore"], 1, "SimdStrideSegmentedStore", 2, 0
-    )
-    SimdExt = FPMaker(["SimdExt"], 1, "SimdExt", 2, 0)
-    SimdFloatExt = FPMaker(["SimdFloatExt"], 1, "SimdFloatExt", 2, 0)
-    SimdConfig = FPMaker(["SimdConfig"], 1, "SimdConfig", 2, 0)
-    #SimdBf16Cvt = FPMaker(["SimdBf16Cvt"], 1, "SimdBf16Cvt", 2, 0) 
-    #SimdBf16DotProd = FPMaker(["SimdBf16DotProd"], 1, "SimdBf16DotProd", 2, 0)
-    #SimdBf16MatMultAcc = FPMaker(
-    #    ["SimdBf16MatMultAcc"], 1, "SimdBf16MatMultAcc", 2, 0)
-    #SimdBf16MultAcc = FPMaker(
-    #    ["SimdBf16MultAcc"], 1, "SimdBf16MultAcc", 2, 0)
-    #Bf16Cvt = FPMaker(
-    #    ["Bf16Cvt"], 1, "Bf16Cvt", 2, 0)
-    return [
-        FloatAdd,
-        FloatCmp,
-        FloatCvt,
-        FloatMult,
-        FloatMultAcc,
-        FloatDiv,
-        FloatMisc,
-        FloatSqrt,
-        SimdAdd,
-        SimdAddAcc,
-        SimdCmp,
-        SimdCvt,
-        SimdMisc,
-        SimdMult,
-        SimdMatMultAcc,
-        SimdShift,
-        SimdShiftAcc,
-        SimdDiv,
-        SimdSqrt,
-        SimdFloatAlu,
-        SimdFloatMatMultAcc,
-        SimdReduceAdd,
-        SimdReduceAlu,
-        SimdReduceCmp,
-        SimdFloatReduceAdd,
-        SimdFloatReduceCmp,
-        SimdAes,
-        SimdAesMix,
-        SimdSha1Hash,
-        SimdSha1Hash2,
-        SimdSha256Hash,
-        SimdSha256Hash2,
-        SimdShaSigma2,
-        SimdShaSigma3,
-        SimdPredAlu,
-        Matrix,
-        MatrixMov,
-        MatrixOP,
-        MemRead,
-        MemWrite,
-        IprAccess,
-        InstPrefetch,
-        SimdUnitStrideLoad,
-        SimdUnitStrideStore,
-        SimdUnitStrideMaskLoad,
-        SimdUnitStrideMaskStore,
-        SimdStridedLoad,
-        SimdStridedStore,
-        SimdIndexedLoad,
-        SimdIndexedStore,
-        SimdWholeRegisterLoad,
-        SimdWholeRegisterStore,
-        SimdUnitStrideFaultOnlyFirstLoad,
-        SimdUnitStrideSegmentedLoad,
-        SimdUnitStrideSegmentedStore,
-        SimdUnitStrideSegmentedFaultOnlyFirstLoad,
-        SimdStrideSegmentedLoad,
-        SimdStrideSegmentedStore,
-        SimdExt,
-        SimdFloatExt,
-        SimdConfig,
-       # SimdBf16Cvt,
-       # SimdBf16DotProd,
-       # SimdBf16MatMultAcc,
-       # SimdBf16MultAcc,
-       # Bf16Cvt
+def CortexM4FUs(
+    if_fpu: bool, fu_latencies: Optional[dict[str, int]] = None
+) -> list[MinorFU]:
+    """The FUs of a Cortex-M4 core, in issue-priority order.
+
+    `fu_latencies` maps opclass names to an opLat replacing the table's.
+    """
+    fu_latencies = fu_latencies or {}
+    dedicated = list(CORTEX_M4_INT_FUS)
+    if if_fpu:
+        # right after the integer loads/stores and multiplies
+        dedicated[4:4] = CORTEX_M4_FPU_FUS
+    dedicated += CORTEX_M4_UNSURE_FUS
+    shared = CORTEX_M4_UNUSED_FUS
+    known = {row[0] for row in dedicated + shared}
+    unknown = set(fu_latencies) - known
+    if unknown:
+        raise ValueError(f"No functional unit for opclass(es) "
+                         f"{', '.join(sorted(unknown))}.")
+
+    fus = [
+        _make_fu([op_class], tuple(timing))
+        for op_class, *timing in _apply_latencies(dedicated, fu_latencies)
     ]
+    # timing -> opclasses, in table order
+    groups: dict[tuple[int, int, int], list[str]] = {}
+    for op_class, *timing in _apply_latencies(shared, fu_latencies):
+        groups.setdefault(tuple(timing), []).append(op_class)
+    fus += [_make_fu(op_classes, timing)
+            for timing, op_classes in groups.items()]
+    return fus
 
 class CortexM4Core(ArmMinorCPU):
-    def __init__(self, if_fpu: bool) -> None:
+    def __init__(
+        self, if_fpu: bool, fu_latencies: Optional[dict[str, int]] = None
+    ) -> None:
         super().__init__()
         self._if_fpu = if_fpu
+        # opclass name -> opLat replacing the default latency of its FU
+        self._fu_latencies = fu_latencies or {}
 
         # M4 does not support SMT
         self.threadPolicy = "SingleThreaded"
@@ -311,24 +248,80 @@ class CortexM4Core(ArmMinorCPU):
 
         self.executeFuncUnits = self._create_fu_pool()
 
-    def _create_fu_pool(self) -> list[MinorFU]:
-        _all_fus = []
-        if self._if_fpu:
-            _all_fus += CortexM4FPUPool()
-        _all_fus += CortexM4IntFU()
-        _all_fus += Unsure()
+    def _create_fu_pool(self) -> MinorFUPool:
+        _all_fus = CortexM4FUs(self._if_fpu, self._fu_latencies)
         class CortexM4FUPool(MinorFUPool):
             funcUnits = _all_fus
         return CortexM4FUPool()
 
 
 class CortexM4CPU(BaseCPUCore):
-    def __init__(self, if_fpu: bool):
-        cpu = CortexM4Core(if_fpu=if_fpu)
+    def __init__(
+        self, if_fpu: bool, fu_latencies: Optional[dict[str, int]] = None
+    ):
+        cpu = CortexM4Core(if_fpu=if_fpu, fu_latencies=fu_latencies)
         super().__init__(core=cpu, isa=ISA.ARM) 
 
 
 class CortexM4Processor(BaseCPUProcessor):
-    def __init__(self, num_cores: int, if_fpu: bool):
-        cores = [CortexM4CPU(if_fpu=if_fpu) for _ in range(num_cores)]
+    def __init__(
+        self,
+        num_cores: int,
+        if_fpu: bool,
+        fu_latencies: Optional[dict[str, int]] = None,
+    ):
+        cores = [
+            CortexM4CPU(if_fpu=if_fpu, fu_latencies=fu_latencies)
+            for _ in range(num_cores)
+        ]
         super().__init__(cores=cores)
+
+
+class CortexM4SwitchableProcessor(BaseCPUProcessor):
+    # Starts on atomic cores to fast-forward (functionally warming the caches
+    # they are connected to) and switches to the detailed CortexM4Core for the
+    # regions of interest. get_cores() returns the starting (atomic) cores,
+    # which are the ones the board connects to the memory system; the
+    # detailed cores take over those connections when switched in.
+    def __init__(
+        self,
+        num_cores: int,
+        if_fpu: bool,
+        fu_latencies: Optional[dict[str, int]] = None,
+    ):
+        fast_cores = [
+            SimpleCore(cpu_type=CPUTypes.ATOMIC, core_id=i, isa=ISA.ARM)
+            for i in range(num_cores)
+        ]
+        super().__init__(cores=fast_cores)
+        self.detailed_cores = [
+            CortexM4CPU(if_fpu=if_fpu, fu_latencies=fu_latencies)
+            for _ in range(num_cores)
+        ]
+        for core in self.detailed_cores:
+            core.core.switched_out = True
+        self._in_detailed = False
+
+    def get_detailed_cores(self) -> list[BaseCPUCore]:
+        return self.detailed_cores
+
+    def in_detailed(self) -> bool:
+        return self._in_detailed
+
+    def _switch(self, system, old_cores, new_cores) -> None:
+        m5.switchCpus(
+            system,
+            [(old.core, new.core) for old, new in zip(old_cores, new_cores)]
+        )
+
+    def switch_to_detailed(self, system) -> None:
+        if self._in_detailed:
+            return
+        self._switch(system, self.cores, self.detailed_cores)
+        self._in_detailed = True
+
+    def switch_to_fast(self, system) -> None:
+        if not self._in_detailed:
+            return
+        self._switch(system, self.detailed_cores, self.cores)
+        self._in_detailed = False
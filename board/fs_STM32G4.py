@@ -1,8 +1,11 @@
 from board.MCU.cores.M4_core import CortexM4Processor
 from board.MCU.cache.ART import ARTICache, ARTDCache
 from pathlib import Path
+import mmap
 
+import m5
 from m5.objects import (
+    AbstractMemory,
     ArmFsWorkload,
     AddrRange,
     ArmSemihosting,
@@ -23,8 +26,18 @@ from m5.objects import (
     ArmSPI
 )
 
+from utils.log_ring import write_ring_image
+
+# GO, DONE, INPUT_START, INPUT_SIZE, OUTPUT_START and OUTPUT_SIZE, one 32-bit
+# register each
+BRIDGE_IO_REGISTER_BYTES = 6 * 4
+
 class STM32G4FSBoard:
-    def __init__(self):
+    def __init__(self,
+            input_buffer_size: int = 256,
+            output_buffer_size: int = 256,
+            log_ring_size: str = "4KiB",
+    ):
         self.system = ArmSystem()
 
         self.system.clk_domain = SrcClockDomain()
@@ -65,6 +78,9 @@ class STM32G4FSBoard:
         m5op_region = AddrRange(start=0x20020000, size="1MiB")
         # PIO region 16 MiBytes
         pio_region = AddrRange(start=0x88000000, size="1MiB")
+        # firmware log ring, right after the bridge IO device (see
+        # utils/log_ring.py and lib/log_ring.c of the co-sim firmware)
+        self.log_ring_range = AddrRange(start=0x88100000, size=log_ring_size)
         # GIC region
         gic_region = AddrRange(start=0x2C000000, size="4MiB")
         # record memory ranges in system
@@ -124,6 +140,22 @@ class STM32G4FSBoard:
         self.system.sram2.latency = "10ns"
         self.system.sram2.bandwidth = "400MiB/s"
 
+        # the log ring is plain uncached memory: the firmware appends to it
+        # with ordinary stores and the host drains it between run-ahead
+        # periods through the shared backing store, instead of trapping into
+        # the simulator for every character like semihosting does
+        self.system.log_ring = SimpleMemory()
+        self.system.log_ring.range = self.log_ring_range
+        self.system.log_ring.port = self.system.membus.mem_side_ports
+        self.system.log_ring.latency = "10ns"
+        self.system.log_ring.bandwidth = "400MiB/s"
+        # loaded at instantiate (and kept in checkpoints): the header of a
+        # disabled ring, which the host checks for before enabling it
+        self.system.log_ring.image_file = write_ring_image(
+            Path(m5.options.outdir) / "log-ring.img",
+            self.log_ring_range.size()
+        ).as_posix()
+
         # connect the IO bridge and IO cache to the membus
         self.system.iobridge = Bridge(delay="50ns", ranges=self.system.mem_ranges)
         self.system.iocache = Cache(
@@ -223,19 +255,38 @@ class STM32G4FSBoard:
         self.system.highest_el_is_64 = False
 
         # == PIO devices ==
+        # the device serves its registers and both data buffers from the PIO
+        # region, so together they must fit in it
+        if input_buffer_size <= 0 or output_buffer_size <= 0:
+            raise ValueError("Bridge IO buffer sizes must be positive.")
+        if BRIDGE_IO_REGISTER_BYTES + input_buffer_size + output_buffer_size \
+                > pio_region.size():
+            raise ValueError(f"Bridge IO buffers of {input_buffer_size} B "
+                             f"(input) and {output_buffer_size} B (output) "
+                             f"do not fit in the {pio_region.size()} B PIO "
+                             "region.")
+
+        # the firmware sleeps in WFI between bridge interrupts; a suspended
+        # core schedules no events, so the simulation skips directly to the
+        # next interrupt or to the end of the run-ahead period, and the idle
+        # time still counts toward the core's cycles
         BRIDGE_SPI_NUM = 37
         self.system.bridge_int_pin = ArmSPI(num=BRIDGE_SPI_NUM)
         self.system.bridge_io = BridgeIODevice(
             pio_addr=pio_region.start,
             pio_size=pio_region.size(),
-            input_data_buffer_size=256,
-            output_data_buffer_size=256,
+            input_data_buffer_size=input_buffer_size,
+            output_data_buffer_size=output_buffer_size,
             isa="Arm",
             go=True,
             interrupt_pin=self.system.bridge_int_pin
         )
         self.system.bridge_io.pio = self.system.membus.mem_side_ports
 
+        # firmware signals milestones (e.g. reaching its dispatch loop so a
+        # checkpoint can be taken) through address based m5ops
+        self.system.m5ops_base = m5op_region.start
+
     def setup_workload(self, binary_path: Path):
         class ArmBaremetal(ArmFsWorkload):
             # copied from configs/example/arm/workloads.py
@@ -251,3 +302,35 @@ class STM32G4FSBoard:
 
     def get_system(self):
         return self.system
+
+    def share_memory(self, name: str):
+        """Back all memories with the POSIX shared memory segment `name`.
+
+        The host can then map /dev/shm/<name> to read the log ring (see
+        log_ring_offset). Must be called before m5.instantiate().
+        """
+        self.system.shared_backstore = name
+        self.system.auto_unlink_shared_backstore = True
+
+    def log_ring_offset(self) -> int:
+        """Offset of the log ring in the shared backing store.
+
+        Assumes that gem5 (PhysicalMemory) lays out one stretch of the
+        segment per memory in the address map, by increasing start address,
+        each rounded up to a host page. This depends on the gem5 version, so
+        LogRing.enable() checks the ring's header at this offset before
+        using it.
+        """
+        offset = 0
+        memories = sorted(
+            (obj for obj in self.system.descendants()
+             if isinstance(obj, AbstractMemory)
+             and obj.in_addr_map and not obj.null),
+            key=lambda memory: int(memory.range.start)
+        )
+        for memory in memories:
+            if int(memory.range.start) >= int(self.log_ring_range.start):
+                break
+            size = memory.range.size()
+            offset += -(-size // mmap.PAGESIZE) * mmap.PAGESIZE
+        return offset
@@ -1,6 +1,10 @@
 from pathlib import Path
+from typing import Optional
 
-from board.MCU.cores.M4_core import CortexM4Processor
+from board.MCU.cores.M4_core import (
+    CortexM4Processor,
+    CortexM4SwitchableProcessor,
+)
 from board.MCU.cache.ART import ARTICache, ARTDCache
 
 from m5.objects import (
@@ -26,14 +30,24 @@ class STM32G4SEBoard:
             sram2_size: str = "16KiB",
             pio_region_base: int = 0x40013000,
             pio_region_size: str = "1MiB",
-            m5ops_base: int = 0x20020000):
+            m5ops_base: int = 0x20020000,
+            fast_forward: bool = False,
+            flash_latency: str = "40ns",
+            icache_size: str = "1KiB",
+            icache_assoc: int = 32,
+            dcache_size: str = "256B",
+            dcache_assoc: int = 8,
+            fu_latencies: Optional[dict[str, int]] = None):
         # create the system
         self.system = System()
+        self._fast_forward = fast_forward
 
         self.system.clk_domain = SrcClockDomain()
         self.system.clk_domain.clock = clk_frequency
         self.system.clk_domain.voltage_domain = VoltageDomain()
-        self.system.mem_mode = "timing"
+        # when fast-forwarding, the simulation starts on atomic cores and
+        # m5.switchCpus changes the memory mode to timing at the switch
+        self.system.mem_mode = "atomic" if fast_forward else "timing"
         # simulation exits when "work_begin" or "work_end" m5ops are executed
         self.system.exit_on_work_items = True
         # set cache line size to 32 bytes as in STM32G4
@@ -41,7 +55,14 @@ class STM32G4SEBoard:
 
         # ==== setup the CPU ====
         # single core Cortex-M4 with FPU
-        processor = CortexM4Processor(num_cores=1, if_fpu=True)
+        if fast_forward:
+            processor = CortexM4SwitchableProcessor(
+                num_cores=1, if_fpu=True, fu_latencies=fu_latencies
+            )
+        else:
+            processor = CortexM4Processor(
+                num_cores=1, if_fpu=True, fu_latencies=fu_latencies
+            )
         self.system.processor = processor
         # ==== end of CPU setup ====
 
@@ -82,7 +103,7 @@ class STM32G4SEBoard:
         self.system.flash_memory = SimpleMemory()
         self.system.flash_memory.range = self.flash_memory
         self.system.flash_memory.port = self.system.membus.mem_side_ports
-        self.system.flash_memory.latency = "40ns"
+        self.system.flash_memory.latency = flash_latency
         self.system.flash_memory.bandwidth = "190MiB/s"
 
         # create SRAM 1 memory and connect it to the membus
@@ -100,8 +121,16 @@ class STM32G4SEBoard:
         self.system.sram2.bandwidth = "400MiB/s"
 
         # ART I-Cache+prefetcher and D-Cache
-        self.system.icache = ARTICache(flash_addr_range=self.flash_memory)
-        self.system.dcache = ARTDCache(flash_addr_range=self.flash_memory)
+        self.system.icache = ARTICache(
+            flash_addr_range=self.flash_memory,
+            size=icache_size,
+            assoc=icache_assoc
+        )
+        self.system.dcache = ARTDCache(
+            flash_addr_range=self.flash_memory,
+            size=dcache_size,
+            assoc=dcache_assoc
+        )
 
         # this part bypasses the cache hierarchy and connects the cores directly to the
         # membus
@@ -119,6 +148,11 @@ class STM32G4SEBoard:
                 self.system.membus.cpu_side_ports, self.system.membus.cpu_side_ports
             )
             core.connect_interrupt()
+        # the switched out detailed cores take over the port connections above
+        # when switched in, but they need their own interrupt controllers
+        if fast_forward:
+            for core in self.system.processor.get_detailed_cores():
+                core.connect_interrupt()
 
         # set the self.system port for functional access from the simulator
         self.system.system_port = self.system.membus.cpu_side_ports
@@ -134,6 +168,9 @@ class STM32G4SEBoard:
         self.system.workload = SEWorkload.init_compatible(binary_path.as_posix())
         # set the process for the core
         self.system.processor.get_cores()[0].core.workload = [self.process]
+        if self._fast_forward:
+            self.system.processor.get_detailed_cores()[0].core.workload = \
+                [self.process]
 
     def setup_process_mappings(self):
         self.process.map(self.sram1.start, self.sram1.start, self.sram1.size())
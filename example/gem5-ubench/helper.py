@@ -1,20 +1,92 @@
-from multiprocessing import Pool
+from multiprocessing import Pool, TimeoutError
 from pathlib import Path
 import subprocess
 import argparse
 import os
+import shutil
+import sys
+import threading
+import time
+
+sys.path.append(Path(__file__).parent.parent.parent.as_posix())
+
+from utils.progress import read_last_record
+from utils.result_cache import ResultCache, hash_file, repo_modules, run_key
+from utils.run_history import (
+    HISTORY_FILE, RunHistory, longest_first, makespan_lower_bound, parse_bytes
+)
+from utils.stats_store import ResultsStore
+from utils.work_queue import DEFAULT_LEASE_SECONDS, WorkQueue
+
+def add_run_options(parser):
+    # options that change what a run simulates or writes out; the sweep
+    # shares them
+    parser.add_argument(
+        "--fast-forward", action="store_true",
+        help="Fast-forward to the first ROI on an atomic CPU (see run-binary.py)"
+    )
+    parser.add_argument(
+        "--sample", action="store_true",
+        help="Estimate ROI runtimes with sampled simulation (see run-binary.py)"
+    )
+    parser.add_argument(
+        "--roi-target-error", type=float, default=None,
+        help="Stop each run once its mean ROI runtime is known to this relative "
+        "error (see run-binary.py)"
+    )
+    parser.add_argument(
+        "--max-rois", type=int, default=None,
+        help="Stop each run after this many ROIs (see run-binary.py)"
+    )
+    parser.add_argument(
+        "--stats-groups", type=str, nargs="+", default=None,
+        help="Only dump the stats of these SimObjects at each ROI (see "
+        "run-binary.py)"
+    )
+    parser.add_argument(
+        "--stats-format", type=str, default="text", choices=["text", "hdf5"],
+        help="Per-ROI stats output of the runs (see run-binary.py); hdf5 needs "
+        "h5py to ingest"
+    )
+
+def run_script_args(options):
+    # arguments passed to the gem5 script in addition to the binary
+    script_args = ["--mode", "se"]
+    if options.fast_forward:
+        script_args += ["--fast-forward"]
+    if options.sample:
+        script_args += ["--sample"]
+    if options.roi_target_error is not None:
+        script_args += ["--roi-target-error", str(options.roi_target_error)]
+    if options.max_rois is not None:
+        script_args += ["--max-rois", str(options.max_rois)]
+    if options.stats_groups:
+        script_args += ["--stats-groups"] + options.stats_groups
+    if options.stats_format != "text":
+        script_args += ["--stats-format", options.stats_format]
+    return script_args
+
+def gem5_options(options):
+    # gem5 options, given before the script; the HDF5 stats output has to be
+    # chosen when gem5 starts
+    if options.stats_format == "hdf5":
+        return ["--stats-file", "h5://stats.h5"]
+    return []
+
+def stats_file_name(options):
+    return "stats.h5" if options.stats_format == "hdf5" else "stats.txt"
 
 parser = argparse.ArgumentParser(
     description="Run all microbenchmarks in gem5 with entobench"
 )
 parser.add_argument(
-    "--gem5-path", type=str, required=True, help="Path to the gem5 executable"
+    "--gem5-path", type=str, default=None, help="Path to the gem5 executable"
 )
 parser.add_argument(
-    "--gem5-script", type=str, required=True, help="Path to the gem5 script"
+    "--gem5-script", type=str, default=None, help="Path to the gem5 script"
 )
 parser.add_argument(
-    "--entobench-build-dir", type=str, required=True, help="Path to the entobench build directory"
+    "--entobench-build-dir", type=str, default=None, help="Path to the entobench build directory"
 )
 parser.add_argument(
     "--processes", type=int, default=1, help="Number of parallel processes to use"
@@ -22,52 +94,429 @@ parser.add_argument(
 parser.add_argument(
     "--output-dir", type=str, default="./", help="Directory to store output logs"
 )
+parser.add_argument(
+    "--results-store", type=str, default=None,
+    help="Directory of the columnar per-ROI results store (default: "
+        "<output-dir>/results)"
+)
+parser.add_argument(
+    "--stats", type=str, nargs="+", default=None,
+    help="Stat names (fnmatch patterns allowed) to keep in the results store"
+)
+parser.add_argument(
+    "--cache-dir", type=str, default=None,
+    help="Directory of the content-addressed run cache (default: "
+        "<output-dir>/cache)"
+)
+parser.add_argument(
+    "--no-cache", action="store_true",
+    help="Simulate every benchmark even if an identical run is cached"
+)
+add_run_options(parser)
+parser.add_argument(
+    "--history-file", type=str, default=None,
+    help="JSON file with the wall time and peak RSS of earlier runs, used to "
+        "start the longest benchmarks first (default: "
+        "<output-dir>/run-history.json)"
+)
+parser.add_argument(
+    "--memory-budget", type=str, default=None,
+    help="Start a simulation only while the projected RSS of all running "
+        "simulations stays within this size (e.g. 48GiB); --processes stays "
+        "the upper limit (local pool only)"
+)
+parser.add_argument(
+    "--default-memory", type=str, default=None,
+    help="Expected peak RSS of a benchmark without a recorded one (default: "
+        "the largest recorded peak)"
+)
+parser.add_argument(
+    "--queue-dir", type=str, default=None,
+    help="Queue the runs in this directory (on a filesystem shared by all "
+        "hosts) instead of running them in a local pool only; workers "
+        "started with --worker take runs from it"
+)
+parser.add_argument(
+    "--worker", action="store_true",
+    help="Only run queued runs from --queue-dir with --processes parallel "
+        "simulations, until the queue is empty"
+)
+parser.add_argument(
+    "--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+    help="Seconds without a heartbeat after which a queued run held by a "
+        "dead worker is run again"
+)
+parser.add_argument(
+    "--live-interval", type=float, default=30,
+    help="Seconds between live progress views of the running simulations "
+        "(0 disables them)"
+)
+
+# parsed when run as a script; sweep.py imports the run functions
+args = None
+
+# a run whose progress file has not been updated for this long is flagged
+STALL_SECONDS = 120
+# seconds between two looks at a queue whose remaining runs are all leased
+QUEUE_POLL_SECONDS = 10
+# seconds between two samples of the running simulations' RSS
+ADMISSION_POLL_SECONDS = 2
 
-args = parser.parse_args()
+def ingest_results(run_ball):
+    # ingest the stats of this run as soon as it finishes
+    # a sweep tags the rows with the parameters of its point and stores
+    # every point of a benchmark in a shard of its own
+    store = ResultsStore(Path(run_ball['results_store']))
+    num_rois = store.ingest(
+        run_ball['benchmark'], Path(run_ball['stats_file']), run_ball['stats'],
+        params=run_ball.get('params'), shard=run_ball.get('shard')
+    )
+    print(f"Stored {num_rois} ROI(s) of "
+          f"{run_ball.get('shard', run_ball['benchmark'])}")
+
+def print_live_view(run_balls):
+    # aggregate the progress.jsonl stream of every running simulation
+    now = time.time()
+    lines = []
+    num_done = 0
+    total_kips = 0.0
+    total_rss = 0
+    for run_ball in run_balls:
+        record = read_last_record(Path(run_ball['progress_file']))
+        if record is None:
+            continue
+        if record.get("done"):
+            num_done += 1
+            continue
+        age = now - record["time"]
+        total_kips += record["kips"]
+        total_rss += record["rss_bytes"]
+        lines.append(
+            f"  {run_ball['benchmark']:<40} {record['tick'] / 1e9:>10.3f} ms "
+            f"{record['insts'] / 1e6:>9.2f} Minsts {record['kips']:>8.1f} KIPS "
+            f"{record['rss_bytes'] / 2**20:>7.1f} MiB "
+            f"{record['host_seconds']:>8.0f} s"
+            + (f"  no progress for {age:.0f} s" if age > STALL_SECONDS else "")
+        )
+    print(f"[{time.strftime('%H:%M:%S')}] {len(lines)} running, {num_done} "
+          f"done, {len(run_balls) - len(lines) - num_done} waiting; "
+          f"{total_kips:.1f} KIPS, {total_rss / 2**20:.1f} MiB in total")
+    for line in lines:
+        print(line)
 
 def run_this(run_ball):
     run_dir = Path(run_ball['run_dir'])
     run_command = run_ball['run_command']
+    outcome = {
+        "benchmark": run_ball['benchmark'],
+        "returncode": 0,
+        "simulated": False,
+        "wall_seconds": 0.0,
+        "peak_rss_bytes": 0,
+    }
+    cache = None
+    if run_ball['cache_dir'] is not None:
+        cache = ResultCache(Path(run_ball['cache_dir']))
+        if cache.restore(run_ball['cache_key'], run_dir):
+            print(f"Reused cached results for {run_ball['benchmark']}")
+            ingest_results(run_ball)
+            return outcome
+    # drop leftovers of an interrupted run or of a previously restored
+    # (hard-linked) entry before gem5 overwrites the files
+    if run_dir.exists():
+        shutil.rmtree(run_dir)
     print(f"Running in {run_dir.as_posix()} with command: {' '.join(run_command)}")
     run_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
     with open(run_dir / "stdout.log", "w") as stdout_f, open(run_dir / "stderr.log", "w") as stderr_f:
-        result = subprocess.run(
+        proc = subprocess.Popen(
             run_command,
             cwd=run_dir,
             stdout=stdout_f,
             stderr=stderr_f
         )
-    if result.returncode != 0:
-        print(f"Run in {run_dir} failed with return code {result.returncode}")
+        # wait4 gives the peak RSS of this gem5 alone, unlike RUSAGE_CHILDREN
+        # which covers every run this pool worker has started
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    outcome.update({
+        "returncode": proc.returncode,
+        "simulated": True,
+        "wall_seconds": time.perf_counter() - start,
+        "peak_rss_bytes": rusage.ru_maxrss * 1024,
+    })
+    if proc.returncode == 0 and not Path(run_ball['stats_file']).is_file():
+        # e.g. a gem5 built without HDF5 for --stats-format hdf5
+        print(f"Run in {run_dir} wrote no "
+              f"{Path(run_ball['stats_file']).name}")
+        outcome["returncode"] = None
+    elif proc.returncode != 0:
+        print(f"Run in {run_dir} failed with return code {proc.returncode}")
     else:
-        print(f"Run in {run_dir} completed successfully")
-    return result.returncode
+        print(f"Run in {run_dir} completed successfully in "
+              f"{outcome['wall_seconds']:.1f} s")
+        if cache is not None:
+            cache.store(run_ball['cache_key'], run_dir)
+        ingest_results(run_ball)
+    return outcome
+
+def renew_lease(queue, lease, stop):
+    while not stop.wait(queue.lease_seconds / 4):
+        if not queue.renew(lease):
+            print(f"Lost the lease of {lease.job['benchmark']} to another "
+                  "worker")
+            return
+
+def work_loop(_):
+    # one simulation at a time from the queue, until no run is left
+    queue = WorkQueue(Path(args.queue_dir), args.lease_seconds)
+    while True:
+        lease = queue.claim()
+        if lease is None:
+            if not queue.pending():
+                return
+            # every remaining run is leased; one of the leases may expire
+            time.sleep(QUEUE_POLL_SECONDS)
+            continue
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=renew_lease, args=(queue, lease, stop), daemon=True
+        )
+        heartbeat.start()
+        try:
+            outcome = run_this(lease.job)
+        except Exception as e:
+            outcome = {"benchmark": lease.job['benchmark'], "returncode": None,
+                       "simulated": False, "error": repr(e)}
+            print(f"Run of {lease.job['benchmark']} raised {e!r}")
+        finally:
+            stop.set()
+            heartbeat.join()
+        if not queue.complete(lease, outcome):
+            print(f"{lease.job['benchmark']} was already recorded by another "
+                  "worker")
+
+def run_local(run_balls):
+    outcomes = []
+    with Pool(processes=args.processes) as pool:
+        # chunksize 1 hands out the jobs one by one in the order above
+        completions = pool.imap_unordered(run_this, run_balls, chunksize=1)
+        while len(outcomes) < len(run_balls):
+            try:
+                outcome = completions.next(
+                    args.live_interval if args.live_interval > 0 else None
+                )
+            except TimeoutError:
+                print_live_view(run_balls)
+                continue
+            outcomes.append(outcome)
+            yield outcome
+
+def projected_rss(running, history, default_peak):
+    # a running simulation is expected to grow to its recorded peak
+    total = 0
+    for run_ball, _ in running.values():
+        record = read_last_record(Path(run_ball['progress_file']))
+        rss = record["rss_bytes"] if record is not None else 0
+        total += max(rss, history.expected_peak_rss_bytes(
+            run_ball['benchmark'], default_peak
+        ))
+    return total
+
+def run_admitted(run_balls, history):
+    # like run_local, but a run only starts once its expected peak RSS fits
+    # in the budget next to the projected RSS of the running ones
+    budget = parse_bytes(args.memory_budget)
+    default_peak = parse_bytes(args.default_memory) \
+        if args.default_memory else None
+    waiting = list(run_balls)
+    running = {}
+    finished = threading.Event()
+    last_view = time.perf_counter()
+    held_back = None
+    with Pool(processes=args.processes) as pool:
+        while waiting or running:
+            while waiting and len(running) < args.processes:
+                run_ball = waiting[0]
+                peak = history.expected_peak_rss_bytes(
+                    run_ball['benchmark'], default_peak
+                )
+                projected = projected_rss(running, history, default_peak)
+                # a run larger than the whole budget still runs, on its own
+                if running and projected + peak > budget:
+                    if held_back != run_ball['benchmark']:
+                        print(f"Holding back {run_ball['benchmark']} "
+                              f"({peak / 2**20:.0f} MiB): "
+                              f"{projected / 2**20:.0f} MiB of "
+                              f"{budget / 2**20:.0f} MiB projected")
+                        held_back = run_ball['benchmark']
+                    break
+                waiting.pop(0)
+                running[run_ball['benchmark']] = (run_ball, pool.apply_async(
+                    run_this, (run_ball,), callback=lambda _: finished.set()
+                ))
+            finished.wait(ADMISSION_POLL_SECONDS)
+            finished.clear()
+            for benchmark, (_, result) in list(running.items()):
+                if result.ready():
+                    del running[benchmark]
+                    yield result.get()
+            if args.live_interval > 0 and \
+                    time.perf_counter() - last_view >= args.live_interval:
+                print_live_view(run_balls)
+                last_view = time.perf_counter()
+
+def run_queued(run_balls):
+    queue = WorkQueue(Path(args.queue_dir), args.lease_seconds)
+    job_ids = {}
+    # jobs that already succeeded in an earlier sweep with the same inputs
+    earlier = set()
+    for order, run_ball in enumerate(run_balls):
+        job_id = run_ball['job_id']
+        job_ids[job_id] = run_ball
+        if not queue.put(job_id, run_ball, order):
+            earlier.add(job_id)
+    print(f"Queued {len(run_balls)} run(s) in {args.queue_dir}")
+
+    pool = Pool(processes=args.processes) if args.processes > 0 else None
+    if pool is not None:
+        pool.map_async(work_loop, range(args.processes))
+    # outcomes of every queued run, whichever worker recorded them
+    remaining = set(job_ids)
+    poll = min(QUEUE_POLL_SECONDS, args.live_interval) \
+        if args.live_interval > 0 else QUEUE_POLL_SECONDS
+    last_view = time.perf_counter()
+    while remaining:
+        for job_id in sorted(remaining):
+            outcome = queue.outcome(job_id)
+            if outcome is not None:
+                remaining.discard(job_id)
+                if job_id in earlier:
+                    # simulated before, so not part of this sweep's history
+                    # and makespan
+                    outcome = dict(outcome, simulated=False)
+                yield outcome
+        if not remaining:
+            break
+        time.sleep(poll)
+        if args.live_interval > 0 and \
+                time.perf_counter() - last_view >= args.live_interval:
+            print_live_view(list(job_ids.values()))
+            last_view = time.perf_counter()
+    if pool is not None:
+        # the local workers are idle or waiting on other sweeps' leases
+        pool.terminate()
+        pool.join()
 
 def main():
-    gem5_base = Path(args.gem5_path)
-    gem5_script = Path(args.gem5_script)
-    output_dir = Path(args.output_dir)
+    if args.worker:
+        if args.queue_dir is None:
+            parser.error("--worker needs --queue-dir")
+        with Pool(processes=args.processes) as pool:
+            pool.map(work_loop, range(args.processes))
+        return
+    if args.memory_budget and args.queue_dir:
+        parser.error("--memory-budget applies to the local pool only, not "
+                     "to --queue-dir")
+    if args.gem5_path is None or args.gem5_script is None or \
+            args.entobench_build_dir is None:
+        parser.error("--gem5-path, --gem5-script and --entobench-build-dir "
+                     "are required unless --worker is given")
+
+    # absolute paths: queued runs may be taken by workers started from
+    # another directory or on another host
+    gem5_base = Path(args.gem5_path).resolve()
+    gem5_script = Path(args.gem5_script).resolve()
+    output_dir = Path(args.output_dir).resolve()
     output_dir.mkdir(parents=True, exist_ok=True)
+    results_store = Path(args.results_store).resolve() if args.results_store \
+        else output_dir / "results"
+    history = RunHistory(Path(args.history_file) if args.history_file
+                         else output_dir / HISTORY_FILE)
+    cache_dir = None
+    if not args.no_cache:
+        cache_dir = Path(args.cache_dir).resolve() if args.cache_dir \
+            else output_dir / "cache"
 
-    entobench_build_dir = Path(args.entobench_build_dir)
+    entobench_build_dir = Path(args.entobench_build_dir).resolve()
     if not entobench_build_dir.is_dir():
         raise FileNotFoundError(f"Entobench build directory '{entobench_build_dir.as_posix()}' does not exist or is not a directory.")
     ubench_dir = entobench_build_dir / "benchmark/ubench/execution/bin"
     if not ubench_dir.is_dir():
         raise FileNotFoundError(f"Entobench ubench binary directory '{ubench_dir.as_posix()}' does not exist or is not a directory.")
     
+    script_args = run_script_args(args)
+    stats_name = stats_file_name(args)
+    if cache_dir is not None or args.queue_dir:
+        # hash the inputs shared by every run only once
+        shared_digests = [hash_file(gem5_base), hash_file(gem5_script)] + \
+            [hash_file(module) for module in repo_modules(gem5_script)]
+
     run_balls = []
 
     for bench in ubench_dir.iterdir():
         if not bench.is_file() or not os.access(bench.as_posix(), os.X_OK):
             raise FileNotFoundError(f"Benchmark binary '{bench.as_posix()}' does not exist or is not executable.")
+        run_command = [gem5_base.as_posix(),"-re", "-d", Path(f"{bench.name}-m5out").as_posix()] + gem5_options(args) + [gem5_script.as_posix(), "--binary", bench.as_posix()] + script_args
+        if cache_dir is not None or args.queue_dir:
+            input_digests = [hash_file(bench)] + shared_digests
         run_balls.append({
+            "benchmark": bench.name,
             "run_dir": Path(output_dir/bench.name).as_posix(),
-            "run_command": [gem5_base.as_posix(),"-re", "-d", Path(f"{bench.name}-m5out").as_posix(), gem5_script.as_posix(), "--binary", bench.as_posix(), "--mode", "se"]
+            "stats_file": Path(output_dir/bench.name/f"{bench.name}-m5out"/stats_name).as_posix(),
+            "progress_file": Path(output_dir/bench.name/f"{bench.name}-m5out"/"progress.jsonl").as_posix(),
+            "results_store": results_store.as_posix(),
+            "stats": args.stats,
+            "cache_dir": cache_dir.as_posix() if cache_dir is not None else None,
+            "cache_key": run_key(input_digests, script_args) if cache_dir is not None else None,
+            # a rebuilt ELF, gem5 or board model makes a new job, so that a
+            # success recorded in the queue before the rebuild is not reused
+            "job_id": run_key(input_digests, run_command)[:16] if args.queue_dir else None,
+            "run_command": run_command
         })
     
-    with Pool(processes=args.processes) as pool:
-        results = pool.map(run_this, run_balls)
+    # longest jobs first, so that the last ones to start are short
+    order = longest_first([run_ball['benchmark'] for run_ball in run_balls],
+                          history)
+    run_balls.sort(key=lambda run_ball: order.index(run_ball['benchmark']))
+
+    outcomes = []
+    sweep_start = time.perf_counter()
+    if args.queue_dir:
+        completions = run_queued(run_balls)
+    elif args.memory_budget:
+        completions = run_admitted(run_balls, history)
+    else:
+        completions = run_local(run_balls)
+    for outcome in completions:
+        outcomes.append(outcome)
+        if not outcome.get('simulated'):
+            continue
+        if outcome['returncode'] == 0:
+            history.record(outcome['benchmark'], outcome['wall_seconds'],
+                           outcome['peak_rss_bytes'])
+        else:
+            # e.g. OOM-killed: the next sweep should reserve at least as much
+            history.record_peak(outcome['benchmark'],
+                                outcome['peak_rss_bytes'])
+        history.save()
+    makespan = time.perf_counter() - sweep_start
+
+    durations = [outcome['wall_seconds'] for outcome in outcomes
+                 if outcome.get('simulated')]
+    # with a queue, every worker process that ran something counts
+    processes = len({outcome['worker'] for outcome in outcomes
+                     if outcome.get('simulated')}) if args.queue_dir \
+        else args.processes
+    lower_bound = makespan_lower_bound(durations, processes)
+    if lower_bound > 0:
+        print(f"Simulated {len(durations)} benchmark(s) in {makespan:.1f} s; "
+              f"lower bound {lower_bound:.1f} s on {processes} "
+              f"process(es) ({makespan / lower_bound:.2f}x)")
+    num_failed = sum(1 for outcome in outcomes if outcome['returncode'] != 0)
+    if num_failed > 0:
+        print(f"{num_failed} run(s) failed")
 
 if __name__ == "__main__":
+    args = parser.parse_args()
     main()
@@ -0,0 +1,174 @@
+from itertools import product
+from multiprocessing import Pool
+from pathlib import Path
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(Path(__file__).parent.parent.parent.as_posix())
+
+from utils.result_cache import run_key
+from utils.stats_store import ResultsStore
+
+import helper
+
+parser = argparse.ArgumentParser(
+    description="Sweep STM32G4 board parameters over the entobench "
+        "microbenchmarks in gem5"
+)
+parser.add_argument(
+    "--gem5-path", type=str, required=True, help="Path to the gem5 executable"
+)
+parser.add_argument(
+    "--gem5-script", type=str, required=True,
+    help="Path to the gem5 script (gem5-script/run-binary.py)"
+)
+parser.add_argument(
+    "--entobench-build-dir", type=str, required=True, help="Path to the entobench build directory"
+)
+parser.add_argument(
+    "--grid", type=str, required=True,
+    help="JSON file mapping every swept parameter to its list of values"
+)
+parser.add_argument(
+    "--benchmarks", type=str, nargs="+", default=None,
+    help="Names of the benchmarks to sweep (default: all of them)"
+)
+parser.add_argument(
+    "--processes", type=int, default=1, help="Number of parallel processes to use"
+)
+parser.add_argument(
+    "--output-dir", type=str, default="./", help="Directory to store output logs"
+)
+parser.add_argument(
+    "--results-store", type=str, default=None,
+    help="Directory of the results table (default: <output-dir>/results)"
+)
+parser.add_argument(
+    "--stats", type=str, nargs="+", default=None,
+    help="Stat names (fnmatch patterns allowed) to keep in the results store"
+)
+helper.add_run_options(parser)
+
+args = parser.parse_args()
+
+# grid parameter -> run-binary.py option; "fu_latency.<OpClass>" parameters
+# are passed as --fu-latency <OpClass>=<value>
+PARAMETER_OPTIONS = {
+    "clock": "--clock",
+    "flash_latency": "--flash-latency",
+    "icache_size": "--icache-size",
+    "icache_assoc": "--icache-assoc",
+    "dcache_size": "--dcache-size",
+    "dcache_assoc": "--dcache-assoc",
+}
+FU_LATENCY_PREFIX = "fu_latency."
+# prefix of the parameter columns in the results table
+PARAM_COLUMN_PREFIX = "param."
+
+def load_grid(grid_file):
+    with open(grid_file) as f:
+        grid = json.load(f)
+    for name, values in grid.items():
+        if name not in PARAMETER_OPTIONS and \
+                not name.startswith(FU_LATENCY_PREFIX):
+            raise ValueError(f"Unknown sweep parameter '{name}' in "
+                             f"'{grid_file}'.")
+        if not isinstance(values, list) or len(values) == 0:
+            raise ValueError(f"Sweep parameter '{name}' needs a non-empty "
+                             "list of values.")
+    return grid
+
+def iter_points(grid):
+    names = sorted(grid)
+    for values in product(*(grid[name] for name in names)):
+        yield dict(zip(names, values))
+
+def point_args(point):
+    script_args = []
+    fu_latencies = []
+    for name, value in point.items():
+        if name.startswith(FU_LATENCY_PREFIX):
+            fu_latencies.append(f"{name[len(FU_LATENCY_PREFIX):]}={value}")
+        else:
+            script_args += [PARAMETER_OPTIONS[name], str(value)]
+    if fu_latencies:
+        script_args += ["--fu-latency"] + fu_latencies
+    return script_args
+
+def point_id(point, run_args):
+    # stable name of a point, independent of the order of the grid file; the
+    # run options are part of it so that runs with different options never
+    # share a result shard
+    return run_key(
+        [], [f"{name}={point[name]}" for name in sorted(point)] + run_args
+    )[:12]
+
+def main():
+    # every run has its own working directory
+    gem5_base = Path(args.gem5_path).resolve()
+    gem5_script = Path(args.gem5_script).resolve()
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    results_store = Path(args.results_store) if args.results_store \
+        else output_dir / "results"
+    store = ResultsStore(results_store)
+
+    ubench_dir = Path(args.entobench_build_dir).resolve() / "benchmark/ubench/execution/bin"
+    if not ubench_dir.is_dir():
+        raise FileNotFoundError(f"Entobench ubench binary directory '{ubench_dir.as_posix()}' does not exist or is not a directory.")
+    if args.benchmarks:
+        benches = [ubench_dir / name for name in args.benchmarks]
+    else:
+        benches = sorted(ubench_dir.iterdir())
+    for bench in benches:
+        if not bench.is_file() or not os.access(bench.as_posix(), os.X_OK):
+            raise FileNotFoundError(f"Benchmark binary '{bench.as_posix()}' does not exist or is not executable.")
+
+    # the options shared with helper.py, without the leading "--mode se"
+    run_args = helper.run_script_args(args)[2:]
+    stats_name = helper.stats_file_name(args)
+    grid = load_grid(args.grid)
+    points = {point_id(point, run_args): point for point in iter_points(grid)}
+    # keep the parameters of every point next to the results
+    with open(output_dir / "points.json", "w") as f:
+        json.dump(points, f, indent=2)
+
+    run_balls = []
+    num_done = 0
+    for pid, point in points.items():
+        params = {PARAM_COLUMN_PREFIX + name: value
+                  for name, value in point.items()}
+        script_args = ["--mode", "se"] + point_args(point) + run_args
+        for bench in benches:
+            shard = f"{bench.name}-{pid}"
+            if store.has_shard(shard):
+                num_done += 1
+                continue
+            run_dir = output_dir / "points" / pid / bench.name
+            run_balls.append({
+                "benchmark": bench.name,
+                "shard": shard,
+                "params": params,
+                "run_dir": run_dir.as_posix(),
+                "stats_file": (run_dir / "m5out" / stats_name).as_posix(),
+                "results_store": results_store.as_posix(),
+                "stats": args.stats,
+                # the store's shards make a rerun resume, so the sweep does
+                # not use the run cache
+                "cache_dir": None,
+                "cache_key": None,
+                "run_command": [gem5_base.as_posix(), "-re", "-d", "m5out"] + helper.gem5_options(args) + [gem5_script.as_posix(), "--binary", bench.as_posix()] + script_args
+            })
+    print(f"{len(points)} point(s) x {len(benches)} benchmark(s): "
+          f"{num_done} already done, {len(run_balls)} to run")
+
+    with Pool(processes=args.processes) as pool:
+        outcomes = pool.map(helper.run_this, run_balls)
+    num_failed = sum(1 for outcome in outcomes if outcome['returncode'] != 0)
+    if num_failed > 0:
+        print(f"{num_failed} run(s) failed; rerun the sweep to retry them")
+
+if __name__ == "__main__":
+    main()
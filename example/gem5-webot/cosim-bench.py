@@ -0,0 +1,273 @@
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import bridge._bridge as br
+
+sys.path.append(Path(__file__).parent.parent.parent.as_posix())
+
+from utils.firmware import build_firmware
+from utils.timeline import percentile
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the gem5 side of the co-simulation without "
+        "Webots: every gem5-webots-script.py instance is driven by a "
+        "headless-controller.py stand-in for a fixed number of steps"
+)
+parser.add_argument(
+    "--gem5-path", type=str, required=True, help="Path to the gem5 executable"
+)
+parser.add_argument(
+    "--gem5-script", type=str, required=True, help="Path to the gem5 script"
+)
+parser.add_argument(
+    "--gem5-binary", type=str, required=True, help="Path to the binary to run in gem5"
+)
+parser.add_argument(
+    "--gem5-checkpoint", type=str, default=None,
+    help="Post-boot checkpoint to restore every gem5 instance from"
+)
+parser.add_argument(
+    "--output-dir", type=str, default="./", help="Directory to store output logs"
+)
+parser.add_argument(
+    "--steps", type=int, default=2000, help="Control steps per robot and case"
+)
+parser.add_argument(
+    "--cases", type=str, nargs="+", default=["1x1", "1x8", "4x1", "4x8"],
+    help="Benchmark cases as <robots>x<lookahead>"
+)
+parser.add_argument(
+    "--actuation-delays", type=int, nargs="+", choices=[0, 1], default=[1, 0],
+    help="Run every case with these actuation delays (1: pipelined, 0: "
+        "lockstep); lookahead cases only run pipelined"
+)
+parser.add_argument(
+    "--payload-sizes", type=int, nargs="+", default=[4],
+    help="Run every step-by-step case with these input sizes in bytes per "
+        "step (the bumper word plus a synthetic sensor frame)"
+)
+parser.add_argument(
+    "--transports", type=str, nargs="+", choices=["socket", "shared"],
+    default=["socket"],
+    help="Hand the inputs to gem5 through the bridge socket, through a "
+        "shared frame file (--shared-input), or both"
+)
+parser.add_argument(
+    "--recorded-log", type=str, default=None,
+    help="Replay this players.cpp trajectory log instead of the scripted "
+        "bumper input"
+)
+parser.add_argument(
+    "--startup-timeout", type=float, default=600,
+    help="Seconds to wait for every gem5 instance to become ready"
+)
+
+args = parser.parse_args()
+
+def broker(client_to_server, listening):
+    # the bridge helper server of one case; it does not return on its own,
+    # so it runs in its own process that is terminated with the case
+    listen_fd = br.bridge_setup_helper_server_socket()
+    listening.set()
+    try:
+        br.bridge_helper_server_loop(listen_fd, client_to_server)
+    finally:
+        br.bridge_close_helper_server_socket(listen_fd)
+
+def start_executable(path, exe_args, friendly_name, **kwargs):
+    p = Path(path)
+    if not p.exists():
+        raise FileNotFoundError(f"{friendly_name} not found at {path}")
+    return subprocess.Popen([str(path)] + exe_args, **kwargs)
+
+def stop(procs):
+    for proc in procs:
+        if proc.poll() is None:
+            proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+# default BridgeIODevice input buffer, enlarged for bigger payloads
+DEFAULT_INPUT_BUFFER_SIZE = 256
+# shared frame files go to shared memory where there is a tmpfs for it
+SHM_DIR = Path("/dev/shm")
+
+def run_case(num_robots, lookahead, actuation_delay, payload_size, transport,
+             case_dir):
+    case_dir.mkdir(parents=True, exist_ok=True)
+    client_to_server = {f"R{i}": f"gem5-{i}" for i in range(num_robots)}
+    listening = multiprocessing.Event()
+    broker_proc = multiprocessing.Process(
+        target=broker, args=(client_to_server, listening), daemon=True
+    )
+    broker_proc.start()
+    if not listening.wait(timeout=30):
+        raise RuntimeError("The bridge helper server did not start")
+
+    gem5_args = [args.gem5_script, "--binary", args.gem5_binary,
+                 "--input-buffer-size",
+                 str(max(payload_size, DEFAULT_INPUT_BUFFER_SIZE))]
+    frame_dir = SHM_DIR if SHM_DIR.is_dir() else case_dir
+    frame_files = {
+        server: frame_dir / f"cosim-bench-{os.getpid()}-{server}.frames"
+        for server in client_to_server.values()
+    } if transport == "shared" else {}
+    if args.gem5_checkpoint:
+        gem5_args += ["--restore-checkpoint", args.gem5_checkpoint]
+    gem5_procs = []
+    controller_procs = []
+    try:
+        ready_files = []
+        for server in client_to_server.values():
+            ready_file = case_dir / f"{server}.ready"
+            ready_file.unlink(missing_ok=True)
+            ready_files.append(ready_file)
+            gem5_procs.append(start_executable(
+                args.gem5_path,
+                ["-re", "-d", (case_dir / f"{server}-m5out").as_posix()]
+                    + gem5_args
+                    + ["--server-name", server, "--ready-file",
+                       ready_file.as_posix(), "--progress-interval", "0"]
+                    + (["--shared-input", frame_files[server].as_posix()]
+                       if server in frame_files else []),
+                server
+            ))
+        deadline = time.perf_counter() + args.startup_timeout
+        while not all(ready_file.exists() for ready_file in ready_files):
+            for server, proc in zip(client_to_server.values(), gem5_procs):
+                if proc.poll() is not None:
+                    raise RuntimeError(f"{server} exited with return code "
+                                       f"{proc.returncode} before it was ready")
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"gem5 not ready after "
+                                   f"{args.startup_timeout} s")
+            time.sleep(0.05)
+
+        controller = Path(__file__).parent / "headless-controller.py"
+        result_files = []
+        for robot in client_to_server:
+            result_file = case_dir / f"{robot}.json"
+            result_file.unlink(missing_ok=True)
+            result_files.append(result_file)
+            controller_args = [
+                controller.as_posix(), "--name", robot,
+                "--steps", str(args.steps),
+                "--lookahead", str(lookahead),
+                "--actuation-delay", str(actuation_delay),
+                "--payload-size", str(payload_size),
+                "--result-file", result_file.as_posix(),
+            ]
+            server = client_to_server[robot]
+            if server in frame_files:
+                controller_args += ["--shared-input",
+                                    frame_files[server].as_posix()]
+            if args.recorded_log:
+                controller_args += ["--recorded-log", args.recorded_log]
+            controller_procs.append(start_executable(
+                sys.executable, controller_args, robot
+            ))
+        for robot, proc in zip(client_to_server, controller_procs):
+            if proc.wait() != 0:
+                raise RuntimeError(f"Controller {robot} failed with return "
+                                   f"code {proc.returncode}")
+    finally:
+        stop(controller_procs + gem5_procs)
+        broker_proc.terminate()
+        broker_proc.join()
+        for frame_file in frame_files.values():
+            frame_file.unlink(missing_ok=True)
+
+    results = []
+    for result_file in result_files:
+        with open(result_file) as f:
+            results.append(json.load(f))
+    latencies = sorted(latency for result in results
+                       for latency in result["latencies_ns"])
+    return {
+        "robots": num_robots,
+        "lookahead": lookahead,
+        "actuation_delay": actuation_delay,
+        "payload_bytes": payload_size,
+        "transport": transport,
+        "steps": args.steps,
+        "steps_per_second": sum(result["steps_per_second"]
+                                for result in results),
+        "steps_per_second_per_robot": sum(result["steps_per_second"]
+                                          for result in results) / num_robots,
+        "input_bytes_per_second": sum(result["input_bytes_per_second"]
+                                      for result in results),
+        "exchanges": sum(result["exchanges"] for result in results),
+        "mispredictions": sum(result["mispredictions"] for result in results),
+        "p50_ns": percentile(latencies, 0.5),
+        "p90_ns": percentile(latencies, 0.9),
+        "p99_ns": percentile(latencies, 0.99),
+        "max_ns": latencies[-1],
+    }
+
+def main():
+    if min(args.payload_sizes) < 4:
+        parser.error("--payload-sizes must be at least 4 (the bumper word)")
+    build_firmware(Path(args.gem5_binary))
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    cases = []
+    for case in args.cases:
+        robots, _, lookahead = case.partition("x")
+        if not robots.isdigit() or not lookahead.isdigit():
+            raise ValueError(f"Benchmark case '{case}' is not "
+                             "<robots>x<lookahead>.")
+        cases.append((int(robots), int(lookahead)))
+
+    summary = []
+    for num_robots, lookahead in cases:
+        for actuation_delay in args.actuation_delays:
+            if lookahead > 1 and actuation_delay == 0:
+                # lookahead batching relies on the one-step delay
+                continue
+            for payload_size in args.payload_sizes:
+                for transport in args.transports:
+                    if lookahead > 1 and (payload_size != 4
+                                          or transport != "socket"):
+                        # batched inputs are bumper words in the message
+                        continue
+                    print(f"Running {num_robots} robot(s) with lookahead "
+                          f"{lookahead}, actuation delay {actuation_delay} "
+                          f"and {payload_size} B inputs over {transport} "
+                          f"for {args.steps} steps")
+                    case_name = f"{num_robots}x{lookahead}-d{actuation_delay}"
+                    if payload_size != 4 or transport != "socket":
+                        case_name += f"-p{payload_size}-{transport}"
+                    summary.append(run_case(
+                        num_robots, lookahead, actuation_delay, payload_size,
+                        transport, output_dir / case_name
+                    ))
+
+    print(f"{'robots':>6} {'lookahead':>9} {'delay':>5} {'payload':>8} "
+          f"{'via':>6} {'steps/s':>10} {'per robot':>10} {'MB/s':>9} "
+          f"{'exchanges':>9} {'p50 us':>9} {'p90 us':>9} {'p99 us':>9}")
+    for case in summary:
+        print(f"{case['robots']:>6} {case['lookahead']:>9} "
+              f"{case['actuation_delay']:>5} {case['payload_bytes']:>8} "
+              f"{case['transport']:>6} "
+              f"{case['steps_per_second']:>10.1f} "
+              f"{case['steps_per_second_per_robot']:>10.1f} "
+              f"{case['input_bytes_per_second'] / 1e6:>9.3f} "
+              f"{case['exchanges']:>9} {case['p50_ns'] / 1000:>9.1f} "
+              f"{case['p90_ns'] / 1000:>9.1f} {case['p99_ns'] / 1000:>9.1f}")
+    summary_file = output_dir / "cosim-bench.json"
+    with open(summary_file, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Results written to {summary_file.as_posix()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+#include "log_ring.h"
+
+#include <stdint.h>
+
+struct log_ring {
+  volatile uint32_t magic;
+  volatile uint32_t size;  /* capacity of data[] */
+  volatile uint32_t head;  /* next index the firmware writes */
+  volatile uint32_t tail;  /* next index the host reads */
+  volatile uint8_t data[];
+};
+
+#define LOG_RING ((struct log_ring *)LOG_RING_BASE)
+
+int log_ring_write(const void *buf, size_t count)
+{
+  struct log_ring *ring = LOG_RING;
+  if (ring->magic != LOG_RING_MAGIC)
+    return -1;
+  uint32_t size = ring->size;
+  uint32_t head = ring->head;
+  uint32_t tail = ring->tail;
+  /* one byte stays free so that a full ring differs from an empty one */
+  uint32_t used = head >= tail ? head - tail : size - tail + head;
+  if (count > size - 1u - used)
+    return -1;
+
+  const uint8_t *p = (const uint8_t *)buf;
+  for (size_t i = 0; i < count; ++i) {
+    ring->data[head] = p[i];
+    if (++head == size)
+      head = 0;
+  }
+  /* the data must be in the ring before the host can see the new head */
+  __asm__ __volatile__("dmb" ::: "memory");
+  ring->head = head;
+  return 0;
+}
@@ -0,0 +1,21 @@
+#pragma once
+
+#include <stddef.h>     // size_t
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/* Log ring mapped by STM32G4FSBoard right after the bridge IO device. The
+ * layout is described in utils/log_ring.py, which drains it on the host. */
+#define LOG_RING_BASE  0x88100000u
+#define LOG_RING_MAGIC 0x474E524Cu /* "LRNG", written by the host */
+
+/* Append count bytes to the ring with plain stores. Returns 0 on success and
+ * -1 if the host does not drain the ring or the bytes do not fit, in which
+ * case the caller falls back to semihosting. */
+int log_ring_write(const void *buf, size_t count);
+
+#ifdef __cplusplus
+}
+#endif
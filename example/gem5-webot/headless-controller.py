@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+from bridge import _bridge as b
+
+sys.path.append(Path(__file__).parent.parent.parent.as_posix())
+
+from utils.shared_frames import SharedFrames
+from utils.timeline import CONTROLLER_EXCHANGE, SpanRecorder, percentile
+
+parser = argparse.ArgumentParser(
+    description="Headless stand-in for the players Webots controller: speaks "
+        "the same bridge protocol with scripted or recorded bumper input"
+)
+parser.add_argument(
+    "--name", type=str, required=True,
+    help="Robot name the controller registers with at the bridge helper"
+)
+parser.add_argument(
+    "--steps", type=int, default=1000, help="Number of control steps to run"
+)
+parser.add_argument(
+    "--timestep", type=int, default=1,
+    help="Control step in ms (the world's basicTimeStep)"
+)
+parser.add_argument(
+    "--lookahead", type=int, default=int(os.environ.get("GEM5_LOOKAHEAD", 1)),
+    help="Maximum number of steps per gem5 exchange, as GEM5_LOOKAHEAD for "
+        "players.cpp (1: step-by-step)"
+)
+parser.add_argument(
+    "--actuation-delay", type=int, choices=[0, 1],
+    default=int(os.environ.get("GEM5_ACTUATION_DELAY", 1)),
+    help="As GEM5_ACTUATION_DELAY for players.cpp: 1 pipelined, 0 lockstep"
+)
+parser.add_argument(
+    "--bump-period", type=int, default=500,
+    help="Scripted input: the bumper is pressed once every this many steps"
+)
+parser.add_argument(
+    "--bump-length", type=int, default=20,
+    help="Scripted input: number of steps each bump lasts"
+)
+parser.add_argument(
+    "--recorded-log", type=str, default=None,
+    help="Replay the bumper input of a players.cpp trajectory log "
+        "(GEM5_TRAJECTORY_DIR/<robot>.log) instead of the scripted input, "
+        "cycling through it if it is shorter than --steps"
+)
+parser.add_argument(
+    "--payload-size", type=int, default=4,
+    help="Bytes of input per step: the bumper word followed by a synthetic "
+        "sensor frame (step-by-step protocol only)"
+)
+parser.add_argument(
+    "--shared-input", type=str, default=None,
+    help="Write every input to this shared frame file and only send its "
+        "descriptor, as gem5-webots-script.py --shared-input expects"
+)
+parser.add_argument(
+    "--result-file", type=str, default=None,
+    help="JSON file to write the steps/s and the per-step latencies to"
+)
+
+args = parser.parse_args()
+
+# per-step input and output sizes, as in players.cpp
+STEP_INPUT_SIZE = 4
+STEP_OUTPUT_SIZE = 8
+
+def load_inputs():
+    if args.recorded_log:
+        # "<step> <bumper> <left> <right> <left enc> <right enc>" per line
+        with open(args.recorded_log) as f:
+            inputs = [int(line.split()[1]) for line in f if line.strip()]
+        if not inputs:
+            raise ValueError(f"No steps in '{args.recorded_log}'.")
+        return [inputs[i % len(inputs)] for i in range(args.steps)]
+    return [1 if i % args.bump_period < args.bump_length else 0
+            for i in range(args.steps)]
+
+def exchange(fid, data):
+    msg = b.Message()
+    msg.command = b.COMMAND.COMPUTE_REQUEST
+    msg.data = data
+    b.bridge_send_message(fid, msg)
+    response = b.bridge_wait_for_message(fid, -1)
+    if response.command != b.COMMAND.COMPUTE_RESPONSE:
+        raise RuntimeError(f"Unexpected response command {response.command}")
+    return bytes(response.data)
+
+def main():
+    if args.lookahead > 1 and args.actuation_delay == 0:
+        parser.error("lookahead batching needs an actuation delay of 1")
+    if args.payload_size < STEP_INPUT_SIZE:
+        parser.error(f"--payload-size must be at least {STEP_INPUT_SIZE}")
+    if args.lookahead > 1 and (args.payload_size > STEP_INPUT_SIZE
+                               or args.shared_input):
+        parser.error("--payload-size and --shared-input need --lookahead 1")
+    inputs = load_inputs()
+    # the firmware only reads the bumper word; the rest of the frame is a
+    # fixed pattern, so that generating it does not count toward the latency
+    frame = bytearray(i & 0xFF for i in range(args.payload_size))
+    shared_input = SharedFrames(args.shared_input, args.payload_size) \
+        if args.shared_input else None
+    server_pid, fid = b.bridge_setup_client(args.name)
+
+    msg = b.Message()
+    msg.command = b.COMMAND.SETUP_TIMESTEP
+    if args.actuation_delay == 0:
+        setup = [args.timestep, 1, STEP_INPUT_SIZE, STEP_OUTPUT_SIZE, 0]
+    elif args.lookahead > 1:
+        setup = [args.timestep, args.lookahead, STEP_INPUT_SIZE,
+                 STEP_OUTPUT_SIZE]
+    else:
+        setup = [args.timestep]
+    msg.data = struct.pack(f"<{len(setup)}i", *setup)
+    b.bridge_send_message(fid, msg)
+
+    timeline = None
+    if os.environ.get("GEM5_TIMELINE_DIR"):
+        timeline = SpanRecorder(
+            Path(os.environ["GEM5_TIMELINE_DIR"]) / f"{args.name}.spans"
+        )
+
+    # host ns from the moment a step's input is known until its output is
+    # applied (0 for steps whose output was known in advance)
+    latencies = []
+    exchanges = 0
+    mispredictions = 0
+    # input bytes sent to gem5, directly or through shared memory
+    input_bytes = 0
+    # lookahead state, as in players.cpp
+    pending_inputs = []
+    grant = 0
+    steady_data = 0
+    previous_data = 0
+    applied_output = bytes(STEP_OUTPUT_SIZE)
+    run_start = time.perf_counter_ns()
+    for data in inputs:
+        step_start = time.perf_counter_ns()
+        if args.lookahead > 1:
+            pending_inputs.append(data)
+            known = grant > 0 and previous_data == steady_data and \
+                len(pending_inputs) < grant
+            previous_data = data
+            if known:
+                latencies.append(0)
+                continue
+            exchange_start = SpanRecorder.now()
+            response = exchange(fid, struct.pack(
+                f"<{len(pending_inputs)}i", *pending_inputs))
+            if timeline is not None:
+                timeline.add(CONTROLLER_EXCHANGE, exchanges, exchange_start)
+            exchanges += 1
+            input_bytes += len(pending_inputs) * STEP_INPUT_SIZE
+            pending_inputs = []
+            grant, num_outputs = struct.unpack_from("<ii", response)
+            outputs = response[8:]
+            if num_outputs < 1 or len(outputs) < num_outputs * STEP_OUTPUT_SIZE:
+                raise RuntimeError(f"Malformed batched response: "
+                                   f"{len(response)} bytes")
+            for i in range(num_outputs - 1):
+                if outputs[i * STEP_OUTPUT_SIZE:(i + 1) * STEP_OUTPUT_SIZE] \
+                        != applied_output:
+                    mispredictions += 1
+            applied_output = outputs[(num_outputs - 1) * STEP_OUTPUT_SIZE:
+                                     num_outputs * STEP_OUTPUT_SIZE]
+            steady_data = data
+        else:
+            exchange_start = SpanRecorder.now()
+            struct.pack_into("<i", frame, 0, data)
+            if shared_input is not None:
+                response = exchange(fid, shared_input.write(frame))
+            else:
+                response = exchange(fid, bytes(frame))
+            if timeline is not None:
+                timeline.add(CONTROLLER_EXCHANGE, exchanges, exchange_start)
+            exchanges += 1
+            input_bytes += args.payload_size
+            if len(response) < STEP_OUTPUT_SIZE:
+                raise RuntimeError(f"Response too small: {len(response)} bytes")
+            applied_output = response[:STEP_OUTPUT_SIZE]
+        latencies.append(time.perf_counter_ns() - step_start)
+    run_seconds = (time.perf_counter_ns() - run_start) / 1e9
+
+    if timeline is not None:
+        timeline.close()
+    if shared_input is not None:
+        shared_input.close()
+    sorted_latencies = sorted(latencies)
+    result = {
+        "name": args.name,
+        "steps": len(inputs),
+        "exchanges": exchanges,
+        "lookahead": args.lookahead,
+        "actuation_delay": args.actuation_delay,
+        "mispredictions": mispredictions,
+        "payload_bytes": args.payload_size,
+        "shared_input": shared_input is not None,
+        "seconds": run_seconds,
+        "steps_per_second": len(inputs) / run_seconds if run_seconds > 0
+            else 0.0,
+        "input_bytes_per_second": input_bytes / run_seconds
+            if run_seconds > 0 else 0.0,
+        "p50_ns": percentile(sorted_latencies, 0.5),
+        "p90_ns": percentile(sorted_latencies, 0.9),
+        "p99_ns": percentile(sorted_latencies, 0.99),
+        "latencies_ns": latencies,
+    }
+    print(f"{args.name}: {result['steps']} steps, {exchanges} gem5 "
+          f"exchanges, {mispredictions} lookahead mispredictions, "
+          f"{result['steps_per_second']:.1f} steps/s, "
+          f"{result['input_bytes_per_second'] / 1e6:.3f} MB/s of input, "
+          f"per-step latency p50 "
+          f"{result['p50_ns'] / 1000:.1f} us, p99 "
+          f"{result['p99_ns'] / 1000:.1f} us")
+    if args.result_file:
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+
+if __name__ == "__main__":
+    main()
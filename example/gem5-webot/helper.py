@@ -1,5 +1,9 @@
 import argparse
+import json
 import os
+import signal
+import sys
+import threading
 import time
 import subprocess
 import pathlib
@@ -7,6 +11,13 @@ from pathlib import Path
 
 import bridge._bridge as br
 
+sys.path.append(Path(__file__).parent.parent.parent.as_posix())
+
+from utils.cosim_stats import COSIM_STATS_FILE, exchange_rates
+from utils.firmware import build_firmware
+from utils.timeline import PAIRS_FILE, SpanRecorder, export_run, format_histograms
+from utils.webots_world import discover_robots
+
 parser = argparse.ArgumentParser(
     description="Run the bridge helper server to connect gem5 and Webots."
 )
@@ -28,15 +39,165 @@ parser.add_argument(
 parser.add_argument(
     "--output-dir", type=str, default="./", help="Directory to store output logs"
 )
+parser.add_argument(
+    "--gem5-checkpoint", type=str, default=None,
+    help="Post-boot checkpoint (from gem5-webots-script.py --take-checkpoint) "
+        "to restore every gem5 instance from"
+)
+
+parser.add_argument(
+    "--lookahead", type=int, default=1,
+    help="Maximum number of control steps the controllers may batch into one "
+        "gem5 exchange while the firmware is steady (1: step-by-step)"
+)
+parser.add_argument(
+    "--headless", action="store_true",
+    help="Run Webots without rendering in fast mode, and let the supervisor "
+        "skip its score and time labels"
+)
+parser.add_argument(
+    "--actuation-delay", type=int, default=1, choices=[0, 1],
+    help="Control steps between a sensor input and the actuation computed "
+        "from it: 1 overlaps gem5 with Webots (pipelined), 0 makes them take "
+        "turns (lockstep)"
+)
+parser.add_argument(
+    "--trajectory-dir", type=str, default=None,
+    help="Directory where every controller logs its per-step trajectory"
+)
+parser.add_argument(
+    "--robots", type=str, nargs="+", default=None,
+    help="Names of the robots to co-simulate, one gem5 instance each "
+        "(default: the robots running the 'players' controller in the world)"
+)
+parser.add_argument(
+    "--robots-config", type=str, default=None,
+    help="JSON file with the list of robot names, instead of --robots"
+)
+parser.add_argument(
+    "--startup-timeout", type=float, default=600,
+    help="Seconds to wait for every gem5 instance to become ready"
+)
+parser.add_argument(
+    "--record-bridge-dir", type=str, default=None,
+    help="Record the bridge traffic of every gem5 instance to "
+        "<dir>/<server>.blog, for replay-sessions.py"
+)
+parser.add_argument(
+    "--timeline-dir", type=str, default=None,
+    help="Record the wall-clock phases of every control step in gem5, the "
+        "controllers and the helper to this directory; exported as a Chrome "
+        "trace and latency histograms at the end of a --duration run"
+)
+parser.add_argument(
+    "--duration", type=float, default=None,
+    help="Stop the co-simulation after this many seconds once every gem5 "
+        "instance is ready, and report the co-simulation throughput"
+)
 
 args = parser.parse_args()
 
+def get_robots():
+    if args.robots:
+        return args.robots
+    if args.robots_config:
+        with open(args.robots_config) as f:
+            robots = json.load(f)
+        if not isinstance(robots, list) or \
+                not all(isinstance(robot, str) for robot in robots):
+            raise ValueError(f"Robot config '{args.robots_config}' must be a "
+                             "JSON list of robot names.")
+        return robots
+    return discover_robots(Path(args.webots_world))
+
+def wait_until_ready(gem5_procs, ready_files, launch_time):
+    # readiness handshake: every gem5 instance creates its ready file once
+    # its board is instantiated; returns the startup time of each instance
+    startup_seconds = {}
+    deadline = launch_time + args.startup_timeout
+    while len(startup_seconds) < len(gem5_procs):
+        for server, proc in gem5_procs.items():
+            if server in startup_seconds:
+                continue
+            if ready_files[server].exists():
+                startup_seconds[server] = time.perf_counter() - launch_time
+                print(f"{server} ready after {startup_seconds[server]:.2f} s")
+            elif proc.poll() is not None:
+                raise RuntimeError(f"{server} exited with return code "
+                                   f"{proc.returncode} before it was ready")
+        if time.perf_counter() > deadline:
+            missing = sorted(set(gem5_procs) - set(startup_seconds))
+            raise RuntimeError(f"{', '.join(missing)} not ready after "
+                               f"{args.startup_timeout} s")
+        time.sleep(0.05)
+    return startup_seconds
+
+def stop_children(gem5_procs, webots_proc):
+    # SIGINT makes gem5-webots-script.py leave its loop and write its rate
+    for proc in gem5_procs.values():
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGINT)
+    for proc in gem5_procs.values():
+        try:
+            proc.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    webots_proc.terminate()
+    try:
+        webots_proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        webots_proc.kill()
+        webots_proc.wait()
+
+def stop_and_report(gem5_procs, webots_proc, output_dir, robots,
+                    startup_seconds):
+    stop_children(gem5_procs, webots_proc)
+    exchanges_per_second = {}
+    for server, rate in exchange_rates(output_dir, gem5_procs).items():
+        if rate is None:
+            print(f"{server}: no co-simulation rate in "
+                  f"{(output_dir / f'{server}-m5out' / COSIM_STATS_FILE).as_posix()}")
+            continue
+        exchanges_per_second[server] = rate
+    total = sum(exchanges_per_second.values())
+    report = {
+        "robots": robots,
+        "duration": args.duration,
+        "lookahead": args.lookahead,
+        "actuation_delay": args.actuation_delay,
+        "headless": args.headless,
+        "startup_seconds": startup_seconds,
+        "exchanges_per_second": exchanges_per_second,
+        "total_exchanges_per_second": total,
+    }
+    report_file = output_dir / "cosim-report.json"
+    with open(report_file, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"{len(robots)} robot(s): {total:.1f} exchanges/s in total, "
+          f"{total / max(len(exchanges_per_second), 1):.1f} per robot, "
+          f"startup {max(startup_seconds.values()):.2f} s "
+          f"(report in {report_file.as_posix()})")
+    if args.timeline_dir:
+        export_timeline()
+
+def export_timeline():
+    timeline_dir = Path(args.timeline_dir)
+    histograms = export_run(timeline_dir)
+    print(format_histograms(histograms))
+    print(f"Chrome trace in {(timeline_dir / 'timeline.json').as_posix()}")
+
 def main():
+    robots = get_robots()
+    if not robots:
+        raise ValueError(f"No robots to co-simulate in '{args.webots_world}'.")
     # mapping of client_name -> server_name
     client_to_server = {
-        "R0": "gem5-0",
-        "R1": "gem5-1",
+        robot: f"gem5-{i}" for i, robot in enumerate(robots)
     }
+    print(f"Co-simulating {len(robots)} robot(s): {', '.join(robots)}")
+    # before anything is started, so a failed build leaves nothing to stop
+    build_firmware(Path(args.gem5_binary))
 
     listen_fd = br.bridge_setup_helper_server_socket()
     print(f"Helper listening on fd {listen_fd}")
@@ -48,41 +209,142 @@ def main():
         "--stdout",
         "--stderr"
     ]
+    if args.headless:
+        # batch: no dialog may block an unattended run
+        webots_args = ["--no-rendering", "--mode=fast", "--batch"] + \
+            webots_args
 
     gem5_base = Path(args.gem5_path)
     gem5_args = [
         args.gem5_script,
         "--binary",
         args.gem5_binary,
-        "--server-name"
     ]
+    if args.gem5_checkpoint:
+        gem5_args += ["--restore-checkpoint", args.gem5_checkpoint]
+    gem5_args += ["--server-name"]
 
     output_dir = Path(args.output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
+    if args.record_bridge_dir:
+        Path(args.record_bridge_dir).mkdir(parents=True, exist_ok=True)
 
-    def start_executable(path, args, friendly_name):
+    def start_executable(path, args, friendly_name, env=None):
         p = Path(path)
         if not p.exists():
             raise FileNotFoundError(f"{friendly_name} not found at {path}")
         if not os.access(path, os.X_OK):
             raise PermissionError(f"{friendly_name} at {path} is not executable")
-        return subprocess.Popen([str(path)] + args)
+        return subprocess.Popen([str(path)] + args, env=env)
+
+    # the robot controllers inherit their configuration from Webots' environment
+    webots_env = dict(os.environ)
+    webots_env["GEM5_LOOKAHEAD"] = str(args.lookahead)
+    webots_env["GEM5_ACTUATION_DELAY"] = str(args.actuation_delay)
+    if args.headless:
+        webots_env["GEM5_HEADLESS"] = "1"
+    if args.trajectory_dir:
+        Path(args.trajectory_dir).mkdir(parents=True, exist_ok=True)
+        webots_env["GEM5_TRAJECTORY_DIR"] = Path(args.trajectory_dir).resolve().as_posix()
+    helper_timeline = None
+    if args.timeline_dir:
+        timeline_dir = Path(args.timeline_dir).resolve()
+        timeline_dir.mkdir(parents=True, exist_ok=True)
+        webots_env["GEM5_TIMELINE_DIR"] = timeline_dir.as_posix()
+        # lets the export match every controller with its gem5 instance
+        with open(timeline_dir / PAIRS_FILE, "w") as f:
+            json.dump(client_to_server, f, indent=2)
+        helper_timeline = SpanRecorder(timeline_dir / "helper.spans")
 
     # start the external programs directly (do NOT invoke them with the Python interpreter)
-    webots_proc = start_executable(webots_base, webots_args, "webots")
-    # small delay so server registers shortly after starting
-    time.sleep(0.1)
-    gem5_0_proc = start_executable(gem5_base, ["-re", "-d", f"{output_dir.as_posix()}/gem5-0-m5out"] + gem5_args + ["gem5-0"], "gem5-0")
-    time.sleep(0.1)
-    gem5_1_proc = start_executable(gem5_base, ["-re", "-d", f"{output_dir.as_posix()}/gem5-1-m5out"] + gem5_args + ["gem5-1"], "gem5-1")
-    print("Started server and client; entering helper loop")
+    webots_proc = start_executable(webots_base, webots_args, "webots", webots_env)
+    # start every gem5 instance at once; they instantiate their boards in
+    # parallel and each signals readiness through its ready file
+    gem5_procs = {}
+    ready_files = {}
+    launch_time = time.perf_counter()
+    launch_ns = SpanRecorder.now()
+    for server in client_to_server.values():
+        ready_files[server] = output_dir / f"{server}.ready"
+        ready_files[server].unlink(missing_ok=True)
+        # only the stats this run writes may end up in the report
+        (output_dir / f"{server}-m5out" / COSIM_STATS_FILE).unlink(
+            missing_ok=True)
+        extra_args = []
+        if args.timeline_dir:
+            extra_args = ["--timeline-file",
+                             (timeline_dir / f"{server}.spans").as_posix()]
+        if args.record_bridge_dir:
+            extra_args += ["--record-bridge", (
+                Path(args.record_bridge_dir) / f"{server}.blog"
+            ).as_posix()]
+        gem5_procs[server] = start_executable(
+            gem5_base,
+            ["-re", "-d", f"{output_dir.as_posix()}/{server}-m5out"]
+                + gem5_args + [server]
+                + ["--ready-file", ready_files[server].as_posix()]
+                + extra_args,
+            server
+        )
+    print("Started server and clients; entering helper loop")
+
+    # set by the monitor if the startup failed
+    monitor_error = []
+    # set once the monitor is done with the run and ends the helper loop
+    monitor_done = threading.Event()
+
+    def end_helper_loop():
+        # the helper loop blocks the main thread in C; SIGINT sent to that
+        # thread interrupts it and surfaces as KeyboardInterrupt below
+        monitor_done.set()
+        signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+
+    def monitor():
+        # runs next to the helper loop, which blocks the main thread
+        try:
+            startup_seconds = wait_until_ready(gem5_procs, ready_files,
+                                               launch_time)
+        except RuntimeError as e:
+            monitor_error.append(e)
+            end_helper_loop()
+            return
+        print(f"All {len(gem5_procs)} gem5 instance(s) ready after "
+              f"{max(startup_seconds.values()):.2f} s")
+        if helper_timeline is not None:
+            for i, server in enumerate(gem5_procs):
+                helper_timeline.add(
+                    "helper.startup", i, launch_ns,
+                    launch_ns + int(startup_seconds[server] * 1e9)
+                )
+            helper_timeline.close()
+        if args.duration is not None:
+            time.sleep(args.duration)
+            stop_and_report(gem5_procs, webots_proc, output_dir, robots,
+                            startup_seconds)
+            end_helper_loop()
+
+    monitor_thread = threading.Thread(target=monitor, daemon=True)
+    monitor_thread.start()
     try:
         br.bridge_helper_server_loop(listen_fd, client_to_server)
     except KeyboardInterrupt:
-        print("Interrupted, shutting down children...")
+        if not monitor_done.is_set():
+            print("Interrupted, shutting down children...")
     finally:
         br.bridge_close_helper_server_socket(listen_fd)
 
+    if monitor_error:
+        print(f"Error: {monitor_error[0]}; shutting down children...")
+        stop_children(gem5_procs, webots_proc)
+        sys.exit(1)
+    if args.duration is not None:
+        if monitor_done.is_set():
+            monitor_thread.join()
+        else:
+            # interrupted before the timed run was over
+            stop_children(gem5_procs, webots_proc)
+        return
+
     print("Waiting for children to exit")
     # # ensure children are terminated cleanly
     # procs = [("webots", webots_proc), ("gem5-0", gem5_0_proc), ("gem5-1", gem5_1_proc)]
@@ -0,0 +1,111 @@
+from multiprocessing import Pool
+from pathlib import Path
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+sys.path.append(Path(__file__).parent.parent.parent.as_posix())
+
+from utils.cosim_stats import COSIM_STATS_FILE, read_cosim_stats
+from utils.firmware import build_firmware
+
+parser = argparse.ArgumentParser(
+    description="Re-run the firmware of recorded co-simulation sessions in "
+        "gem5, without Webots, the helper or the bridge sockets"
+)
+parser.add_argument(
+    "--gem5-path", type=str, required=True, help="Path to the gem5 executable"
+)
+parser.add_argument(
+    "--gem5-script", type=str, required=True, help="Path to the gem5 script"
+)
+parser.add_argument(
+    "--gem5-binary", type=str, required=True, help="Path to the binary to run in gem5"
+)
+parser.add_argument(
+    "--gem5-checkpoint", type=str, default=None,
+    help="Post-boot checkpoint to restore every replay from"
+)
+parser.add_argument(
+    "--sessions", type=str, nargs="+", required=True,
+    help="Bridge logs recorded with --record-bridge (.blog files)"
+)
+parser.add_argument(
+    "--processes", type=int, default=1, help="Number of parallel processes to use"
+)
+parser.add_argument(
+    "--output-dir", type=str, default="./", help="Directory to store output logs"
+)
+
+args = parser.parse_args()
+
+def replay_this(run_ball):
+    m5out = Path(run_ball['m5out'])
+    # a stale file from an earlier replay into the same directory must not
+    # pass for this one
+    (m5out / COSIM_STATS_FILE).unlink(missing_ok=True)
+    start = time.perf_counter()
+    # -re sends gem5's output to simout.txt/simerr.txt in the output
+    # directory; the replay's counts are in its cosim-stats.json
+    result = subprocess.run(run_ball['run_command'])
+    wall_seconds = time.perf_counter() - start
+    outcome = {
+        "session": run_ball['session'],
+        "returncode": result.returncode,
+        "wall_seconds": wall_seconds,
+    }
+    stats = read_cosim_stats(m5out)
+    if stats is not None and "recorded_seconds" in stats:
+        outcome.update({
+            "exchanges": stats['exchanges'],
+            "recorded_seconds": stats['recorded_seconds'],
+            "replay_seconds": stats['cosim_seconds'],
+            "mismatches": stats['mismatches'],
+            "compared": stats['compared'],
+        })
+    return outcome
+
+def main():
+    gem5_base = Path(args.gem5_path).resolve()
+    build_firmware(Path(args.gem5_binary))
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    run_balls = []
+    for session in args.sessions:
+        session_path = Path(session)
+        if not session_path.is_file():
+            raise FileNotFoundError(f"Bridge log '{session}' does not exist.")
+        m5out = output_dir / f"{session_path.stem}-m5out"
+        run_command = [gem5_base.as_posix(), "-re", "-d", m5out.as_posix(),
+                       args.gem5_script, "--binary", args.gem5_binary,
+                       "--replay-bridge", session_path.as_posix(),
+                       "--progress-interval", "0"]
+        if args.gem5_checkpoint:
+            run_command += ["--restore-checkpoint", args.gem5_checkpoint]
+        run_balls.append({
+            "session": session_path.stem,
+            "m5out": m5out.as_posix(),
+            "run_command": run_command,
+        })
+
+    outcomes = []
+    with Pool(processes=args.processes) as pool:
+        for outcome in pool.imap_unordered(replay_this, run_balls):
+            outcomes.append(outcome)
+            if outcome['returncode'] != 0 or "exchanges" not in outcome:
+                print(f"{outcome['session']}: replay failed with return code "
+                      f"{outcome['returncode']}")
+                continue
+            speedup = outcome['recorded_seconds'] / outcome['replay_seconds'] \
+                if outcome['replay_seconds'] > 0 else 0.0
+            print(f"{outcome['session']}: {outcome['exchanges']} exchange(s) "
+                  f"in {outcome['replay_seconds']:.2f} s ({speedup:.1f}x the "
+                  f"recorded session), {outcome['mismatches']} of "
+                  f"{outcome['compared']} response(s) differ")
+    with open(output_dir / "replay-report.json", "w") as f:
+        json.dump(sorted(outcomes, key=lambda o: o['session']), f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.append(Path(__file__).parent.parent.parent.as_posix())
+
+from utils.webots_world import discover_robots, replicate_robots
+
+parser = argparse.ArgumentParser(
+    description="Write a copy of a Webots world with N copies of its first "
+        "robot, to measure how the co-simulation scales with the robot count"
+)
+parser.add_argument(
+    "--webots-world", type=str, required=True, help="Path to the Webots world file"
+)
+parser.add_argument(
+    "--robots", type=int, required=True, help="Number of robots in the new world"
+)
+parser.add_argument(
+    "--spacing", type=float, default=0.12,
+    help="Distance in meters between neighbouring robots on the grid"
+)
+parser.add_argument(
+    "--output", type=str, required=True, help="Path of the new world file"
+)
+
+args = parser.parse_args()
+
+def main():
+    world = Path(args.webots_world)
+    if not world.is_file():
+        raise FileNotFoundError(f"Webots world '{world.as_posix()}' does not exist.")
+    if args.robots < 1:
+        raise ValueError("--robots must be at least 1.")
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(replicate_robots(world, args.robots, args.spacing))
+    print(f"Wrote {output.as_posix()} with robots "
+          f"{', '.join(discover_robots(output))}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.append(Path(__file__).parent.parent.parent.as_posix())
+
+from utils.timeline import export_run, format_histograms
+
+parser = argparse.ArgumentParser(
+    description="Merge the .spans files of a co-simulation run into a Chrome "
+        "trace (chrome://tracing, ui.perfetto.dev) and print per-phase "
+        "latency histograms"
+)
+parser.add_argument(
+    "--timeline-dir", type=str, required=True,
+    help="Directory passed as --timeline-dir to helper.py"
+)
+parser.add_argument(
+    "--output", type=str, default=None,
+    help="Chrome trace file (default: <timeline-dir>/timeline.json)"
+)
+
+args = parser.parse_args()
+
+def main():
+    timeline_dir = Path(args.timeline_dir)
+    if not timeline_dir.is_dir():
+        raise FileNotFoundError(f"Timeline directory '{timeline_dir.as_posix()}' does not exist.")
+    histograms = export_run(timeline_dir, args.output)
+    print(format_histograms(histograms))
+
+if __name__ == "__main__":
+    main()
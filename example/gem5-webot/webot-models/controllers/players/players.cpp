@@ -9,6 +9,11 @@
 #include <webots/TouchSensor.hpp>
 #include <webots/Device.hpp>
 #include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <chrono>
+#include <string>
+#include <vector>
 #include <algorithm>
 #include "bridge.hpp"
 
@@ -17,6 +22,87 @@ using namespace webots;
 
 #define MAX_SPEED 100
 
+// Maximum number of control steps per gem5 exchange (GEM5_LOOKAHEAD, 1 means
+// the step-by-step protocol).
+static int getLookahead() {
+  const char *value = std::getenv("GEM5_LOOKAHEAD");
+  if (!value)
+    return 1;
+  return std::max(1, std::atoi(value));
+}
+
+// Actuation delay in control steps (GEM5_ACTUATION_DELAY). 1 (the default):
+// gem5 answers each request with the firmware's output for the previous
+// input and simulates the new input while Webots runs the next step. 0
+// (lockstep): gem5 simulates the new input before answering, so Webots and
+// gem5 take turns.
+static int getActuationDelay() {
+  const char *value = std::getenv("GEM5_ACTUATION_DELAY");
+  if (!value)
+    return 1;
+  return std::atoi(value) == 0 ? 0 : 1;
+}
+
+// Per-step trajectory log (GEM5_TRAJECTORY_DIR/<robot name>.log) used to
+// check that different synchronization modes drive the robot identically.
+static FILE *openTrajectoryLog(const std::string &name) {
+  const char *dir = std::getenv("GEM5_TRAJECTORY_DIR");
+  if (!dir)
+    return nullptr;
+  std::string path = std::string(dir) + "/" + name + ".log";
+  FILE *log = fopen(path.c_str(), "w");
+  if (!log)
+    fprintf(stderr, "cannot open trajectory log %s\n", path.c_str());
+  return log;
+}
+
+// Per-phase timeline (GEM5_TIMELINE_DIR/<robot name>.spans, merged by
+// utils/timeline.py): spans are buffered in memory and written at exit as
+// "<name> <index> <start ns> <end ns>" on the monotonic clock, the clock the
+// gem5 script stamps its own spans with.
+struct Timeline {
+  struct Span {
+    const char *name;
+    long index;
+    long long start;
+    long long end;
+  };
+  bool enabled = false;
+  std::string path;
+  std::vector<Span> spans;
+
+  explicit Timeline(const std::string &name) {
+    const char *dir = std::getenv("GEM5_TIMELINE_DIR");
+    if (!dir)
+      return;
+    enabled = true;
+    path = std::string(dir) + "/" + name + ".spans";
+    spans.reserve(1 << 16);
+  }
+  static long long now() {
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(
+               std::chrono::steady_clock::now().time_since_epoch())
+        .count();
+  }
+  void add(const char *name, long index, long long start) {
+    if (enabled)
+      spans.push_back({name, index, start, now()});
+  }
+  void write() const {
+    if (!enabled)
+      return;
+    FILE *file = fopen(path.c_str(), "w");
+    if (!file) {
+      fprintf(stderr, "cannot open timeline %s\n", path.c_str());
+      return;
+    }
+    for (const Span &span : spans)
+      fprintf(file, "%s %ld %lld %lld\n", span.name, span.index, span.start,
+              span.end);
+    fclose(file);
+  }
+};
+
 int main(int argc, char **argv) {
   // create the Robot instance.
   Robot *robot = new Robot();
@@ -60,17 +146,55 @@ int main(int argc, char **argv) {
     return 1;
   }
   // after setup the connection, send the timestep information to the server
+  // In lookahead mode the setup also carries the maximum number of steps per
+  // exchange and the per-step input and output sizes (in bytes); a lockstep
+  // controller adds its actuation delay of 0 after them.
+  const int lookahead = getLookahead();
+  const int actuationDelay = getActuationDelay();
+  if (lookahead > 1 && actuationDelay == 0) {
+    fprintf(stderr, "error: lookahead batching needs an actuation delay of 1\n");
+    delete robot;
+    return 1;
+  }
+  const int stepInputSize = sizeof(int);
+  const int stepOutputSize = 2 * sizeof(int);
   Message msg;
   Message response_msg;
   std::vector<int> message_use_vec;
   msg.command = SETUP_TIMESTEP;
-  msg.data.resize(sizeof(int));
-  std::memcpy(msg.data.data(), &timeStep, sizeof(int));
+  if (actuationDelay == 0)
+    message_use_vec = {timeStep, 1, stepInputSize, stepOutputSize, 0};
+  else if (lookahead > 1)
+    message_use_vec = {timeStep, lookahead, stepInputSize, stepOutputSize};
+  else
+    message_use_vec = {timeStep};
+  msg.data.resize(message_use_vec.size() * sizeof(int));
+  std::memcpy(msg.data.data(), message_use_vec.data(), msg.data.size());
   bridge_send_message(fid, msg);
   int data;
   size_t nints;
 
-  while (robot->step(timeStep) != -1) {
+  FILE *trajectoryLog = openTrajectoryLog(name);
+  Timeline timeline(name);
+  // lookahead state: inputs not yet sent to gem5, whether gem5 reported the
+  // firmware steady on the last input sent (and for how many steps), the
+  // previous step's input and the output currently applied
+  std::vector<char> pendingInputs;
+  int grant = 0;
+  int steadyData = 0;
+  int previousData = 0;
+  std::vector<char> appliedOutput(stepOutputSize, 0);
+  long steps = 0;
+  long exchanges = 0;
+  long mispredictions = 0;
+  auto wallStart = std::chrono::steady_clock::now();
+
+  for (;;) {
+    // Webots physics and the synchronization with the simulator
+    const long long stepStart = timeline.enabled ? Timeline::now() : 0;
+    if (robot->step(timeStep) == -1)
+      break;
+    timeline.add("controller.webots_step", steps, stepStart);
     if (bumper->getValue() > 0.0) {
         bumped = true;
         bumpCount++;
@@ -79,29 +203,106 @@ int main(int argc, char **argv) {
     }
 
     data = bumped ? 1 : 0;
+    steps++;
 
-    msg.command = COMPUTE_REQUEST;
-    msg.data.resize(sizeof(int));
-    std::memcpy(msg.data.data(), &data, sizeof(int));
-    bridge_send_and_wait_for_response(fid, msg, response_msg, -1);
-    if (response_msg.command != COMPUTE_RESPONSE) {
-      fprintf(stderr, "unexpected response command %d\n", response_msg.command);
-      continue;
+    if (lookahead > 1) {
+      const char *dataBytes = reinterpret_cast<const char *>(&data);
+      pendingInputs.insert(pendingInputs.end(), dataBytes, dataBytes + sizeof(int));
+      // The output of this step is the firmware's answer to the previous
+      // input. While the firmware is steady on the input we keep sending, that
+      // answer is the output already applied, so the exchange can be deferred
+      // (at most `grant` steps per exchange).
+      const int numPending = pendingInputs.size() / stepInputSize;
+      const bool known = grant > 0 && previousData == steadyData &&
+                         numPending < grant;
+      previousData = data;
+      if (!known) {
+        msg.command = COMPUTE_REQUEST;
+        msg.data.assign(pendingInputs.begin(), pendingInputs.end());
+        pendingInputs.clear();
+        const long long exchangeStart = timeline.enabled ? Timeline::now() : 0;
+        bridge_send_and_wait_for_response(fid, msg, response_msg, -1);
+        timeline.add("controller.exchange", exchanges, exchangeStart);
+        exchanges++;
+        if (response_msg.command != COMPUTE_RESPONSE) {
+          fprintf(stderr, "unexpected response command %d\n", response_msg.command);
+          grant = 0;
+          continue;
+        }
+        // response: int grant, int n, then n outputs of stepOutputSize bytes
+        size_t bytes = response_msg.data.size();
+        int header[2] = {0, 0};
+        if (bytes >= sizeof(header))
+          std::memcpy(header, response_msg.data.data(), sizeof(header));
+        const int numOutputs = header[1];
+        if (numOutputs < 1 ||
+            bytes < sizeof(header) + (size_t)numOutputs * stepOutputSize) {
+          fprintf(stderr, "malformed batched response: %zu bytes\n", bytes);
+          grant = 0;
+          continue;
+        }
+        const char *outputs =
+            reinterpret_cast<const char *>(response_msg.data.data()) + sizeof(header);
+        // the outputs of the deferred steps should match what was applied
+        for (int i = 0; i < numOutputs - 1; i++) {
+          if (std::memcmp(outputs + i * stepOutputSize, appliedOutput.data(),
+                          stepOutputSize) != 0)
+            mispredictions++;
+        }
+        std::memcpy(appliedOutput.data(),
+                    outputs + (numOutputs - 1) * stepOutputSize, stepOutputSize);
+        grant = header[0];
+        steadyData = data;
+        int leftInt = 0, rightInt = 0;
+        std::memcpy(&leftInt, appliedOutput.data(), sizeof(int));
+        std::memcpy(&rightInt, appliedOutput.data() + sizeof(int), sizeof(int));
+        leftSpeed = static_cast<double>(leftInt);
+        rightSpeed = static_cast<double>(rightInt);
+        leftMotor->setVelocity(leftSpeed);
+        rightMotor->setVelocity(rightSpeed);
+      }
+    } else {
+      msg.command = COMPUTE_REQUEST;
+      msg.data.resize(sizeof(int));
+      std::memcpy(msg.data.data(), &data, sizeof(int));
+      const long long exchangeStart = timeline.enabled ? Timeline::now() : 0;
+      bridge_send_and_wait_for_response(fid, msg, response_msg, -1);
+      timeline.add("controller.exchange", exchanges, exchangeStart);
+      exchanges++;
+      if (response_msg.command != COMPUTE_RESPONSE) {
+        fprintf(stderr, "unexpected response command %d\n", response_msg.command);
+        continue;
+      }
+      size_t bytes = response_msg.data.size();
+      if (bytes < 2 * sizeof(int)) {
+        fprintf(stderr, "response too small: %zu bytes\n", bytes);
+        continue;
+      }
+      int leftInt = 0, rightInt = 0;
+      std::memcpy(&leftInt, response_msg.data.data(), sizeof(int));
+      std::memcpy(&rightInt, response_msg.data.data() + sizeof(int), sizeof(int));
+      fprintf(stderr, "velocities received: left=%d right=%d\n", leftInt, rightInt);
+      leftSpeed = static_cast<double>(leftInt);
+      rightSpeed = static_cast<double>(rightInt);
+      leftMotor->setVelocity(leftSpeed);
+      rightMotor->setVelocity(rightSpeed);
     }
-    size_t bytes = response_msg.data.size();
-    if (bytes < 2 * sizeof(int)) {
-      fprintf(stderr, "response too small: %zu bytes\n", bytes);
-      continue;
+    if (trajectoryLog) {
+      fprintf(trajectoryLog, "%ld %d %.17g %.17g %.17g %.17g\n", steps, data,
+              leftSpeed, rightSpeed,
+              leftEnc ? leftEnc->getValue() : 0.0,
+              rightEnc ? rightEnc->getValue() : 0.0);
     }
-    int leftInt = 0, rightInt = 0;
-    std::memcpy(&leftInt, response_msg.data.data(), sizeof(int));
-    std::memcpy(&rightInt, response_msg.data.data() + sizeof(int), sizeof(int));
-    fprintf(stderr, "velocities received: left=%d right=%d\n", leftInt, rightInt);
-    leftSpeed = static_cast<double>(leftInt);
-    rightSpeed = static_cast<double>(rightInt);
-    leftMotor->setVelocity(leftSpeed);
-    rightMotor->setVelocity(rightSpeed);
   }
+  double wallSeconds = std::chrono::duration<double>(
+      std::chrono::steady_clock::now() - wallStart).count();
+  fprintf(stderr, "%s: %ld steps, %ld gem5 exchanges, %ld lookahead "
+          "mispredictions, %.1f steps/s (actuation delay %d)\n", name.c_str(),
+          steps, exchanges, mispredictions,
+          wallSeconds > 0 ? steps / wallSeconds : 0.0, actuationDelay);
+  if (trajectoryLog)
+    fclose(trajectoryLog);
+  timeline.write();
   delete robot;
   return 0;
 }
@@ -7,7 +7,9 @@
 #include <webots/Robot.hpp>
 #include <webots/Supervisor.hpp>
 #include <webots/Emitter.hpp>
+#include <chrono>
 #include <cstdio>
+#include <cstdlib>
 
 using namespace webots;
 
@@ -36,9 +38,18 @@ void resetRobotPosition(Field* robotTranslationField,
   robotRotationField->setSFRotation(robotStartRotation);
 }
 
+// Headless runs (GEM5_HEADLESS set by the helper with --headless) have nobody
+// watching the 3D view, so the score and time labels are not drawn. Nothing
+// else changes: the labels do not affect the physics or the game.
+static bool isHeadless() {
+  const char *value = std::getenv("GEM5_HEADLESS");
+  return value && std::atoi(value) != 0;
+}
+
 int main(int argc, char **argv) {
   // create the Supervisor instance.
   Supervisor *supervisor = new Supervisor();
+  const bool headless = isHeadless();
   
   // get game settings from the world info (DEF GAME_SETTINGS).
   // this is the time unit of the simulation
@@ -119,12 +130,16 @@ int main(int argc, char **argv) {
   // inital ball reset timer
   double ballResetTimer = 0.0;
   // inital set score
-  setScore(score[0], score[1], supervisor);
+  if (!headless)
+    setScore(score[0], score[1], supervisor);
   // inital timers
   double gameTimer = gameTimeSeconds;
   // double ballResetTimer = 0.0;
+  long steps = 0;
+  auto wallStart = std::chrono::steady_clock::now();
 
   while (supervisor->step(timeStep) != -1) {
+    steps++;
     ballPosition = ballTranslationField->getSFVec3f();
     for (int i = 0; i < robotsCount; i++) {
       robotsPositions[i] = robotTranslationField[i]->getSFVec3f();
@@ -148,7 +163,8 @@ int main(int argc, char **argv) {
       gameTimer = gameTimeSeconds;  // restart
       score[0] = 0;
       score[1] = 0;
-      setScore(score[0], score[1], supervisor);
+      if (!headless)
+        setScore(score[0], score[1], supervisor);
       // reset robots and ball positions
       resetRobotPosition(robotTranslationField[0], robotRotationField[0],
                           robotAStartPosition, robotAStartRotation);
@@ -157,21 +173,25 @@ int main(int argc, char **argv) {
       resetBallPosition(ballTranslationField, ballRotationField,
                           ballStartPosition, ballStartRotation);
     }
-    sprintf(timeString, "%02d:%02d", 
-            (int)(gameTimer / 60), (int)((int)gameTimer % 60));
-    setTime(timeString, supervisor);
+    if (!headless) {
+      sprintf(timeString, "%02d:%02d", 
+              (int)(gameTimer / 60), (int)((int)gameTimer % 60));
+      setTime(timeString, supervisor);
+    }
 
     if (ballPosition[0] < -goalXLimit) {
       // goal for team B
       score[1] += 1;
-      setScore(score[0], score[1], supervisor);
+      if (!headless)
+        setScore(score[0], score[1], supervisor);
       // reset ball positions
       resetBallPosition(ballTranslationField, ballRotationField,
                           ballStartPosition, ballStartRotation);
     } else if (ballPosition[0] > goalXLimit) {
       // goal for team A
       score[0] += 1;
-      setScore(score[0], score[1], supervisor);
+      if (!headless)
+        setScore(score[0], score[1], supervisor);
       // reset ball positions
       resetBallPosition(ballTranslationField, ballRotationField,
                           ballStartPosition, ballStartRotation);
@@ -180,6 +200,11 @@ int main(int argc, char **argv) {
   };
 
   // Enter here exit cleanup code.
+  double wallSeconds = std::chrono::duration<double>(
+      std::chrono::steady_clock::now() - wallStart).count();
+  fprintf(stderr, "supervisor: %ld steps, %.1f steps/s%s, score %d:%d\n",
+          steps, wallSeconds > 0 ? steps / wallSeconds : 0.0,
+          headless ? " (headless)" : "", score[0], score[1]);
   delete supervisor;
 
   return 0;
@@ -4,11 +4,20 @@ from pathlib import Path
 sys.path.append(Path(__file__).parent.parent.as_posix())
 
 import argparse
-import array, struct, ctypes
-from bridge import _bridge as b
+import os
+import struct
+import time
 import m5
 from m5.objects import Root
 from board.fs_STM32G4 import STM32G4FSBoard
+from utils.bridge_log import REQUEST, RESPONSE, BridgeLogWriter, BridgeReplay
+from utils.cosim_stats import write_cosim_stats
+from utils.log_ring import LogRing
+from utils.progress import ProgressReporter
+from utils.shared_frames import SharedFrames
+from utils.timeline import (
+    GEM5_HANDLE, GEM5_RESPOND, GEM5_SIMULATE, GEM5_WAIT, SpanRecorder
+)
 
 parser = argparse.ArgumentParser(
     description="Run a gem5 simulation with the demo stm32g4 MCU board in FS"
@@ -20,8 +29,82 @@ parser.add_argument(
 parser.add_argument(
     "--server-name", type=str, default="server0", help="Name of the bridge server"
 )
+parser.add_argument(
+    "--take-checkpoint", type=str, default=None,
+    help="Run the firmware until it reaches its dispatch loop, save a "
+        "checkpoint to this directory and exit (no bridge is set up)"
+)
+parser.add_argument(
+    "--restore-checkpoint", type=str, default=None,
+    help="Restore the board from a checkpoint saved with --take-checkpoint "
+        "instead of booting the firmware from reset"
+)
+parser.add_argument(
+    "--ready-file", type=str, default=None,
+    help="File to create once the board is instantiated and the bridge "
+        "server is about to register (readiness handshake with the helper)"
+)
+parser.add_argument(
+    "--progress-interval", type=float, default=10,
+    help="Host seconds between progress records (0 disables them)"
+)
+parser.add_argument(
+    "--progress-file", type=str, default=None,
+    help="JSON-lines progress file (default: progress.jsonl in the gem5 "
+        "output directory)"
+)
+parser.add_argument(
+    "--timeline-file", type=str, default=None,
+    help="Record the wall-clock phases of every exchange (wait, handle, "
+        "simulate) to this .spans file (see utils/timeline.py)"
+)
+parser.add_argument(
+    "--record-bridge", type=str, default=None,
+    help="Record every bridge message of the session (requests and "
+        "responses, timestamped) to this file"
+)
+parser.add_argument(
+    "--replay-bridge", type=str, default=None,
+    help="Replay the requests recorded with --record-bridge into the board "
+        "instead of serving a controller (no bridge sockets), and compare "
+        "the responses with the recorded ones"
+)
+parser.add_argument(
+    "--input-buffer-size", type=int, default=256,
+    help="Size in bytes of BridgeIODevice's input buffer, the largest input "
+        "a request can carry"
+)
+parser.add_argument(
+    "--output-buffer-size", type=int, default=256,
+    help="Size in bytes of BridgeIODevice's output buffer"
+)
+parser.add_argument(
+    "--shared-input", type=str, default=None,
+    help="Shared frame file (e.g. in /dev/shm) the controller writes its "
+        "inputs to; requests then only carry a descriptor of the frame (see "
+        "utils/shared_frames.py)"
+)
+parser.add_argument(
+    "--firmware-log", type=str, default=None,
+    help="File to drain the firmware's log ring to (default: firmware.log in "
+        "the gem5 output directory)"
+)
+parser.add_argument(
+    "--semihosting-log", action="store_true",
+    help="Leave the log ring disabled, so that the firmware prints through "
+        "semihosting (to stdout in the gem5 output directory)"
+)
 args = parser.parse_args()
 
+if args.record_bridge and args.replay_bridge:
+    parser.error("--record-bridge and --replay-bridge are exclusive")
+if args.shared_input and args.replay_bridge:
+    # recordings hold the frames themselves, not their descriptors
+    parser.error("--shared-input and --replay-bridge are exclusive")
+if not args.replay_bridge and not args.take_checkpoint:
+    # a replay needs neither the bridge library nor its sockets
+    from bridge import _bridge as b
+
 binary_path = Path(args.binary)
 if not binary_path.is_file():
     raise FileNotFoundError(f"Binary file '{binary_path.as_posix()}' does not "
@@ -29,112 +112,421 @@ if not binary_path.is_file():
 
 server_name = args.server_name
 
-board = STM32G4FSBoard()
+board = STM32G4FSBoard(
+    input_buffer_size=args.input_buffer_size,
+    output_buffer_size=args.output_buffer_size,
+)
 board.setup_workload(binary_path)
 system = board.get_system()
 
+# the host drains the log ring through the board's shared memory; the
+# post-boot checkpoint is taken with the ring disabled, so that boot output
+# goes through semihosting and restored runs start with an empty ring
+use_log_ring = not args.semihosting_log and not args.take_checkpoint
+if use_log_ring:
+    shm_name = f"/gem5-{os.getpid()}"
+    board.share_memory(shm_name)
+
 root = Root(full_system=True, system=system)
 
-m5.instantiate()
+# simulated time the firmware gets to reach its dispatch loop; firmware built
+# before m5_checkpoint() was added would idle forever otherwise
+BOOT_TIMEOUT_TICKS = 10**12
+
+if args.take_checkpoint:
+    m5.instantiate()
+    boot_start = time.perf_counter()
+    exit_event = m5.simulate(BOOT_TIMEOUT_TICKS)
+    cause = exit_event.getCause()
+    if cause == "simulate() limit reached":
+        raise RuntimeError("The firmware did not request a checkpoint within "
+                           f"{BOOT_TIMEOUT_TICKS / 1e12:g} s of simulated "
+                           "time; it may predate m5_checkpoint(), rebuild it "
+                           "(make -B).")
+    if cause != "checkpoint":
+        raise RuntimeError(f"Simulation exited with '{cause}' before the "
+                           "firmware reached its dispatch loop.")
+    boot_seconds = time.perf_counter() - boot_start
+    print(f"Firmware reached its dispatch loop at tick {m5.curTick()} after "
+          f"{boot_seconds:.3f} s of host time")
+    checkpoint_dir = Path(args.take_checkpoint)
+    m5.checkpoint(checkpoint_dir.as_posix())
+    print(f"Checkpoint saved to {checkpoint_dir.as_posix()}")
+    sys.exit(0)
+
+if args.restore_checkpoint:
+    checkpoint_dir = Path(args.restore_checkpoint)
+    if not checkpoint_dir.is_dir():
+        raise FileNotFoundError(f"Checkpoint directory "
+                                f"'{checkpoint_dir.as_posix()}' does not exist.")
+    restore_start = time.perf_counter()
+    m5.instantiate(checkpoint_dir.as_posix())
+    restore_seconds = time.perf_counter() - restore_start
+    print(f"Restored checkpoint {checkpoint_dir.as_posix()} at tick "
+          f"{m5.curTick()} in {restore_seconds:.3f} s of host time")
+else:
+    m5.instantiate()
+
+log_ring = None
+if use_log_ring:
+    log_ring = LogRing(shm_name, board.log_ring_offset(),
+                       board.log_ring_range.size())
+    log_ring.enable()
+    firmware_log_path = Path(args.firmware_log) if args.firmware_log else \
+        Path(m5.options.outdir) / "firmware.log"
+    firmware_log = open(firmware_log_path, "wb")
+    print(f"Draining the firmware log ring to {firmware_log_path.as_posix()}")
+# host time spent draining the log ring
+log_drain_ns = 0
+
+def drain_log():
+    global log_drain_ns
+    drain_start = time.perf_counter_ns()
+    data = log_ring.drain()
+    if data:
+        firmware_log.write(data)
+    log_drain_ns += time.perf_counter_ns() - drain_start
+
+if args.ready_file:
+    # the helper waits for this file to know the instance started up
+    Path(args.ready_file).write_text(f"{m5.curTick()}\n")
 
-# setupt the bridge server
-print("Setup bridge server...")
-print(f"Using server name: {server_name}")
-client_pid, listen_fd = b.bridge_setup_server(server_name)
-msg = b.bridge_wait_for_message(listen_fd, -1)
-print(f"Bridge server setup complete, listen fd: {listen_fd}")
-print(f"Received initial message: command={msg.command}, data={msg.data}")
-n_init = len(msg.data)
+recorder = BridgeLogWriter(args.record_bridge) if args.record_bridge \
+    else None
+replay = BridgeReplay(args.replay_bridge) if args.replay_bridge else None
+# mapped on the first request, once the controller has created the file
+shared_input = None
+
+def receive_request():
+    # (command, payload) of the next message from the controller, or None at
+    # the end of a replay
+    if replay is not None:
+        return replay.next_request()
+    global shared_input
+    msg = b.bridge_wait_for_message(listen_fd, -1)
+    command = int(msg.command)
+    data = bytes(msg.data)
+    if args.shared_input and command == int(b.COMMAND.COMPUTE_REQUEST):
+        if shared_input is None:
+            shared_input = SharedFrames(args.shared_input)
+        # a view of the frame in shared memory, copied only into the device
+        data = shared_input.resolve(data)
+    if recorder is not None:
+        recorder.add(REQUEST, command, bytes(data))
+    return command, data
+
+if replay is not None:
+    print(f"Replaying {len(replay.requests)} recorded request(s) from "
+          f"{args.replay_bridge}")
+else:
+    # setupt the bridge server
+    print("Setup bridge server...")
+    print(f"Using server name: {server_name}")
+    client_pid, listen_fd = b.bridge_setup_server(server_name)
+    print(f"Bridge server setup complete, listen fd: {listen_fd}")
+request = receive_request()
+if request is None:
+    raise ValueError(f"No SETUP_TIMESTEP message in '{args.replay_bridge}'.")
+command, setup_data = request
+print(f"Received initial message: command={command}, data={setup_data}")
+n_init = len(setup_data)
 print(f"Initial message length: {n_init} bytes")
 if n_init > 0:
-    print("Initial message bytes (hex):", msg.data[:64].hex())
-n = len(msg.data) // 4
-values = struct.unpack('<' + 'i'*n, msg.data)
+    print("Initial message bytes (hex):", setup_data[:64].hex())
+n = len(setup_data) // 4
+values = struct.unpack('<' + 'i'*n, setup_data[:4 * n])
 print(f"Initial message data as {n} signed integers: {values}")
 run_ahead_ticks = int(values[0]) * 10**9 # convert from milliseconds to picoseconds
+# Controllers that support lookahead batching also send the maximum number of
+# steps per exchange and the per-step input/output sizes in bytes. Older
+# controllers only send the timestep and get the step-by-step protocol.
+lookahead = int(values[1]) if n > 1 else 1
+step_input_size = int(values[2]) if n > 2 else 0
+step_output_size = int(values[3]) if n > 3 else 0
+# Actuation delay in control steps. With 1 (the default), a request is
+# answered right away with the output of the previous input, and the period of
+# the new input is simulated while Webots runs the next physics step. With 0
+# (lockstep), the period of the new input is simulated first and its output is
+# the answer, so Webots waits for gem5 on every step.
+actuation_delay = int(values[4]) if n > 4 else 1
 ifComputing = False
 print(f"Using run-ahead of {run_ahead_ticks} ps")
+if lookahead > 1 and (step_input_size <= 0 or step_output_size <= 0):
+    raise ValueError("Lookahead batching needs the per-step input and output "
+                     "sizes in the SETUP_TIMESTEP message.")
+if actuation_delay not in (0, 1):
+    raise ValueError(f"Unsupported actuation delay of {actuation_delay} steps.")
+if lookahead > 1 and actuation_delay == 0:
+    raise ValueError("Lookahead batching needs an actuation delay of 1 step.")
+if lookahead > 1 and args.shared_input:
+    raise ValueError("Lookahead batching does not support shared input frames.")
+print(f"Using an actuation delay of {actuation_delay} step(s)"
+      + (" (lockstep)" if actuation_delay == 0 else " (pipelined)"))
+if lookahead > 1:
+    print(f"Using lookahead of up to {lookahead} steps per exchange "
+          f"({step_input_size} B input, {step_output_size} B output per step)")
 
-exit_event = m5.simulate(run_ahead_ticks)
-exit_message = exit_event.getCause()
+EXIT_LAST_THREAD = "exiting with last active thread context"
+EXIT_BRIDGE_DONE = "BridgeIODevice signaled done."
+# SIGINT, e.g. from the helper at the end of a timed run
+EXIT_USER_INTERRUPT = "user interrupt received"
 
-tick_left = run_ahead_ticks
 start_tick = m5.curTick()
+tick_left = run_ahead_ticks
 
 last_decision = None
+# response for steps the firmware did not finish in time: two zero floats
+ZERO_OUTPUT = struct.pack('<ff', 0.0, 0.0)
+# host time spent in Python per exchange, from the arrival of the request to
+# the hand-off of its input (excludes waiting for the controller)
+step_overhead_ns = 0
+step_count = 0
+# output the controller applied last (lookahead mode), and the number of
+# batched steps whose output differed from it
+last_step_output = None
+lookahead_mispredictions = 0
+# cleared once the firmware answers without a steady word (firmware built
+# before the word was added); no step is granted ahead from then on
+firmware_reports_steady = True
+# input the firmware was last handed
+delivered_input = None
+# payload bytes of all requests, for the input bandwidth
+input_bytes = 0
+# periods that ended before the firmware answered its input, e.g. because
+# its WFI did not wake on the bridge interrupt
+late_outputs = 0
 
-def run_ahead_ended():
-    global run_ahead_ticks, client_pid, listen_fd, ifComputing, tick_left, start_tick
-    # print("Run-ahead period ended, waiting for message from client...")
-    msg = b.bridge_wait_for_message(listen_fd, -1)
-    # print(f"Received message: command={msg.command}, data_len={len(msg.data)}")
-    if len(msg.data) > 0:
-        # print("fs_board: message first bytes (hex):", msg.data[:64].hex())
-        if len(msg.data) % 8 == 0:
-            try:
-                nd = len(msg.data) // 8
-                vals = struct.unpack('<' + 'd' * nd, msg.data)
-                # print(f"fs_board: unpacked {nd} doubles:", vals)
-            except Exception as e:
-                print("fs_board: failed to unpack doubles:", e)
-        else:
-            print("fs_board: message length not multiple of 8, cannot unpack as doubles")
-    arr = array.array('B', msg.data)
+def current_output():
+    # firmware output for the run-ahead period that just ended, or zeros if
+    # the firmware did not finish computing in time
     if system.bridge_io.ifDone():
-        print("Bridge IO indicates computing is done")
+        # output_data is a sequence of bytes (ints 0..255); trim it to the
+        # reported size while converting it to the bytes of the message
         output_data = system.bridge_io.getOutputData()
         output_data_size = system.bridge_io.getOutputDataSize()
-        print(f"Output data size: {output_data_size} bytes")
-        # output_data is a sequence of bytes (ints 0..255). Trim to reported
-        # output_size and convert to a bytes object for the bridge message.
-        trimmed = output_data[:output_data_size]
-        msg = b.Message()
-        msg.command = b.COMMAND.COMPUTE_RESPONSE
-        msg.data = bytes(trimmed)
-        b.bridge_send_message(listen_fd, msg)
-        print(f"Sent COMPUTE_RESPONSE message with {output_data_size} bytes of data")
-    else:
-        output_data = [ctypes.c_float(0.0), ctypes.c_float(0.0)]  # zero
-        output_data_size = ctypes.sizeof(ctypes.c_float) * len(output_data)
-        msg = b.Message()
-        msg.command = b.COMMAND.COMPUTE_RESPONSE
-        msg.data = struct.pack('<' + 'f'*len(output_data), *[x.value for x in output_data])
-        b.bridge_send_message(listen_fd, msg)
-        # print(f"Sent COMPUTE_RESPONSE message with {output_data_size} bytes of zero data")
+        return bytes(output_data[:output_data_size]), True
+    global late_outputs
+    if delivered_input is not None:
+        late_outputs += 1
+    return ZERO_OUTPUT, False
+
+def deliver_input(data):
+    # hand the input of this step to the firmware unless it is still busy
+    # with the previous one, and start a new run-ahead period
+    global ifComputing, tick_left, start_tick, delivered_input
     if not ifComputing:
-        # msg.data is bytes (pybind Message.data returns bytes)
-        # Convert to unsigned-byte array explicitly
-        # Debug: show first bytes
-
-        # Pass the array (sequence of ints) to the C++ method
-        ok = system.bridge_io.updateInputData(arr)
-        print(f"Updated bridge input data buffer with {len(arr)} bytes, updateInputData returned {ok}")
-        print("Print out the bytes sent to Bridge IO device (hex):")
-        for i in range(len(arr)):
-            print(f"{arr[i]:02x}", end=" ")
-        print()
+        if len(data) > args.input_buffer_size:
+            raise ValueError(f"Input of {len(data)} bytes does not fit in the "
+                             f"{args.input_buffer_size}-byte input buffer "
+                             "(see --input-buffer-size).")
+        delivered_input = data
+        # data is bytes or a view of a shared frame; a memoryview exposes
+        # it as a sequence of unsigned bytes to the C++ method without
+        # copying it in Python
+        system.bridge_io.updateInputData(memoryview(data))
         system.bridge_io.raiseInterrupt()
-        print("Raised Bridge IO interrupt to notify core")
         ifComputing = True
     tick_left = run_ahead_ticks
     start_tick = m5.curTick()
 
+def send_response(data):
+    if timeline is not None:
+        respond_time = timeline.now()
+        timeline.add(GEM5_RESPOND, step_count, respond_time, respond_time)
+    if replay is not None:
+        replay.check_response(data)
+        return
+    msg = b.Message()
+    msg.command = b.COMMAND.COMPUTE_RESPONSE
+    msg.data = data
+    b.bridge_send_message(listen_fd, msg)
+    if recorder is not None:
+        recorder.add(RESPONSE, int(msg.command), data)
+
+def run_ahead_ended():
+    global step_overhead_ns, step_count, input_bytes
+    if timeline is not None:
+        wait_start = timeline.now()
+    request = receive_request()
+    if request is None:
+        # end of the replayed session
+        return False
+    _, data = request
+    input_bytes += len(data)
+    if timeline is not None:
+        handle_start = timeline.now()
+        timeline.add(GEM5_WAIT, step_count, wait_start, handle_start)
+    step_start = time.perf_counter_ns()
+    if lookahead > 1:
+        running = run_ahead_ended_batched(data)
+    elif actuation_delay > 0:
+        output, done = current_output()
+        send_response(output)
+        deliver_input(data)
+        running = True
+    else:
+        deliver_input(data)
+        running = True
+    step_overhead_ns += time.perf_counter_ns() - step_start
+    if timeline is not None:
+        timeline.add(GEM5_HANDLE, step_count, handle_start)
+    if actuation_delay == 0:
+        # lockstep: answer with the output of this input's own period
+        running = simulate_period()
+        output, done = current_output()
+        send_response(output)
+    step_count += 1
+    return running
+
+def run_ahead_ended_batched(data):
+    # Lookahead mode: the message carries the inputs of one or more steps.
+    # Every step is handled exactly like a step-by-step exchange (respond
+    # with the current output, deliver the input, simulate one run-ahead
+    # period) but without a round trip to the controller in between. The
+    # firmware appends a 32-bit "steady" word to its output when the same
+    # input will produce the same output without changing its state; if the
+    # last step ends steady on an unchanged input, the controller may apply
+    # that output for up to `lookahead` steps before the next exchange.
+    global last_step_output, lookahead_mispredictions, firmware_reports_steady
+    num_steps = len(data) // step_input_size
+    outputs = []
+    steady = False
+    for i in range(num_steps):
+        output, done = current_output()
+        if done and len(output) < step_output_size + 4 and \
+                firmware_reports_steady:
+            firmware_reports_steady = False
+            print(f"Firmware output of {len(output)} B has no steady word; "
+                  "stepping unbatched")
+        steady = done and firmware_reports_steady and \
+            struct.unpack_from('<I', output, step_output_size)[0] != 0
+        output = output[:step_output_size].ljust(step_output_size, b"\0")
+        if i < num_steps - 1 and output != last_step_output:
+            lookahead_mispredictions += 1
+        outputs.append(output)
+        step_input = data[i * step_input_size:(i + 1) * step_input_size]
+        previous_input = delivered_input
+        deliver_input(step_input)
+        if i < num_steps - 1 and not simulate_period():
+            return False
+    # the output is only known in advance if the firmware is steady on the
+    # input that the controller keeps sending; without a grant the
+    # controller sends one step per exchange, as in step-by-step mode
+    grant = lookahead if steady and step_input == previous_input else 0
+    last_step_output = outputs[-1]
+    send_response(struct.pack('<ii', grant, len(outputs)) + b"".join(outputs))
+    return True
+
 def bridge_io_interrupt_work_done():
     global ifComputing, tick_left, start_tick
     ifComputing = False
     system.bridge_io.clearInterrupt()
     tick_left = run_ahead_ticks - (m5.curTick() - start_tick)
-    print(f"{m5.curTick()}:{tick_left}\n")
 
-while not exit_message == "exiting with last active thread context":
-    # print(f"Simulation stopped with exit message: {exit_message}")
-    if exit_message == "BridgeIODevice signaled done.":
-        bridge_io_interrupt_work_done()
-    else:
-        run_ahead_ended()
-    # print("Resuming simulation...")
-    # print(f"{m5.curTick()}:{tick_left}\n")
-    exit_event = m5.simulate(tick_left)
-    exit_message = exit_event.getCause()
+def simulate_period():
+    # simulate until the current run-ahead period ends; returns False once
+    # the workload has exited
+    global tick_left
+    if timeline is not None:
+        period_start = timeline.now()
+    running = True
+    while True:
+        exit_event = m5.simulate(tick_left)
+        exit_message = exit_event.getCause()
+        # print(f"Simulation stopped with exit message: {exit_message}")
+        if exit_message in (EXIT_LAST_THREAD, EXIT_USER_INTERRUPT):
+            running = False
+            break
+        if exit_message == EXIT_BRIDGE_DONE:
+            bridge_io_interrupt_work_done()
+        elif exit_message == "checkpoint":
+            # the firmware's post-boot checkpoint request; only acted upon
+            # with --take-checkpoint, so finish the current run-ahead period
+            tick_left = run_ahead_ticks - (m5.curTick() - start_tick)
+        else:
+            break
+    if log_ring is not None:
+        drain_log()
+    if timeline is not None:
+        # the period whose output answers exchange `step_count`
+        timeline.add(GEM5_SIMULATE, step_count, period_start)
+    return running
+
+timeline = SpanRecorder(args.timeline_file) if args.timeline_file else None
+
+# every m5.simulate call is bounded by the run-ahead period, so progress is
+# reported between periods
+progress = None
+if args.progress_interval > 0:
+    progress_file = args.progress_file if args.progress_file else \
+        Path(m5.options.outdir) / "progress.jsonl"
+    progress = ProgressReporter(
+        progress_file, args.progress_interval, m5.curTick,
+        lambda: sum(core.core.totalInsts()
+                    for core in system.processor.get_cores())
+    )
+
+cosim_start = time.perf_counter()
+cosim_start_tick = m5.curTick()
+# with an actuation delay, the period after an exchange is simulated while the
+# controller steps Webots; in lockstep mode run_ahead_ended() simulates it
+while actuation_delay == 0 or simulate_period():
+    if not run_ahead_ended():
+        break
+    if progress is not None:
+        progress.maybe_report(exchanges=step_count)
+cosim_seconds = time.perf_counter() - cosim_start
+simulated_seconds = (m5.curTick() - cosim_start_tick) / 1e12
+if progress is not None:
+    progress.close(exchanges=step_count)
+if timeline is not None:
+    timeline.close()
+if recorder is not None:
+    recorder.close()
+    print(f"Bridge traffic recorded to {args.record_bridge}")
+if log_ring is not None:
+    drain_log()
+    firmware_log.close()
+    log_ring.close()
+    print(f"Firmware log: {log_ring.drained_bytes} B drained from the log "
+          f"ring in {log_drain_ns / 1e6:.3f} ms of host time")
 
+if step_count > 0:
+    print(f"Co-simulated {step_count} exchange(s) in {cosim_seconds:.3f} s "
+          f"({step_count / cosim_seconds:.1f} exchanges/s)")
+    print(f"Python overhead per exchange: "
+          f"{step_overhead_ns / step_count / 1000:.1f} us over {step_count} "
+          "exchange(s)")
+    print(f"Input: {input_bytes / step_count:.0f} B per exchange, "
+          f"{input_bytes / cosim_seconds / 1e6:.3f} MB/s"
+          + (" through shared memory" if shared_input is not None else ""))
+    # with the firmware asleep in WFI between steps, this falls with the
+    # idle share of the control period
+    print(f"Host time per simulated second: "
+          f"{cosim_seconds / max(simulated_seconds, 1e-12):.3f} s "
+          f"({simulated_seconds:.3f} s simulated); {late_outputs} period(s) "
+          "ended before the firmware answered")
+if lookahead > 1:
+    print(f"Lookahead mispredictions: {lookahead_mispredictions}")
+if replay is not None:
+    print(f"Replayed {step_count} exchange(s) of a {replay.recorded_ns / 1e9:.3f}"
+          f" s session in {cosim_seconds:.3f} s; {replay.mismatches} of "
+          f"{replay.compared} response(s) differ from the recording")
+# read back by the helper and replay-sessions.py
+cosim_stats = {
+    "exchanges": step_count,
+    "cosim_seconds": cosim_seconds,
+    "exchanges_per_second":
+        step_count / cosim_seconds if cosim_seconds > 0 else 0.0,
+    "lookahead_mispredictions": lookahead_mispredictions,
+    "simulated_seconds": simulated_seconds,
+    "late_outputs": late_outputs,
+}
+if replay is not None:
+    cosim_stats.update({
+        "recorded_seconds": replay.recorded_ns / 1e9,
+        "mismatches": replay.mismatches,
+        "compared": replay.compared,
+    })
+write_cosim_stats(Path(m5.options.outdir), cosim_stats)
 print("Simulation ended cleanly")
@@ -1,12 +1,17 @@
 import argparse
 from pathlib import Path
 import sys, os
+import json
+import time
 
 sys.path.append(Path(__file__).parent.parent.as_posix())
 
 import m5
 from m5.objects import Root
 
+from utils.progress import ProgressReporter
+from utils.running_stats import RunningStats
+
 parser = argparse.ArgumentParser(
     description="Run a gem5 simulation with the demo stm32g4 MCU board in FS"
         " mode."
@@ -18,8 +23,163 @@ parser.add_argument(
     "--mode", type=str, default="fs", choices=["fs", "se"], help="Simulation mode"
 )
 
+parser.add_argument(
+    "--fast-forward", action="store_true",
+    help="(se mode only) Run on an atomic CPU until workbegin, warming the "
+        "ART caches, and switch to the detailed Cortex-M4 core for the ROI"
+)
+parser.add_argument(
+    "--switch-back", action="store_true",
+    help="With --fast-forward, switch back to the atomic CPU after each "
+        "workend"
+)
+parser.add_argument(
+    "--warmup-insts", type=int, default=10000,
+    help="With --switch-back, switch to the detailed core this many "
+        "instructions before the expected next workbegin, so that the ROI "
+        "starts with a warm pipeline and branch predictor"
+)
+
+parser.add_argument(
+    "--sample", action="store_true",
+    help="(se mode only) Estimate the ROI runtimes SMARTS-style: short "
+        "detailed windows separated by functional fast-forwarding that warms "
+        "the caches. Outside the ROIs the simulation fast-forwards."
+)
+parser.add_argument(
+    "--sample-period", type=int, default=100000,
+    help="Instructions from the start of one detailed window to the next"
+)
+parser.add_argument(
+    "--sample-window", type=int, default=1000,
+    help="Instructions measured in each detailed window"
+)
+parser.add_argument(
+    "--sample-warmup", type=int, default=200,
+    help="Detailed instructions simulated before each measured window to "
+        "warm up the pipeline"
+)
+parser.add_argument(
+    "--sample-confidence", type=float, default=0.95,
+    help="Confidence level of the interval reported with each estimate"
+)
+
+parser.add_argument(
+    "--trace", type=str, default="none", choices=["none", "text", "binary"],
+    help="Instruction trace recorded inside the ROIs: none, the ExecAll text "
+        "debug output, or a gzip-compressed protobuf trace per core "
+        "(inst-trace-<core>.pb.gz, read with utils/inst_trace.py)"
+)
+parser.add_argument(
+    "--trace-start-tick", type=int, default=None,
+    help="Only trace from this tick on"
+)
+parser.add_argument(
+    "--trace-end-tick", type=int, default=None,
+    help="Only trace before this tick"
+)
+
+parser.add_argument(
+    "--roi-target-error", type=float, default=None,
+    help="Stop the simulation once the confidence interval of the mean ROI "
+        "runtime is narrower than this fraction of the mean (e.g. 0.01)"
+)
+parser.add_argument(
+    "--roi-confidence", type=float, default=0.95,
+    help="Confidence level used with --roi-target-error"
+)
+parser.add_argument(
+    "--min-rois", type=int, default=5,
+    help="ROIs simulated before --roi-target-error can stop the simulation"
+)
+parser.add_argument(
+    "--max-rois", type=int, default=None,
+    help="Stop the simulation after this many ROIs"
+)
+
+parser.add_argument(
+    "--stats-groups", type=str, nargs="+", default=None,
+    help="Only dump the stats of these SimObjects (and their children) at "
+        "each workend, e.g. system.processor system.icache (default: all)"
+)
+parser.add_argument(
+    "--stats-format", type=str, default="text", choices=["text", "hdf5"],
+    help="Per-ROI stats output: gem5's text stats.txt, or stats.h5 through "
+        "gem5's HDF5 backend (requires gem5 built with HDF5, started with "
+        "--stats-file h5://stats.h5) instead"
+)
+
+parser.add_argument(
+    "--progress-interval", type=float, default=10,
+    help="Host seconds between progress records (0 disables them); the "
+        "simulation runs in bounded slices to emit them"
+)
+parser.add_argument(
+    "--progress-file", type=str, default=None,
+    help="JSON-lines progress file (default: progress.jsonl in the gem5 "
+        "output directory)"
+)
+
+# ==== board parameters (se mode only) ====
+parser.add_argument(
+    "--clock", type=str, default="100MHz", help="Core and bus clock frequency"
+)
+parser.add_argument(
+    "--flash-latency", type=str, default="40ns", help="Flash memory latency"
+)
+parser.add_argument(
+    "--icache-size", type=str, default="1KiB", help="ART I-cache size"
+)
+parser.add_argument(
+    "--icache-assoc", type=int, default=32, help="ART I-cache associativity"
+)
+parser.add_argument(
+    "--dcache-size", type=str, default="256B", help="ART D-cache size"
+)
+parser.add_argument(
+    "--dcache-assoc", type=int, default=8, help="ART D-cache associativity"
+)
+parser.add_argument(
+    "--fu-latency", type=str, nargs="+", default=[],
+    help="Functional unit latencies in cycles as OPCLASS=LATENCY, e.g. "
+        "IntMult=1 FloatDiv=16"
+)
+
 args = parser.parse_args()
 
+fu_latencies = {}
+for item in args.fu_latency:
+    op_class, _, latency = item.partition("=")
+    if not latency.isdigit():
+        parser.error(f"--fu-latency expects OPCLASS=LATENCY, got '{item}'")
+    fu_latencies[op_class] = int(latency)
+
+if args.fast_forward and args.mode != "se":
+    parser.error("--fast-forward is only supported in se mode")
+if args.switch_back and not args.fast_forward:
+    parser.error("--switch-back requires --fast-forward")
+if args.warmup_insts < 0:
+    parser.error("--warmup-insts must not be negative")
+if args.sample and args.mode != "se":
+    parser.error("--sample is only supported in se mode")
+if args.sample and \
+        args.sample_period <= args.sample_window + args.sample_warmup:
+    parser.error("--sample-period must be larger than --sample-window plus "
+                 "--sample-warmup")
+if args.min_rois < 2:
+    parser.error("--min-rois must be at least 2")
+if args.max_rois is not None and args.max_rois < 1:
+    parser.error("--max-rois must be at least 1")
+# gem5 opens its stats output from its own --stats-file before the script
+# runs; the script only checks that it matches the requested format
+HDF5_STATS_FILE = "stats.h5"
+if args.stats_format == "hdf5" and \
+        not m5.options.stats_file.startswith(f"h5://{HDF5_STATS_FILE}"):
+    parser.error(f"--stats-format hdf5 needs gem5 started with --stats-file "
+                 f"h5://{HDF5_STATS_FILE} (a gem5 option, before the script)")
+# sampling switches between the atomic and the detailed cores as well
+switchable = args.fast_forward or args.sample
+
 binary_path = Path(args.binary)
 if not binary_path.is_file():
     raise FileNotFoundError(f"Binary file '{binary_path.as_posix()}' does not "
@@ -30,9 +190,28 @@ if args.mode == "fs":
     board = STM32G4FSBoard()
 else:
     from board.se_STM32G4 import STM32G4SEBoard
-    board = STM32G4SEBoard()
+    board = STM32G4SEBoard(
+        clk_frequency=args.clock,
+        fast_forward=switchable,
+        flash_latency=args.flash_latency,
+        icache_size=args.icache_size,
+        icache_assoc=args.icache_assoc,
+        dcache_size=args.dcache_size,
+        dcache_assoc=args.dcache_assoc,
+        fu_latencies=fu_latencies,
+    )
 board.setup_workload(binary_path)
 system = board.get_system()
+if args.trace == "binary":
+    # InstPBTrace records every instruction executed while the ExecEnable
+    # debug flag is on, without formatting any text
+    from m5.objects import InstPBTrace
+    if switchable:
+        traced_cores = system.processor.get_detailed_cores()
+    else:
+        traced_cores = system.processor.get_cores()
+    for i, core in enumerate(traced_cores):
+        core.core.tracer = InstPBTrace(file_name=f"inst-trace-{i}.pb.gz")
 print("System created.")
 root = Root(full_system=True if args.mode == "fs" else False, system=system)
 print("Root created.")
@@ -42,58 +221,402 @@ if args.mode == "se":
     print("Setting up process memory mappings...")
     board.setup_process_mappings()
 
+# ==== stats output ====
+# written next to the stats: the tick range of every ROI, since the global
+# finalTick and simTicks are not part of a dump restricted to --stats-groups
+ROIS_FILE = "rois.json"
+
+def stats_roots():
+    if args.stats_groups is None:
+        return None
+    roots = []
+    for group in args.stats_groups:
+        obj = root
+        for name in group.split("."):
+            if not hasattr(obj, name):
+                raise ValueError(f"No SimObject '{group}' to dump stats of.")
+            obj = getattr(obj, name)
+        roots.append(obj)
+    return roots
+
+dump_roots = stats_roots()
+roi_ticks = []
+dump_seconds = 0.0
+# ==== end of stats output ====
+
 runtimes = []
+# runtimes of the ROIs that started on a cold detailed core (--fast-forward)
+cold_runtimes = []
+runtime_stats = RunningStats()
+# why the simulation stopped before the binary ended, if it did
+early_stop = None
 begin_tick = 0
 event_track = 0
+in_roi = False
+
+# ==== instruction trace ====
+TRACE_WINDOW_CAUSE = "trace window"
+for tick in [args.trace_start_tick, args.trace_end_tick]:
+    if args.trace != "none" and tick is not None and tick > m5.curTick():
+        m5.scheduleTickExitAbsolute(tick, TRACE_WINDOW_CAUSE)
+
+def update_trace():
+    # trace inside the ROIs, restricted to the requested tick window
+    if args.trace == "none":
+        return
+    active = in_roi
+    if args.trace_start_tick is not None and \
+            m5.curTick() < args.trace_start_tick:
+        active = False
+    if args.trace_end_tick is not None and \
+            m5.curTick() >= args.trace_end_tick:
+        active = False
+    flag = "ExecAll" if args.trace == "text" else "ExecEnable"
+    if active:
+        m5.debug.flags[flag].enable()
+    else:
+        m5.debug.flags[flag].disable()
+# ==== end of instruction trace ====
+
+# ==== fast-forward warmup ====
+# A core switched in at workbegin starts the ROI with a drained pipeline and
+# a cold branch predictor. After the first ROI the detailed core stays in
+# (warm), or with --switch-back it is switched in --warmup-insts instructions
+# before the next workbegin, predicted from the instructions between the
+# previous workend and workbegin. Every ROI records whether it started warm.
+WARMUP_CAUSE = "fast-forward warmup"
+ff_warming = args.fast_forward and not args.sample
+# atomic instructions from a workend to the next workbegin, once known
+gap_insts = None
+gap_start_insts = None
+roi_warm = False
+
+def atomic_insts():
+    return system.processor.get_cores()[0].core.totalInsts()
+
+def schedule_warmup():
+    global gap_start_insts
+    gap_start_insts = atomic_insts()
+    if gap_insts is not None and gap_insts > args.warmup_insts:
+        system.processor.get_cores()[0].core.scheduleInstStop(
+            0, gap_insts - args.warmup_insts, f"{WARMUP_CAUSE} {event_track}"
+        )
+
+def warmup_reached():
+    # a stop scheduled for an earlier gap is stale once that ROI has begun
+    if not in_roi and not system.processor.in_detailed():
+        system.processor.switch_to_detailed(system)
+        print("Switched to the detailed core to warm it up")
+# ==== end of fast-forward warmup ====
 
 # ==== define workbegin and workend reaction ====
 def workbegin_handler():
-    global begin_tick, event_track
+    global begin_tick, event_track, in_roi, gap_insts, roi_warm
     print(f"workbegin {event_track} called")
+    if ff_warming:
+        roi_warm = system.processor.in_detailed()
+        if gap_start_insts is not None and not roi_warm:
+            gap_insts = atomic_insts() - gap_start_insts
+        if not roi_warm:
+            system.processor.switch_to_detailed(system)
+            print("Switched to the detailed core (cold)")
     # reset stats at workbegin
     m5.stats.reset()
     print("Reset stats")
     begin_tick = m5.curTick()
+    if args.sample:
+        sample_roi_begin()
     print("Start Debug Flags")
     # m5.debug.flags["Fetch"].enable()
     # m5.debug.flags["CachePort"].enable()
     # m5.debug.flags["ARTCache"].enable()
-    m5.debug.flags["ExecAll"].enable()
+    in_roi = True
+    update_trace()
 
 def workend_handler():
-    global begin_tick, runtimes, event_track
+    global begin_tick, event_track, in_roi, dump_seconds, early_stop
     print(f"workend {event_track} called")
     # dump stats at workend
-    m5.stats.dump()
+    dump_start = time.perf_counter()
+    m5.stats.dump(dump_roots)
+    dump_seconds += time.perf_counter() - dump_start
     print("Dumped stats")
     end_tick = m5.curTick()
+    roi_ticks.append({"roi": event_track, "begin_tick": begin_tick,
+                      "end_tick": end_tick})
+    if ff_warming:
+        roi_ticks[-1]["warm"] = roi_warm
     runtime = end_tick - begin_tick
-    runtimes.append(runtime)
+    if args.sample:
+        runtime = sample_roi_end(runtime)
+        # the dumped simTicks include the fast-forwarded stretches; the
+        # results store takes the estimate from here
+        estimate = sampling_report[-1]
+        roi_ticks[-1].update({
+            "sampled": True,
+            "estimated_ticks": estimate["estimated_ticks"],
+            "ci_half_width_ticks": estimate["ci_half_width_ticks"],
+            "relative_error": estimate["relative_error"],
+        })
+    # a cold ROI would skew the average and the convergence of the warm ones
+    if not ff_warming or roi_warm:
+        runtimes.append(runtime)
+        runtime_stats.add(runtime)
+    else:
+        cold_runtimes.append(runtime)
     print(f"Runtime for this region: {runtime} ticks, "
                                             f"{runtime / 1000000000000:.6f} s")
+    if args.roi_target_error is not None and \
+            runtime_stats.count >= args.min_rois and \
+            runtime_stats.relative_half_width(args.roi_confidence) \
+            <= args.roi_target_error:
+        early_stop = "converged"
+    elif args.max_rois is not None and runtime_stats.count >= args.max_rois:
+        early_stop = "max ROIs"
     event_track += 1
     print("Stop Debug Flags")
     # m5.debug.flags["Fetch"].disable()
     # m5.debug.flags["CachePort"].disable()
     # m5.debug.flags["ARTCache"].disable()
-    m5.debug.flags["ExecAll"].disable()
+    in_roi = False
+    update_trace()
+    if args.switch_back:
+        system.processor.switch_to_fast(system)
+        print("Switched to the atomic core")
+        schedule_warmup()
 # ==== end of workbegin and workend reaction ====
 
+# ==== sampled simulation ====
+# Each ROI is simulated as a sequence of segments: a detailed warmup, a
+# measured detailed window and functional fast-forwarding up to the next
+# warmup. Segments end with instruction-count exits; every segment gets its
+# own exit cause so that a stop left pending by an earlier segment (e.g. one
+# cut short by workend) is recognized and ignored.
+sample_seq = 0
+sample_phase = None
+sample_cause = None
+segment_start_insts = 0
+segment_start_tick = 0
+roi_insts = 0
+roi_fast_forwarded = False
+roi_ticks_per_inst = None
+sampling_report = []
+
+def active_core():
+    if system.processor.in_detailed():
+        return system.processor.get_detailed_cores()[0].core
+    return system.processor.get_cores()[0].core
+
+def start_segment(phase, insts):
+    global sample_seq, sample_phase, sample_cause, segment_start_insts, \
+        segment_start_tick, roi_fast_forwarded
+    if phase == "fast":
+        system.processor.switch_to_fast(system)
+        roi_fast_forwarded = True
+    else:
+        system.processor.switch_to_detailed(system)
+    sample_seq += 1
+    sample_phase = phase
+    sample_cause = f"sample segment {sample_seq}"
+    core = active_core()
+    segment_start_insts = core.totalInsts()
+    segment_start_tick = m5.curTick()
+    core.scheduleInstStop(0, insts, sample_cause)
+
+def close_segment():
+    global roi_insts
+    insts = active_core().totalInsts() - segment_start_insts
+    roi_insts += insts
+    return insts
+
+def sample_segment_ended():
+    insts = close_segment()
+    if sample_phase == "warmup":
+        start_segment("window", args.sample_window)
+    elif sample_phase == "window":
+        if insts > 0:
+            roi_ticks_per_inst.add((m5.curTick() - segment_start_tick) / insts)
+        start_segment(
+            "fast",
+            args.sample_period - args.sample_window - args.sample_warmup
+        )
+    else:
+        start_segment("warmup", args.sample_warmup)
+
+def sample_roi_begin():
+    global roi_insts, roi_fast_forwarded, roi_ticks_per_inst
+    roi_insts = 0
+    roi_fast_forwarded = False
+    roi_ticks_per_inst = RunningStats()
+    start_segment("warmup", args.sample_warmup)
+
+def sample_roi_end(measured_ticks):
+    # returns the (estimated) runtime of the ROI in ticks
+    global sample_phase, sample_cause
+    close_segment()
+    sample_phase = None
+    sample_cause = None
+    system.processor.switch_to_fast(system)
+    windows = roi_ticks_per_inst.count
+    if not roi_fast_forwarded:
+        # the ROI ended before the first fast-forward, so it was simulated
+        # in detail from start to end and the measured runtime is exact
+        estimate = measured_ticks
+        half_width = 0.0
+    elif windows == 0:
+        # no measured window to extrapolate from: fall back to the measured
+        # ticks, which include the fast-forwarded stretches
+        estimate = measured_ticks
+        half_width = None
+    else:
+        estimate = roi_ticks_per_inst.mean * roi_insts
+        # a single window gives no variance and hence no interval
+        half_width = roi_ticks_per_inst.half_width(args.sample_confidence) \
+            * roi_insts if windows >= 2 else None
+    if half_width is None:
+        relative_error = None
+    else:
+        relative_error = half_width / estimate if estimate > 0 else 0.0
+    sampling_report.append({
+        "roi": event_track,
+        "instructions": roi_insts,
+        "windows": windows,
+        "exact": not roi_fast_forwarded,
+        "estimated_ticks": estimate,
+        "ci_half_width_ticks": half_width,
+        "relative_error": relative_error,
+        "confidence": args.sample_confidence,
+    })
+    if half_width is None:
+        print(f"Sampled estimate: {estimate:.0f} ticks without a confidence "
+              f"interval ({windows} window(s), {roi_insts} instructions"
+              + ("; measured ticks, not extrapolated)" if windows == 0
+                 else ")"))
+    else:
+        print(f"Sampled estimate: {estimate:.0f} +/- {half_width:.0f} ticks "
+              f"({relative_error * 100:.2f}% at "
+              f"{args.sample_confidence * 100:g}% confidence, {windows} "
+              f"window(s), {roi_insts} instructions)")
+    return estimate
+# ==== end of sampled simulation ====
+
+# ==== progress reporting ====
+SLICE_END_CAUSE = "simulate() limit reached"
+
+def committed_insts():
+    cores = list(system.processor.get_cores())
+    if switchable:
+        cores += system.processor.get_detailed_cores()
+    return sum(core.core.totalInsts() for core in cores)
+
+progress = None
+if args.progress_interval > 0:
+    progress_file = args.progress_file if args.progress_file else \
+        Path(m5.options.outdir) / "progress.jsonl"
+    progress = ProgressReporter(
+        progress_file, args.progress_interval, m5.curTick, committed_insts
+    )
+# ==== end of progress reporting ====
+
 # ==== start the simulation ====
+# host seconds spent simulating on the atomic (fast) and detailed cores
+host_seconds = {"fast": 0.0, "detailed": 0.0}
+
+def simulate():
+    if switchable and not system.processor.in_detailed():
+        phase = "fast"
+    else:
+        phase = "detailed"
+    host_start = time.perf_counter()
+    if progress is None:
+        exit_event = m5.simulate()
+    else:
+        # bounded slices, so that progress is reported while simulating
+        while True:
+            exit_event = m5.simulate(progress.slice_ticks())
+            if exit_event.getCause() != SLICE_END_CAUSE:
+                break
+            progress.maybe_report(roi=event_track, in_roi=in_roi,
+                                  phase=phase)
+    host_seconds[phase] += time.perf_counter() - host_start
+    return exit_event
+
 print("Beginning simulation!")
-exit_event = m5.simulate()
+exit_event = simulate()
 cause = exit_event.getCause()
 print(f"Exit cause: {cause}")
-while cause in ["workbegin", "workend"]:
+while cause in ["workbegin", "workend", TRACE_WINDOW_CAUSE] or \
+        cause.startswith("sample segment") or cause.startswith(WARMUP_CAUSE):
     if cause == "workbegin":
         workbegin_handler()
     elif cause == "workend":
         workend_handler()
-    exit_event = m5.simulate()
+    elif cause == TRACE_WINDOW_CAUSE:
+        update_trace()
+    elif cause == f"{WARMUP_CAUSE} {event_track}":
+        warmup_reached()
+    elif cause == sample_cause:
+        sample_segment_ended()
+    # any other "sample segment" or warmup cause is a stale stop of an
+    # earlier segment or gap
+    if early_stop is not None:
+        print(f"Stopping after {runtime_stats.count} ROI(s): {early_stop}")
+        break
+    exit_event = simulate()
     cause = exit_event.getCause()
 # ==== end of simulation ====
 
+if args.sample:
+    report_path = Path(m5.options.outdir) / "sampling.json"
+    with open(report_path, "w") as f:
+        json.dump(sampling_report, f, indent=2)
+    print(f"Sampling report written to {report_path.as_posix()}")
+
+with open(Path(m5.options.outdir) / ROIS_FILE, "w") as f:
+    json.dump(roi_ticks, f, indent=2)
+print(f"Host time dumping stats: {dump_seconds:.3f} s for "
+      f"{len(roi_ticks)} ROI(s)")
+
+if switchable:
+    print(f"Host time: {host_seconds['fast']:.3f} s fast-forwarding, "
+          f"{host_seconds['detailed']:.3f} s in detailed mode")
+
+if args.roi_target_error is not None or args.max_rois is not None:
+    # the statistics the simulation stopped on (or ended with)
+    roi_summary = {
+        "rois": runtime_stats.count,
+        "stopped": early_stop if early_stop is not None else "binary ended",
+        "mean_ticks": runtime_stats.mean,
+        "stdev_ticks": runtime_stats.stdev if runtime_stats.count > 1
+            else None,
+        "ci_half_width_ticks": runtime_stats.half_width(args.roi_confidence)
+            if runtime_stats.count > 1 else None,
+        "relative_error": runtime_stats.relative_half_width(
+            args.roi_confidence) if runtime_stats.count > 1 else None,
+        "confidence": args.roi_confidence,
+        "target_error": args.roi_target_error,
+        "max_rois": args.max_rois,
+    }
+    summary_path = Path(m5.options.outdir) / "roi-stats.json"
+    with open(summary_path, "w") as f:
+        json.dump(roi_summary, f, indent=2)
+    if runtime_stats.count > 1:
+        print(f"Mean ROI runtime: {runtime_stats.mean:.0f} +/- "
+              f"{roi_summary['ci_half_width_ticks']:.0f} ticks "
+              f"({roi_summary['relative_error'] * 100:.2f}% at "
+              f"{args.roi_confidence * 100:g}% confidence, "
+              f"{runtime_stats.count} ROIs, {roi_summary['stopped']})")
+    print(f"ROI statistics written to {summary_path.as_posix()}")
+
+if progress is not None:
+    progress.close(roi=event_track, exit_cause=cause,
+                   early_stop=early_stop)
+
 avg_tick = sum(runtimes) / len(runtimes) if len(runtimes) > 0 else 0
 print(f"Average runtime over {len(runtimes)} region(s): {avg_tick} ticks, "
-      f"{avg_tick / 1000000000000:.6f} s")
+      f"{avg_tick / 1000000000000:.6f} s"
+      + (" (warm ROIs only)" if ff_warming else ""))
+if cold_runtimes:
+    print(f"Cold ROI runtime(s), left out of the average: "
+          f"{', '.join(str(runtime) for runtime in cold_runtimes)} ticks")
 
@@ -0,0 +1,38 @@
+from pathlib import Path
+import sys
+
+sys.path.append(Path(__file__).parent.parent.as_posix())
+
+from utils.cosim_stats import exchange_rates, read_cosim_stats, write_cosim_stats
+
+
+def make_m5out(output_dir, server, stats=None):
+    # what gem5 -re -d <output_dir>/<server>-m5out leaves behind
+    m5out = output_dir / f"{server}-m5out"
+    m5out.mkdir()
+    (m5out / "simout.txt").write_text("Simulation ended cleanly\n")
+    (m5out / "simerr.txt").write_text("")
+    (m5out / "stats.txt").write_text("")
+    if stats is not None:
+        write_cosim_stats(m5out, stats)
+    return m5out
+
+
+def test_exchange_rates_from_m5out_layout(tmp_path):
+    make_m5out(tmp_path, "gem5-0", {"exchanges": 200, "cosim_seconds": 4.0,
+                                    "exchanges_per_second": 50.0})
+    make_m5out(tmp_path, "gem5-1", {"exchanges": 0, "cosim_seconds": 4.0,
+                                    "exchanges_per_second": 0.0})
+    # killed before it wrote its stats
+    make_m5out(tmp_path, "gem5-2")
+
+    rates = exchange_rates(tmp_path, ["gem5-0", "gem5-1", "gem5-2"])
+
+    assert rates == {"gem5-0": 50.0, "gem5-1": None, "gem5-2": None}
+
+
+def test_truncated_stats_are_ignored(tmp_path):
+    m5out = make_m5out(tmp_path, "gem5-0")
+    (m5out / "cosim-stats.json").write_text('{"exchanges": 2')
+
+    assert read_cosim_stats(m5out) is None
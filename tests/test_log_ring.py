@@ -0,0 +1,49 @@
+from pathlib import Path
+import mmap
+import struct
+import sys
+
+import pytest
+
+sys.path.append(Path(__file__).parent.parent.as_posix())
+
+import utils.log_ring as log_ring
+from utils.log_ring import MAGIC, LogRing, write_ring_image
+
+RING_SIZE = 64
+
+
+@pytest.fixture
+def segment(tmp_path, monkeypatch):
+    # a backing store with one page of other memory before the ring
+    monkeypatch.setattr(log_ring, "SHM_DIR", tmp_path)
+    image = write_ring_image(tmp_path / "log-ring.img", RING_SIZE)
+    path = tmp_path / "gem5-test"
+    path.write_bytes(b"\xaa" * mmap.PAGESIZE + image.read_bytes()
+                     + bytes(RING_SIZE - len(image.read_bytes())))
+    return path
+
+
+def test_enable_and_drain_at_the_ring_offset(segment):
+    ring = LogRing("/gem5-test", mmap.PAGESIZE, RING_SIZE)
+    ring.enable()
+    # the firmware appends "hi"
+    with open(segment, "r+b") as f:
+        f.seek(mmap.PAGESIZE + 16)
+        f.write(b"hi")
+        f.seek(mmap.PAGESIZE + 8)
+        f.write(struct.pack("<I", 2))
+
+    assert ring.drain() == b"hi"
+    ring.close()
+    header = segment.read_bytes()[mmap.PAGESIZE:mmap.PAGESIZE + 16]
+    assert struct.unpack("<IIII", header) == (MAGIC, RING_SIZE - 16, 2, 2)
+
+
+def test_enable_refuses_a_wrong_offset(segment):
+    ring = LogRing("/gem5-test", 0, RING_SIZE)
+    with pytest.raises(RuntimeError, match="No log ring at offset 0"):
+        ring.enable()
+    ring.close()
+    # nothing was written to the other memory
+    assert segment.read_bytes()[:16] == b"\xaa" * 16
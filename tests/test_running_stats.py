@@ -0,0 +1,32 @@
+from pathlib import Path
+import math
+import sys
+
+import pytest
+
+sys.path.append(Path(__file__).parent.parent.as_posix())
+
+from utils.running_stats import RunningStats, t_quantile
+
+
+@pytest.mark.parametrize("confidence, dof, expected", [
+    (0.95, 1, 12.7062),
+    (0.95, 2, 4.3027),
+    (0.95, 4, 2.7764),
+    (0.95, 9, 2.2622),
+    (0.99, 10, 3.1693),
+    (0.95, 30, 2.0423),
+    (0.95, 5000, 1.9600),
+])
+def test_t_quantile_matches_tables(confidence, dof, expected):
+    assert t_quantile(confidence, dof) == pytest.approx(expected, abs=1e-4)
+
+
+def test_half_width_uses_t_with_count_minus_one_dof():
+    stats = RunningStats()
+    for value in [10.0, 12.0, 11.0, 13.0, 9.0]:
+        stats.add(value)
+
+    assert stats.mean == 11.0
+    assert stats.half_width(0.95) == \
+        pytest.approx(2.7764 * stats.stdev / math.sqrt(5), abs=1e-3)
@@ -0,0 +1,90 @@
+from pathlib import Path
+import json
+import sys
+
+import numpy as np
+
+sys.path.append(Path(__file__).parent.parent.as_posix())
+
+from utils.stats_store import ResultsStore, rows_from_stats
+
+
+def dump(final_tick, sim_ticks, extra=""):
+    return (
+        "\n---------- Begin Simulation Statistics ----------\n"
+        f"finalTick {final_tick:>30} # Number of ticks from beginning of simulation (restored from checkpoints and never reset) (Tick)\n"
+        f"simTicks {sim_ticks:>31} # Number of ticks simulated (Tick)\n"
+        "hostSeconds                                   0.01 # Real time elapsed on the host (Second)\n"
+        f"{extra}"
+        "---------- End Simulation Statistics   ----------\n"
+    )
+
+
+def make_run(run_dir, with_rois=True):
+    # two ROIs, then the dump gem5 writes when the simulation exits
+    run_dir.mkdir()
+    (run_dir / "stats.txt").write_text(
+        dump(3000, 1000, "system.processor.cores.core.numCycles 100 # cycles\n")
+        + dump(7000, 2000)
+        + dump(9000, 2000)
+    )
+    if with_rois:
+        (run_dir / "rois.json").write_text(json.dumps([
+            {"roi": 0, "begin_tick": 2000, "end_tick": 3000, "warm": False},
+            {"roi": 1, "begin_tick": 5000, "end_tick": 7000, "warm": True},
+        ]))
+    return run_dir / "stats.txt"
+
+
+def test_exit_dump_is_not_a_roi(tmp_path):
+    rows = list(rows_from_stats("add", make_run(tmp_path / "m5out")))
+
+    assert len(rows) == 2
+    assert [(row["begin_tick"], row["end_tick"]) for row in rows] == \
+        [(2000, 3000), (5000, 7000)]
+    assert [row["warm"] for row in rows] == [False, True]
+
+
+def test_every_dump_is_a_row_without_rois_json(tmp_path):
+    rows = list(rows_from_stats("add", make_run(tmp_path / "m5out", False)))
+
+    assert [(row["begin_tick"], row["end_tick"]) for row in rows] == \
+        [(2000, 3000), (5000, 7000), (7000, 9000)]
+
+
+def test_query_fills_missing_stats_with_nan(tmp_path):
+    store = ResultsStore(tmp_path / "results")
+    assert store.ingest("add", make_run(tmp_path / "add-m5out")) == 2
+    assert store.ingest("mul", make_run(tmp_path / "mul-m5out"),
+                        patterns=["simTicks"]) == 2
+
+    result = store.query(["roi", "simTicks", "warm",
+                          "system.processor.cores.core.numCycles"])
+
+    assert list(result["roi"]) == [0, 1, 0, 1]
+    assert list(result["simTicks"]) == [1000, 2000, 1000, 2000]
+    assert list(result["warm"]) == [0, 1, 0, 1]
+    cycles = result["system.processor.cores.core.numCycles"]
+    assert cycles[0] == 100
+    assert np.isnan(cycles[1:]).all()
+
+
+def test_sampled_rois_carry_their_estimate(tmp_path):
+    stats_file = make_run(tmp_path / "m5out")
+    (tmp_path / "m5out" / "rois.json").write_text(json.dumps([
+        {"roi": 0, "begin_tick": 2000, "end_tick": 3000, "sampled": True,
+         "estimated_ticks": 900.0, "ci_half_width_ticks": 50.0,
+         "relative_error": 0.05},
+        {"roi": 1, "begin_tick": 5000, "end_tick": 7000, "sampled": True,
+         "estimated_ticks": 1900.0, "ci_half_width_ticks": None,
+         "relative_error": None},
+    ]))
+    store = ResultsStore(tmp_path / "results")
+    store.ingest("add", stats_file)
+
+    result = store.query(["sampled", "estimated_ticks", "ci_half_width_ticks"])
+
+    assert list(result["sampled"]) == [1, 1]
+    assert list(result["estimated_ticks"]) == [900, 1900]
+    assert result["ci_half_width_ticks"][0] == 50
+    assert np.isnan(result["ci_half_width_ticks"][1])
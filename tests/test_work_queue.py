@@ -0,0 +1,23 @@
+from pathlib import Path
+import sys
+
+sys.path.append(Path(__file__).parent.parent.as_posix())
+
+from utils.work_queue import WorkQueue
+
+
+def test_renew_fails_once_the_lease_is_broken(tmp_path, monkeypatch):
+    queue = WorkQueue(tmp_path / "queue")
+    queue.put("job", {"benchmark": "add"})
+    lease = queue.claim()
+    assert queue.renew(lease)
+
+    # another worker breaks the lease between the check and the heartbeat
+    original_holds = queue._holds
+    def holds_then_lose(job_id, token):
+        held = original_holds(job_id, token)
+        queue._lease(job_id).unlink()
+        return held
+    monkeypatch.setattr(queue, "_holds", holds_then_lose)
+
+    assert not queue.renew(lease)
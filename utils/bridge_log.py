@@ -0,0 +1,100 @@
+"""Compact recording of the bridge traffic of a co-simulation session.
+
+gem5-webots-script.py can record every message it receives from its
+controller (SETUP_TIMESTEP, COMPUTE_REQUEST) and every response it sends,
+and later replay the requests into BridgeIODevice without a controller,
+helper or socket. The file is an 8-byte magic followed by one record per
+message:
+
+    direction  u8   0: request (to gem5), 1: response (from gem5)
+    command    u16  bridge command
+    time       i64  ns since the first record (monotonic clock)
+    length     u32  payload length, followed by the payload
+
+Only the standard library is used, so that gem5's embedded Python can import
+this module.
+"""
+
+import struct
+import time
+from pathlib import Path
+from typing import Optional
+
+MAGIC = b"G5BRLOG1"
+REQUEST = 0
+RESPONSE = 1
+_RECORD = struct.Struct("<BHqI")
+
+
+class BridgeLogWriter:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "wb")
+        self._file.write(MAGIC)
+        self._start = None
+
+    def add(self, direction: int, command: int, data: bytes) -> None:
+        now = time.monotonic_ns()
+        if self._start is None:
+            self._start = now
+        self._file.write(_RECORD.pack(direction, command, now - self._start,
+                                      len(data)))
+        self._file.write(data)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_bridge_log(path: Path) -> list[tuple[int, int, int, bytes]]:
+    """All records of a log as (direction, command, time ns, payload)."""
+    with open(path, "rb") as f:
+        content = f.read()
+    if content[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"'{path}' is not a bridge log.")
+    records = []
+    offset = len(MAGIC)
+    while offset + _RECORD.size <= len(content):
+        direction, command, time_ns, length = \
+            _RECORD.unpack_from(content, offset)
+        offset += _RECORD.size
+        if offset + length > len(content):
+            # the session was killed while writing this record
+            break
+        records.append((direction, command, time_ns,
+                        content[offset:offset + length]))
+        offset += length
+    return records
+
+
+class BridgeReplay:
+    """Feeds the recorded requests back and checks the new responses."""
+
+    def __init__(self, path: Path):
+        records = read_bridge_log(path)
+        self.requests = [(command, data) for direction, command, _, data
+                         in records if direction == REQUEST]
+        self.responses = [data for direction, _, _, data in records
+                          if direction == RESPONSE]
+        # length of the recorded session
+        self.recorded_ns = records[-1][2] if records else 0
+        self._next_request = 0
+        self.compared = 0
+        self.mismatches = 0
+
+    def next_request(self) -> Optional[tuple[int, bytes]]:
+        """(command, payload) of the next request, or None at the end."""
+        if self._next_request >= len(self.requests):
+            return None
+        request = self.requests[self._next_request]
+        self._next_request += 1
+        return request
+
+    def check_response(self, data: bytes) -> bool:
+        """Compare a response with the recorded one at the same position."""
+        if self.compared >= len(self.responses):
+            return True
+        matches = self.responses[self.compared] == data
+        self.compared += 1
+        if not matches:
+            self.mismatches += 1
+        return matches
@@ -0,0 +1,48 @@
+"""Exchange counts of a co-simulation, written to its gem5 output directory.
+
+gem5-webots-script.py writes cosim-stats.json next to stats.txt when it
+exits: the number of bridge exchanges, the host seconds spent co-simulating
+and, for a replay, the recorded session length and the response mismatches.
+The Webots helper and replay-sessions.py read it back instead of scraping
+gem5's stdout.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+COSIM_STATS_FILE = "cosim-stats.json"
+
+
+def write_cosim_stats(m5out: Path, stats: dict) -> None:
+    with open(Path(m5out) / COSIM_STATS_FILE, "w") as f:
+        json.dump(stats, f, indent=2)
+
+
+def read_cosim_stats(m5out: Path) -> Optional[dict]:
+    """The stats of the run in `m5out`, or None if it wrote none."""
+    path = Path(m5out) / COSIM_STATS_FILE
+    if not path.is_file():
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        # the run was killed while writing it
+        return None
+
+
+def exchange_rates(output_dir: Path,
+                   servers: Iterable[str]) -> Dict[str, Optional[float]]:
+    """Exchanges per second of every server in <output_dir>/<server>-m5out.
+
+    None for a server whose run recorded no exchange.
+    """
+    rates = {}
+    for server in servers:
+        stats = read_cosim_stats(Path(output_dir) / f"{server}-m5out")
+        if stats is None or stats["exchanges"] == 0:
+            rates[server] = None
+        else:
+            rates[server] = stats["exchanges_per_second"]
+    return rates
@@ -0,0 +1,45 @@
+"""Build the co-simulation firmware before gem5 runs it.
+
+The repository ships a prebuilt firmware ELF that predates some firmware
+sources (see README.md). Where the ARM cross compiler is installed, the
+co-sim scripts rebuild it from its sources first, so that gem5 runs the
+current firmware; elsewhere they run the prebuilt one, and gem5 falls back
+to what that firmware supports.
+"""
+
+import shutil
+import subprocess
+from pathlib import Path
+
+# the compiler the firmware Makefile uses
+FIRMWARE_CC = "arm-none-eabi-gcc"
+
+
+def build_firmware(binary: Path) -> Path:
+    """Rebuild `binary` if it is a build/ output of a firmware Makefile.
+
+    Everything is rebuilt (make -B): a checkout gives the sources and the
+    prebuilt objects the same timestamps, so make alone could link stale
+    objects. Without the compiler, or for a binary outside such a tree, the
+    binary is used as is.
+    """
+    binary = Path(binary)
+    firmware_dir = binary.resolve().parent.parent
+    if binary.resolve().parent.name == "build" and \
+            (firmware_dir / "Makefile").is_file():
+        target = binary.resolve().relative_to(firmware_dir).as_posix()
+        if shutil.which(FIRMWARE_CC) is None or shutil.which("make") is None:
+            print(f"Warning: {FIRMWARE_CC} or make not found; running the "
+                  f"prebuilt '{binary.as_posix()}', which may predate the "
+                  "firmware sources")
+        else:
+            result = subprocess.run(["make", "-B", "-C",
+                                     firmware_dir.as_posix(), target])
+            if result.returncode != 0:
+                raise RuntimeError(f"Building '{target}' in "
+                                   f"'{firmware_dir.as_posix()}' failed with "
+                                   f"return code {result.returncode}.")
+    if not binary.is_file():
+        raise FileNotFoundError(f"Binary file '{binary.as_posix()}' does not "
+                                "exist.")
+    return binary
@@ -0,0 +1,133 @@
+"""Streaming reader for the binary instruction traces of run-binary.py.
+
+`run-binary.py --trace binary` attaches gem5's InstPBTrace to the detailed
+core, which writes a gzip-compressed stream of protobuf `Inst` messages
+(PC, tick, instruction type and memory accesses). This module decodes that
+stream in fixed-size chunks and hands every chunk back as NumPy arrays, so a
+trace of any length can be processed with bounded memory.
+
+Decoding uses the protobuf definitions generated by the gem5 build
+(build/ARM/proto/inst_pb2.py) and gem5's util/protolib.py.
+"""
+
+import sys
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+DEFAULT_GEM5_DIR = Path(__file__).parent.parent / "gem5"
+
+# value of the opclass column for instructions recorded without a type
+NO_OPCLASS = -1
+
+
+def _import_proto(gem5_dir: Optional[Path] = None):
+    gem5_dir = Path(gem5_dir) if gem5_dir is not None else DEFAULT_GEM5_DIR
+    for path in [gem5_dir / "util", gem5_dir / "build/ARM/proto"]:
+        if path.as_posix() not in sys.path:
+            sys.path.append(path.as_posix())
+    try:
+        import protolib
+        import inst_pb2
+    except ImportError as e:
+        raise ImportError(
+            f"Could not import gem5's protolib/inst_pb2 from "
+            f"'{gem5_dir.as_posix()}'. Build gem5 with protobuf support or "
+            "pass the gem5 directory explicitly."
+        ) from e
+    return protolib, inst_pb2
+
+
+def _in_range(value: int, value_range: Optional[tuple[int, int]]) -> bool:
+    # ranges are half open: [start, end)
+    return value_range is None or value_range[0] <= value < value_range[1]
+
+
+def _to_arrays(columns: dict[str, list]) -> dict[str, np.ndarray]:
+    return {
+        "pc": np.array(columns["pc"], dtype=np.uint64),
+        "tick": np.array(columns["tick"], dtype=np.uint64),
+        "opclass": np.array(columns["opclass"], dtype=np.int16),
+        "mem_addr": np.array(columns["mem_addr"], dtype=np.uint64),
+        "mem_size": np.array(columns["mem_size"], dtype=np.uint32),
+    }
+
+
+def _empty_columns() -> dict[str, list]:
+    return {"pc": [], "tick": [], "opclass": [], "mem_addr": [], "mem_size": []}
+
+
+def opclass_names(gem5_dir: Optional[Path] = None) -> dict[int, str]:
+    """Map the values of the opclass column to their names."""
+    _, inst_pb2 = _import_proto(gem5_dir)
+    enum = inst_pb2.Inst.DESCRIPTOR.fields_by_name["type"].enum_type
+    return {value.number: value.name for value in enum.values}
+
+
+def iter_trace(
+    trace_file: Path,
+    chunk_size: int = 1 << 16,
+    pc_range: Optional[tuple[int, int]] = None,
+    mem_range: Optional[tuple[int, int]] = None,
+    tick_range: Optional[tuple[int, int]] = None,
+    gem5_dir: Optional[Path] = None,
+) -> Iterator[dict[str, np.ndarray]]:
+    """Yield the trace in chunks of at most `chunk_size` instructions.
+
+    Every chunk is a dict with the columns pc, tick, opclass, mem_addr and
+    mem_size. mem_addr/mem_size describe the first memory access of the
+    instruction and are 0 for instructions without one. Instructions outside
+    `pc_range`, `tick_range` or (when given) without an access in
+    `mem_range` are skipped; all ranges are half open.
+    """
+    protolib, inst_pb2 = _import_proto(gem5_dir)
+    istream = protolib.openFileRd(Path(trace_file).as_posix())
+    try:
+        magic_number = istream.read(4).decode()
+        if magic_number != "gem5":
+            raise ValueError(f"'{Path(trace_file).as_posix()}' is not a gem5 "
+                             "protobuf trace.")
+        header = inst_pb2.InstHeader()
+        protolib.decodeMessage(istream, header)
+
+        columns = _empty_columns()
+        inst = inst_pb2.Inst()
+        while protolib.decodeMessage(istream, inst):
+            if not _in_range(inst.pc, pc_range) or \
+                    not _in_range(inst.tick, tick_range):
+                continue
+            mem_addr = 0
+            mem_size = 0
+            for mem_access in inst.mem_access:
+                if _in_range(mem_access.addr, mem_range):
+                    mem_addr = mem_access.addr
+                    mem_size = mem_access.size
+                    break
+            if mem_range is not None and mem_size == 0:
+                continue
+            columns["pc"].append(inst.pc)
+            columns["tick"].append(inst.tick)
+            columns["opclass"].append(
+                inst.type if inst.HasField("type") else NO_OPCLASS
+            )
+            columns["mem_addr"].append(mem_addr)
+            columns["mem_size"].append(mem_size)
+            if len(columns["pc"]) == chunk_size:
+                yield _to_arrays(columns)
+                columns = _empty_columns()
+        if len(columns["pc"]) > 0:
+            yield _to_arrays(columns)
+    finally:
+        istream.close()
+
+
+def load_trace(trace_file: Path, **kwargs) -> dict[str, np.ndarray]:
+    """Read a whole (filtered) trace into memory; see iter_trace()."""
+    chunks = list(iter_trace(trace_file, **kwargs))
+    if len(chunks) == 0:
+        return _to_arrays(_empty_columns())
+    return {
+        name: np.concatenate([chunk[name] for chunk in chunks])
+        for name in chunks[0]
+    }
@@ -0,0 +1,109 @@
+"""Host side of the firmware log ring.
+
+STM32G4FSBoard maps a small memory (system.log_ring) next to the bridge IO
+device. The co-sim firmware's write() for stdout/stderr appends to it with
+ordinary stores instead of one semihosting trap per character, and
+gem5-webots-script.py drains it between run-ahead periods, while the
+simulation is paused, by mapping the board's shared memory backing store.
+The ring starts with a header of four 32-bit little-endian words:
+
+    magic  BOARD_MAGIC from the board's memory image until the host drains
+           the ring, then MAGIC; the firmware falls back to semihosting
+           while it is not MAGIC
+    size   capacity of the data area in bytes
+    head   index in the data area where the firmware writes next
+    tail   index in the data area where the host reads next
+
+followed by the data area. head == tail means empty, and one byte stays free
+so that a full ring is told apart. A write that does not fit in the free
+space also goes through semihosting, so nothing is lost if the host falls
+behind.
+
+The host finds the ring in gem5's shared backing store at an offset computed
+from the memory layout. It only enables the ring once it has read
+BOARD_MAGIC (or MAGIC, in a ring restored from a checkpoint) there, so a
+wrong offset is reported instead of corrupting guest memory.
+
+Only the standard library is used, so that gem5's embedded Python can import
+this module.
+"""
+
+import mmap
+import struct
+from pathlib import Path
+
+MAGIC = 0x474E524C  # "LRNG"
+BOARD_MAGIC = 0x4D49524C  # "LRIM"
+_HEADER = struct.Struct("<IIII")
+_TAIL_OFFSET = 12
+SHM_DIR = Path("/dev/shm")
+
+
+def write_ring_image(path: Path, ring_size: int) -> Path:
+    """Raw memory image of an empty, disabled ring of `ring_size` bytes."""
+    path = Path(path)
+    path.write_bytes(_HEADER.pack(BOARD_MAGIC, ring_size - _HEADER.size, 0, 0))
+    return path
+
+
+class LogRing:
+    def __init__(self, shm_name: str, offset: int, ring_size: int):
+        """Map the ring at `offset` in the shared memory segment `shm_name`.
+
+        The segment exists once m5.instantiate() has returned.
+        """
+        if ring_size <= _HEADER.size:
+            raise ValueError(f"A log ring of {ring_size} bytes has no room "
+                             "for data.")
+        path = SHM_DIR / shm_name.lstrip("/")
+        with open(path, "r+b") as f:
+            # mmap offsets must be page aligned
+            start = offset - offset % mmap.PAGESIZE
+            self._map = mmap.mmap(f.fileno(), offset - start + ring_size,
+                                  offset=start)
+        self._base = offset - start
+        self._offset = offset
+        self.capacity = ring_size - _HEADER.size
+        self.drained_bytes = 0
+
+    def enable(self) -> None:
+        """Tell the firmware to log to the ring from now on.
+
+        A ring restored from a checkpoint keeps its head and tail, so that
+        anything logged before the checkpoint is drained too.
+        """
+        magic, size, head, tail = _HEADER.unpack_from(self._map, self._base)
+        if magic not in (BOARD_MAGIC, MAGIC) or size != self.capacity:
+            raise RuntimeError(
+                f"No log ring at offset {self._offset} of the shared memory "
+                f"(magic {magic:#010x}, size {size}): the backing store "
+                "layout differs from the computed one, or the checkpoint "
+                "predates the ring's memory image. Use --semihosting-log."
+            )
+        if magic == MAGIC:
+            return
+        _HEADER.pack_into(self._map, self._base, MAGIC, self.capacity, 0, 0)
+
+    def drain(self) -> bytes:
+        """Everything the firmware appended since the last drain.
+
+        Only call it while the simulation is paused.
+        """
+        _, _, head, tail = _HEADER.unpack_from(self._map, self._base)
+        if head >= self.capacity or tail >= self.capacity:
+            raise RuntimeError(f"Corrupt log ring: head {head}, tail {tail}, "
+                               f"capacity {self.capacity}.")
+        if head == tail:
+            return b""
+        data_start = self._base + _HEADER.size
+        if head > tail:
+            data = self._map[data_start + tail:data_start + head]
+        else:
+            data = self._map[data_start + tail:data_start + self.capacity] + \
+                self._map[data_start:data_start + head]
+        struct.pack_into("<I", self._map, self._base + _TAIL_OFFSET, head)
+        self.drained_bytes += len(data)
+        return data
+
+    def close(self) -> None:
+        self._map.close()
@@ -0,0 +1,122 @@
+"""JSON-lines progress stream of a running gem5 simulation.
+
+The gem5 scripts simulate in bounded slices and append one record per
+reporting interval to a progress file (progress.jsonl in the gem5 output
+directory by default), so a slow run can be told apart from a hung one while
+it is running. Every record is a JSON object with:
+
+  time          wall-clock time (seconds since the epoch)
+  host_seconds  host seconds since the reporter was created
+  tick          current simulated tick
+  insts         instructions committed by all cores so far
+  kips          thousands of instructions per host second since the last
+                record
+  rss_bytes     resident set size of the gem5 process
+
+plus whatever the script adds (e.g. the ROI index or the co-simulation step).
+The final record has "done": true. Only the standard library is used, so
+that gem5's embedded Python can import this module.
+"""
+
+import json
+import os
+import resource
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+# first slice of simulated ticks (1 ms), before the tick rate is known
+INITIAL_SLICE_TICKS = 10**9
+MIN_SLICE_TICKS = 10**6
+
+
+def current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # peak instead of current RSS where /proc is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ProgressReporter:
+    def __init__(
+        self,
+        path: Path,
+        interval: float,
+        get_tick: Callable[[], int],
+        get_insts: Callable[[], int],
+    ):
+        self.path = Path(path)
+        self.interval = interval
+        self._get_tick = get_tick
+        self._get_insts = get_insts
+        self._start = time.perf_counter()
+        self._last_time = self._start
+        self._last_tick = get_tick()
+        self._last_insts = get_insts()
+        self._slice_ticks = INITIAL_SLICE_TICKS
+        # line buffered, so that a reader sees every record right away
+        self._file = open(self.path, "w", buffering=1)
+
+    def slice_ticks(self) -> int:
+        """Ticks to simulate before checking whether a record is due.
+
+        Sized from the recent simulation rate to about half an interval.
+        """
+        return self._slice_ticks
+
+    def maybe_report(self, **extra) -> bool:
+        if time.perf_counter() - self._last_time < self.interval:
+            return False
+        self.report(**extra)
+        return True
+
+    def report(self, **extra) -> None:
+        now = time.perf_counter()
+        tick = self._get_tick()
+        insts = self._get_insts()
+        elapsed = now - self._last_time
+        kips = (insts - self._last_insts) / elapsed / 1000 if elapsed > 0 \
+            else 0.0
+        if elapsed > 0 and tick > self._last_tick:
+            ticks_per_second = (tick - self._last_tick) / elapsed
+            self._slice_ticks = max(
+                MIN_SLICE_TICKS, int(ticks_per_second * self.interval / 2)
+            )
+        record = {
+            "time": time.time(),
+            "host_seconds": now - self._start,
+            "tick": tick,
+            "insts": insts,
+            "kips": kips,
+            "rss_bytes": current_rss_bytes(),
+        }
+        record.update(extra)
+        self._file.write(json.dumps(record) + "\n")
+        self._last_time = now
+        self._last_tick = tick
+        self._last_insts = insts
+
+    def close(self, **extra) -> None:
+        self.report(done=True, **extra)
+        self._file.close()
+
+
+def read_last_record(path: Path) -> Optional[dict]:
+    """The last complete record of a progress file, or None."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 4096))
+            tail = f.read()
+    except OSError:
+        return None
+    # the last line may still be in the middle of being written
+    for line in reversed(tail.split(b"\n")):
+        try:
+            return json.loads(line)
+        except ValueError:
+            continue
+    return None
@@ -0,0 +1,146 @@
+"""Content-addressed cache of finished gem5 runs.
+
+A run is identified by the hash of everything that can change its result:
+the benchmark ELF, the gem5 binary, the gem5 script, every repository module
+the script imports (board, core and cache models, utils) and the script
+arguments. A finished run directory is stored
+under that key, and a later run with the same key is restored from the cache
+instead of being simulated again.
+"""
+
+import ast
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, Optional
+
+REPO_ROOT = Path(__file__).parent.parent
+
+# written last into a cache entry, an entry without it is incomplete
+COMPLETE_MARKER = ".complete"
+
+
+def hash_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _module_files(module: str) -> list[Path]:
+    # the files of a repository module and of the packages it runs the
+    # __init__.py of; empty for modules outside the repository (m5, gem5)
+    parts = module.split(".")
+    files = []
+    for i in range(1, len(parts) + 1):
+        path = REPO_ROOT.joinpath(*parts[:i])
+        if (path / "__init__.py").is_file():
+            files.append(path / "__init__.py")
+        elif path.with_suffix(".py").is_file() and i == len(parts):
+            files.append(path.with_suffix(".py"))
+        else:
+            return []
+    return files
+
+
+def repo_modules(script: Path) -> list[Path]:
+    """Every repository module that `script` imports, directly or not.
+
+    Imports inside functions and conditionals count as well, so the result
+    covers all modes of the script. A change in any of these files
+    invalidates every cached run of the script.
+    """
+    seen = set()
+    pending = [Path(script)]
+    while pending:
+        source = pending.pop()
+        tree = ast.parse(source.read_text(), filename=source.as_posix())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 \
+                    and node.module:
+                # the imported names may be submodules themselves
+                modules = [node.module] + [f"{node.module}.{alias.name}"
+                                           for alias in node.names]
+            else:
+                continue
+            for module in modules:
+                for path in _module_files(module):
+                    if path not in seen:
+                        seen.add(path)
+                        pending.append(path)
+    return sorted(seen)
+
+
+def run_key(file_digests: Iterable[str], script_args: Iterable[str]) -> str:
+    """Combine the digests of the inputs and the script arguments."""
+    digest = hashlib.sha256()
+    for file_digest in file_digests:
+        digest.update(file_digest.encode())
+        digest.update(b"\0")
+    for arg in script_args:
+        digest.update(arg.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _link_or_copy(src: str, dst: str) -> str:
+    # hard links keep the cache from doubling the disk usage of a sweep
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+class ResultCache:
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def lookup(self, key: str) -> Optional[Path]:
+        entry = self._entry(key)
+        if (entry / COMPLETE_MARKER).is_file():
+            return entry
+        return None
+
+    def restore(self, key: str, run_dir: Path) -> bool:
+        """Populate `run_dir` from the cache. Returns False on a miss."""
+        entry = self.lookup(key)
+        if entry is None:
+            return False
+        run_dir = Path(run_dir)
+        if run_dir.exists():
+            shutil.rmtree(run_dir)
+        shutil.copytree(
+            entry, run_dir, copy_function=_link_or_copy,
+            ignore=shutil.ignore_patterns(COMPLETE_MARKER)
+        )
+        return True
+
+    def store(self, key: str, run_dir: Path) -> Path:
+        """Save a finished `run_dir` under `key`.
+
+        The entry is assembled in a temporary directory and renamed into
+        place, so a sweep interrupted while storing never leaves behind an
+        entry that looks complete.
+        """
+        entry = self._entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(f".{key}.{os.getpid()}.tmp")
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        shutil.copytree(run_dir, tmp, copy_function=_link_or_copy)
+        (tmp / COMPLETE_MARKER).touch()
+        try:
+            tmp.rename(entry)
+        except OSError:
+            # another process stored the same key first
+            shutil.rmtree(tmp)
+        return entry
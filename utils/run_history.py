@@ -0,0 +1,118 @@
+"""Wall time and peak memory of earlier benchmark runs.
+
+The ubench helper records every simulated benchmark's host wall time and
+peak resident set size in a small JSON file (run-history.json in the output
+directory by default). Later sweeps read it back to start the longest runs
+first, to compute how close the sweep came to the best possible makespan and
+to admit only as many simulations as fit in a memory budget.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+HISTORY_FILE = "run-history.json"
+# expected peak RSS of a benchmark that never ran, if none has run yet
+DEFAULT_PEAK_RSS_BYTES = 1 << 30
+
+SIZE_SUFFIXES = {"k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+
+
+def parse_bytes(size: str) -> int:
+    """'64GiB', '512M', '1.5g' or a plain number of bytes."""
+    text = size.strip().lower()
+    for suffix in ["ib", "b"]:
+        if text.endswith(suffix) and len(text) > len(suffix):
+            text = text[:-len(suffix)]
+            break
+    multiplier = 1
+    if text and text[-1] in SIZE_SUFFIXES:
+        multiplier = SIZE_SUFFIXES[text[-1]]
+        text = text[:-1]
+    try:
+        return int(float(text) * multiplier)
+    except ValueError:
+        raise ValueError(f"Invalid size '{size}'.") from None
+
+
+class RunHistory:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._runs = {}
+        if self.path.is_file():
+            with open(self.path) as f:
+                self._runs = json.load(f)
+
+    def wall_seconds(self, benchmark: str) -> Optional[float]:
+        run = self._runs.get(benchmark)
+        return run["wall_seconds"] if run is not None else None
+
+    def peak_rss_bytes(self, benchmark: str) -> Optional[int]:
+        run = self._runs.get(benchmark)
+        return run["peak_rss_bytes"] if run is not None else None
+
+    def expected_peak_rss_bytes(self, benchmark: str,
+                                default: Optional[int] = None) -> int:
+        """Recorded peak RSS, else `default`, else the largest one recorded."""
+        peak = self.peak_rss_bytes(benchmark)
+        if peak is not None:
+            return peak
+        if default is not None:
+            return default
+        return max((run["peak_rss_bytes"] for run in self._runs.values()),
+                   default=DEFAULT_PEAK_RSS_BYTES)
+
+    def record(self, benchmark: str, wall_seconds: float,
+               peak_rss_bytes: int) -> None:
+        """Remember the latest wall time and the highest peak RSS seen."""
+        previous = self._runs.get(benchmark, {})
+        self._runs[benchmark] = {
+            "wall_seconds": wall_seconds,
+            "peak_rss_bytes": max(peak_rss_bytes,
+                                  previous.get("peak_rss_bytes", 0)),
+            "runs": previous.get("runs", 0) + 1,
+        }
+
+    def record_peak(self, benchmark: str, peak_rss_bytes: int) -> None:
+        """Remember the peak RSS of a failed (e.g. OOM-killed) run."""
+        previous = self._runs.get(benchmark)
+        if previous is None:
+            # no wall time yet, so the benchmark still counts as unknown for
+            # the longest-first order
+            self._runs[benchmark] = {"wall_seconds": None,
+                                     "peak_rss_bytes": peak_rss_bytes,
+                                     "runs": 0}
+        else:
+            previous["peak_rss_bytes"] = max(previous["peak_rss_bytes"],
+                                             peak_rss_bytes)
+
+    def save(self) -> None:
+        # written next to the file and renamed, so that an interrupted sweep
+        # never leaves a truncated history behind
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._runs, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def longest_first(benchmarks: Iterable[str],
+                  history: RunHistory) -> list[str]:
+    """Order benchmarks by decreasing recorded wall time.
+
+    Benchmarks without a record come first: they may be the longest, and
+    running them early keeps an unexpectedly long one from ending the sweep.
+    """
+    return sorted(
+        benchmarks,
+        key=lambda name: (history.wall_seconds(name) is not None,
+                          -(history.wall_seconds(name) or 0.0))
+    )
+
+
+def makespan_lower_bound(durations: list[float], processes: int) -> float:
+    """No schedule of these jobs on `processes` workers finishes sooner."""
+    if not durations:
+        return 0.0
+    return max(max(durations), sum(durations) / processes)
@@ -0,0 +1,92 @@
+"""Online sample statistics for simulation sampling and early termination.
+
+Only the standard library is used so that this module can be imported from
+the gem5 scripts as well as from the host-side helpers.
+"""
+
+import math
+from statistics import NormalDist
+
+# beyond this many degrees of freedom the t quantile is within 0.1% of the
+# normal one
+NORMAL_DOF = 1000
+
+
+def _t_central_probability(t: float, dof: int) -> float:
+    """P(|T| < t) for Student's t with `dof` (integer) degrees of freedom.
+
+    The finite series of Abramowitz & Stegun 26.7.3 and 26.7.4.
+    """
+    theta = math.atan(t / math.sqrt(dof))
+    cos2 = math.cos(theta) ** 2
+    if dof % 2 == 1:
+        term = total = 0.0
+        if dof > 1:
+            term = total = math.cos(theta)
+            for k in range(3, dof - 1, 2):
+                term *= cos2 * (k - 1) / k
+                total += term
+        return 2 / math.pi * (theta + math.sin(theta) * total)
+    term = total = 1.0
+    for k in range(2, dof - 1, 2):
+        term *= cos2 * (k - 1) / k
+        total += term
+    return math.sin(theta) * total
+
+
+def t_quantile(confidence: float, dof: int) -> float:
+    """t such that P(|T| < t) = `confidence` for Student's t with `dof`."""
+    if dof >= NORMAL_DOF:
+        return NormalDist().inv_cdf(0.5 + confidence / 2)
+    low, high = 0.0, 1.0
+    while _t_central_probability(high, dof) < confidence:
+        low, high = high, high * 2
+    for _ in range(100):
+        mid = (low + high) / 2
+        if _t_central_probability(mid, dof) < confidence:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+
+class RunningStats:
+    """Mean and variance of a stream of samples (Welford's algorithm).
+
+    Confidence intervals use Student's t distribution with count - 1
+    degrees of freedom, so they hold for a handful of samples as well.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        if self.count < 2:
+            return math.nan
+        return self._m2 / (self.count - 1)
+
+    @property
+    def stdev(self) -> float:
+        return math.sqrt(self.variance)
+
+    def half_width(self, confidence: float) -> float:
+        """Half width of the `confidence` interval of the mean."""
+        if self.count < 2:
+            return math.inf
+        t = t_quantile(confidence, self.count - 1)
+        return t * self.stdev / math.sqrt(self.count)
+
+    def relative_half_width(self, confidence: float) -> float:
+        """Half width of the confidence interval relative to the mean."""
+        if self.mean == 0:
+            return math.inf
+        return self.half_width(confidence) / abs(self.mean)
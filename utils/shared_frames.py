@@ -0,0 +1,82 @@
+"""Sensor frames handed from a controller to gem5 through shared memory.
+
+Large inputs (camera or lidar frames) do not need to travel through the
+bridge socket and a Python bytes object on the gem5 side. With
+--shared-input, the controller writes every frame into a file that both
+processes map (a file in /dev/shm is plain shared memory) and only sends a
+descriptor in its COMPUTE_REQUEST:
+
+    offset  u32  start of the frame in the file
+    length  u32  frame size in bytes
+
+gem5-webots-script.py maps the same file and hands BridgeIODevice a
+memoryview of the frame, so the only copy left is the one into the device's
+input buffer. The file is split into `slots` equal slots that the writer uses
+in turn. With an actuation delay of 1, gem5 answers a request before it
+copies the frame into the device, so the controller may already write the
+next frame at that point; it must go to another slot, hence at least two.
+
+Only the standard library is used, so that gem5's embedded Python can import
+this module.
+"""
+
+import mmap
+import struct
+from pathlib import Path
+
+DESCRIPTOR = struct.Struct("<II")
+DEFAULT_SLOTS = 2
+
+
+class SharedFrames:
+    def __init__(self, path: Path, slot_size: int = 0,
+                 slots: int = DEFAULT_SLOTS):
+        """Map `path`; a writer passes `slot_size` to create or resize it.
+
+        A reader passes no slot size and maps the file as it is.
+        """
+        self.path = Path(path)
+        self.slots = slots
+        self._next_slot = 0
+        if slot_size > 0:
+            if slots < 2:
+                raise ValueError("Shared frames need at least two slots.")
+            self.slot_size = slot_size
+            with open(self.path, "a+b") as f:
+                f.truncate(slot_size * slots)
+        with open(self.path, "r+b" if slot_size > 0 else "rb") as f:
+            size = f.seek(0, 2)
+            if size == 0:
+                raise ValueError(f"Shared frame file '{self.path}' is empty.")
+            self._map = mmap.mmap(
+                f.fileno(), size,
+                access=mmap.ACCESS_WRITE if slot_size > 0 else mmap.ACCESS_READ
+            )
+        if slot_size <= 0:
+            self.slot_size = size // slots
+        self._view = memoryview(self._map)
+
+    def write(self, frame: bytes) -> bytes:
+        """Copy a frame into the next slot; returns its descriptor."""
+        if len(frame) > self.slot_size:
+            raise ValueError(f"Frame of {len(frame)} bytes does not fit in a "
+                             f"{self.slot_size}-byte slot.")
+        offset = self._next_slot * self.slot_size
+        self._next_slot = (self._next_slot + 1) % self.slots
+        self._view[offset:offset + len(frame)] = frame
+        return DESCRIPTOR.pack(offset, len(frame))
+
+    def resolve(self, descriptor: bytes) -> memoryview:
+        """The frame a descriptor points at, without copying it."""
+        if len(descriptor) != DESCRIPTOR.size:
+            raise ValueError(f"Expected a {DESCRIPTOR.size}-byte frame "
+                             f"descriptor, got {len(descriptor)} bytes.")
+        offset, length = DESCRIPTOR.unpack(descriptor)
+        if offset + length > len(self._view):
+            raise ValueError(f"Frame at {offset}+{length} is outside the "
+                             f"{len(self._view)}-byte shared frame file.")
+        return self._view[offset:offset + length]
+
+    def close(self) -> None:
+        self._view.release()
+        self._map.close()
@@ -0,0 +1,308 @@
+"""Columnar store for per-ROI gem5 statistics.
+
+Every `m5.stats.dump()` in a run appends one text block to stats.txt. This
+module parses those blocks as a stream and keeps one row per ROI (benchmark,
+ROI index, tick range and the selected stats) in a NumPy .npz shard per
+benchmark, so comparing a sweep does not require re-reading the text dumps.
+Runs that wrote their stats through gem5's HDF5 backend (stats.h5) are read
+with h5py instead.
+"""
+
+from fnmatch import fnmatchcase
+import json
+import os
+import socket
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+BEGIN_MARKER = "---------- Begin Simulation Statistics ----------"
+END_MARKER = "---------- End Simulation Statistics   ----------"
+HDF5_SUFFIX = ".h5"
+# tick range of every ROI, written by run-binary.py next to its stats
+ROIS_FILE = "rois.json"
+
+# columns every row carries, independent of the selected stats
+BENCHMARK_COLUMN = "benchmark"
+ROI_COLUMN = "roi"
+BEGIN_TICK_COLUMN = "begin_tick"
+END_TICK_COLUMN = "end_tick"
+KEY_COLUMNS = [BENCHMARK_COLUMN, ROI_COLUMN, BEGIN_TICK_COLUMN, END_TICK_COLUMN]
+
+# stats kept when the caller does not ask for anything else; fnmatch-style
+# patterns so that they match both the stdlib single-core and multi-core names
+DEFAULT_STATS = [
+    "simTicks",
+    "simInsts",
+    "simOps",
+    "hostSeconds",
+    "system.processor.cores*.core.numCycles",
+    "system.processor.cores*.core.committedInsts",
+    "system.processor.cores*.core.cpi",
+    "system.icache.overallHits::total",
+    "system.icache.overallMisses::total",
+    "system.dcache.overallHits::total",
+    "system.dcache.overallMisses::total",
+]
+
+
+def iter_hdf5_dumps(stats_file: Path) -> Iterator[dict[str, float]]:
+    """Yield one {stat name: value} dict per dump in a gem5 stats.h5 file.
+
+    Every stat is a dataset whose first axis is the dump. Vector stats keep
+    their first element, like the text dumps of distributions; their
+    elements are also kept as `<name>::<index>`.
+    """
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError("Reading HDF5 stats requires h5py "
+                          "(pip install h5py).") from None
+    datasets = {}
+    with h5py.File(stats_file, "r") as f:
+        def collect(name, obj):
+            if isinstance(obj, h5py.Dataset) and obj.ndim >= 1:
+                datasets[name.replace("/", ".")] = obj[()]
+        f.visititems(collect)
+    num_dumps = max((len(values) for values in datasets.values()), default=0)
+    for i in range(num_dumps):
+        dump = {}
+        for name, values in datasets.items():
+            if i >= len(values):
+                continue
+            value = np.asarray(values[i], dtype=np.float64).ravel()
+            if value.size == 0:
+                continue
+            dump[name] = float(value[0])
+            if value.size > 1:
+                for j, element in enumerate(value):
+                    dump[f"{name}::{j}"] = float(element)
+        yield dump
+
+
+def iter_stats_dumps(stats_file: Path) -> Iterator[dict[str, float]]:
+    """Yield one {stat name: value} dict per dump block in a stats.txt file.
+
+    Only the first value of every line is kept (for distributions that is
+    the sample count of the bucket). Lines whose value is not numeric are
+    skipped.
+    """
+    dump = None
+    with open(stats_file, "r") as f:
+        for line in f:
+            if line.startswith(BEGIN_MARKER):
+                dump = {}
+                continue
+            if line.startswith(END_MARKER):
+                if dump is not None:
+                    yield dump
+                dump = None
+                continue
+            if dump is None:
+                continue
+            fields = line.split(maxsplit=2)
+            if len(fields) < 2:
+                continue
+            try:
+                dump[fields[0]] = float(fields[1])
+            except ValueError:
+                pass
+
+
+def _select(dump: dict[str, float], patterns: list[str]) -> dict[str, float]:
+    selected = {}
+    for pattern in patterns:
+        if pattern in dump:
+            selected[pattern] = dump[pattern]
+            continue
+        for name, value in dump.items():
+            if fnmatchcase(name, pattern):
+                selected[name] = value
+    return selected
+
+
+def rows_from_stats(
+    benchmark: str,
+    stats_file: Path,
+    patterns: Optional[list[str]] = None,
+    params: Optional[dict] = None,
+) -> Iterator[dict]:
+    """Turn every ROI dump of `stats_file` into a row of the results table.
+
+    `params` are constant columns added to every row, e.g. the parameters of
+    a design-space point.
+
+    gem5 dumps the stats once more when the simulation exits, after the last
+    workend. With the rois.json that run-binary.py writes, only the dumps of
+    the ROIs it lists are kept, with their tick ranges, and the other fields
+    of every ROI (e.g. "warm") become columns. Without it, every dump is a
+    row.
+    """
+    patterns = DEFAULT_STATS if patterns is None else patterns
+    stats_file = Path(stats_file)
+    if stats_file.suffix == HDF5_SUFFIX:
+        dumps = iter_hdf5_dumps(stats_file)
+    else:
+        dumps = iter_stats_dumps(stats_file)
+    rois_file = stats_file.with_name(ROIS_FILE)
+    rois = None
+    if rois_file.is_file():
+        with open(rois_file) as f:
+            rois = json.load(f)
+    for i, dump in enumerate(dumps):
+        if rois is not None:
+            if i >= len(rois):
+                # the exit dump
+                break
+            row = {
+                BENCHMARK_COLUMN: benchmark,
+                ROI_COLUMN: rois[i].get("roi", i),
+                BEGIN_TICK_COLUMN: rois[i]["begin_tick"],
+                END_TICK_COLUMN: rois[i]["end_tick"],
+            }
+            # null fields (e.g. no confidence interval) are left out, and
+            # hence stored as NaN
+            row.update({name: value for name, value in rois[i].items()
+                        if name not in row and value is not None})
+        else:
+            end_tick = int(dump.get("finalTick", 0))
+            # stats are reset at workbegin so simTicks is the length of the
+            # ROI
+            begin_tick = end_tick - int(dump.get("simTicks", 0))
+            row = {
+                BENCHMARK_COLUMN: benchmark,
+                ROI_COLUMN: i,
+                BEGIN_TICK_COLUMN: begin_tick,
+                END_TICK_COLUMN: end_tick,
+            }
+        if params is not None:
+            row.update(params)
+        row.update(_select(dump, patterns))
+        yield row
+
+
+def _to_columns(rows: list[dict]) -> dict[str, np.ndarray]:
+    names = list(KEY_COLUMNS)
+    for row in rows:
+        for name in row:
+            if name not in names:
+                names.append(name)
+    columns = {
+        BENCHMARK_COLUMN: np.array([row[BENCHMARK_COLUMN] for row in rows],
+                                   dtype=np.str_),
+        ROI_COLUMN: np.array([row[ROI_COLUMN] for row in rows],
+                             dtype=np.int64),
+        BEGIN_TICK_COLUMN: np.array([row[BEGIN_TICK_COLUMN] for row in rows],
+                                    dtype=np.int64),
+        END_TICK_COLUMN: np.array([row[END_TICK_COLUMN] for row in rows],
+                                  dtype=np.int64),
+    }
+    for name in names[len(KEY_COLUMNS):]:
+        if any(isinstance(row.get(name), str) for row in rows):
+            # string parameters, e.g. "100MHz"
+            columns[name] = np.array(
+                [str(row.get(name, "")) for row in rows], dtype=np.str_
+            )
+            continue
+        # a stat missing in some ROI is stored as NaN
+        columns[name] = np.array(
+            [row.get(name, np.nan) for row in rows], dtype=np.float64
+        )
+    return columns
+
+
+class ResultsStore:
+    """A directory of per-benchmark .npz shards forming one results table.
+
+    Each shard is written once, when its run finishes, so several helper
+    processes can ingest into the same store without locking. Queries open
+    the shards lazily and only read the columns that were asked for.
+    """
+
+    def __init__(self, store_dir: Path):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+
+    def _shard(self, benchmark: str) -> Path:
+        return self.store_dir / f"{benchmark}.npz"
+
+    def has_shard(self, shard: str) -> bool:
+        return self._shard(shard).is_file()
+
+    def ingest(
+        self,
+        benchmark: str,
+        stats_file: Path,
+        patterns: Optional[list[str]] = None,
+        params: Optional[dict] = None,
+        shard: Optional[str] = None,
+    ) -> int:
+        """Parse `stats_file` and (re)write the shard of `benchmark`.
+
+        A sweep runs every benchmark several times; it names the shard of
+        each run with `shard` and tags its rows with the `params` of the run.
+        Returns the number of ROIs stored.
+        """
+        rows = list(rows_from_stats(benchmark, stats_file, patterns, params))
+        shard = self._shard(benchmark if shard is None else shard)
+        if len(rows) == 0:
+            shard.unlink(missing_ok=True)
+            return 0
+        # write to a temporary file first so that a reader never sees a
+        # partially written shard; named per process, as queue workers on
+        # several hosts may ingest the same run
+        tmp = shard.with_name(
+            f".{shard.name}.{socket.gethostname()}.{os.getpid()}.tmp"
+        )
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **_to_columns(rows))
+        tmp.replace(shard)
+        return len(rows)
+
+    def benchmarks(self) -> list[str]:
+        """Names of the shards: the benchmarks, or the sweep's shard names."""
+        return sorted(p.stem for p in self.store_dir.glob("*.npz"))
+
+    def columns(self) -> list[str]:
+        """List every column present in at least one shard."""
+        names = list(KEY_COLUMNS)
+        for benchmark in self.benchmarks():
+            with np.load(self._shard(benchmark)) as shard:
+                for name in shard.files:
+                    if name not in names:
+                        names.append(name)
+        return names
+
+    def query(
+        self,
+        columns: Iterable[str],
+        benchmarks: Optional[Iterable[str]] = None,
+    ) -> dict[str, np.ndarray]:
+        """Load `columns` for `benchmarks` (all of them by default).
+
+        Columns that a shard does not have are filled with NaN for that
+        shard's rows.
+        """
+        columns = list(columns)
+        if benchmarks is None:
+            benchmarks = self.benchmarks()
+        parts = {name: [] for name in columns}
+        for benchmark in benchmarks:
+            shard_path = self._shard(benchmark)
+            if not shard_path.is_file():
+                raise FileNotFoundError(
+                    f"No results for benchmark '{benchmark}' in "
+                    f"'{self.store_dir.as_posix()}'."
+                )
+            with np.load(shard_path) as shard:
+                num_rows = len(shard[ROI_COLUMN])
+                for name in columns:
+                    if name in shard.files:
+                        parts[name].append(shard[name])
+                    else:
+                        parts[name].append(np.full(num_rows, np.nan))
+        return {
+            name: np.concatenate(arrays) if len(arrays) > 0 else np.array([])
+            for name, arrays in parts.items()
+        }
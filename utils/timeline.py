@@ -0,0 +1,210 @@
+"""Wall-clock timeline of the gem5-Webots co-simulation loop.
+
+Every process of the co-simulation (the gem5 scripts, the players
+controllers and the helper) can record the phases of each control step as
+spans into a `.spans` text file: one line per span with its name, the index
+of the bridge exchange (or step) it belongs to, and its start and end in
+nanoseconds of the monotonic clock, which all processes on a host share:
+
+    gem5.simulate 41 1234567890 1234601234
+
+This module records such spans with little overhead, merges the files of a
+run into a Chrome trace / Perfetto JSON file and summarizes each phase as a
+latency histogram. It derives the bridge transit spans by matching a
+controller's exchange with the gem5 instance that served it. Only the
+standard library is used, so that gem5's embedded Python can import it.
+"""
+
+import json
+import math
+import time
+from pathlib import Path
+from typing import Optional
+
+SPANS_SUFFIX = ".spans"
+# written by the helper: robot (controller) name -> gem5 server name
+PAIRS_FILE = "pairs.json"
+
+# span names shared with players.cpp
+CONTROLLER_EXCHANGE = "controller.exchange"
+GEM5_WAIT = "gem5.wait"
+GEM5_RESPOND = "gem5.respond"
+GEM5_HANDLE = "gem5.handle"
+GEM5_SIMULATE = "gem5.simulate"
+BRIDGE_REQUEST = "bridge.request"
+BRIDGE_RESPONSE = "bridge.response"
+# points in time rather than phases
+INSTANTS = {GEM5_RESPOND}
+
+
+class SpanRecorder:
+    """Buffers spans in memory and writes them out when closed."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._spans = []
+
+    @staticmethod
+    def now() -> int:
+        return time.monotonic_ns()
+
+    def add(self, name: str, index: int, start: int,
+            end: Optional[int] = None) -> None:
+        self._spans.append(
+            (name, index, start, time.monotonic_ns() if end is None else end)
+        )
+
+    def close(self) -> None:
+        with open(self.path, "w") as f:
+            for name, index, start, end in self._spans:
+                f.write(f"{name} {index} {start} {end}\n")
+        self._spans = []
+
+
+def load_spans(spans_file: Path) -> list[tuple[str, int, int, int]]:
+    spans = []
+    with open(spans_file) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) != 4:
+                continue
+            spans.append((fields[0], int(fields[1]), int(fields[2]),
+                          int(fields[3])))
+    return spans
+
+
+def load_run(timeline_dir: Path) -> dict[str, list[tuple[str, int, int, int]]]:
+    """Spans of every process of a run, by process name (file stem)."""
+    return {
+        spans_file.stem: load_spans(spans_file)
+        for spans_file in sorted(Path(timeline_dir).glob(f"*{SPANS_SUFFIX}"))
+    }
+
+
+def bridge_spans(controller_spans, gem5_spans):
+    """Transit spans of the bridge between a controller and its gem5.
+
+    The request transit ends when gem5 received the exchange (end of its
+    wait), the response transit starts when gem5 sent its response.
+    """
+    received = {index: end for name, index, _, end in gem5_spans
+                if name == GEM5_WAIT}
+    responded = {index: start for name, index, start, _ in gem5_spans
+                 if name == GEM5_RESPOND}
+    spans = []
+    for name, index, start, end in controller_spans:
+        if name != CONTROLLER_EXCHANGE:
+            continue
+        if index in received and received[index] >= start:
+            spans.append((BRIDGE_REQUEST, index, start, received[index]))
+        if index in responded and end >= responded[index]:
+            spans.append((BRIDGE_RESPONSE, index, responded[index], end))
+    return spans
+
+
+def with_bridge_spans(run, pairs: dict[str, str]):
+    run = dict(run)
+    for robot, server in pairs.items():
+        if robot in run and server in run:
+            run[f"bridge-{robot}"] = bridge_spans(run[robot], run[server])
+    return run
+
+
+def load_pairs(timeline_dir: Path) -> dict[str, str]:
+    pairs_file = Path(timeline_dir) / PAIRS_FILE
+    if not pairs_file.is_file():
+        return {}
+    with open(pairs_file) as f:
+        return json.load(f)
+
+
+def to_chrome_trace(run) -> dict:
+    """Chrome trace event format, one process (track) per spans file."""
+    events = []
+    for pid, (process, spans) in enumerate(sorted(run.items())):
+        events.append({"name": "process_name", "ph": "M", "pid": pid,
+                       "tid": 0, "args": {"name": process}})
+        for name, index, start, end in spans:
+            if name in INSTANTS:
+                events.append({"name": name, "ph": "i", "s": "t", "pid": pid,
+                               "tid": 0, "ts": start / 1000,
+                               "args": {"index": index}})
+                continue
+            events.append({
+                "name": name,
+                "ph": "X",
+                "pid": pid,
+                "tid": 0,
+                "ts": start / 1000,
+                "dur": (end - start) / 1000,
+                "args": {"index": index},
+            })
+    return {"traceEvents": events, "displayTimeUnit": "ns"}
+
+
+def percentile(sorted_values: list[int], fraction: float) -> int:
+    position = min(len(sorted_values) - 1,
+                   max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[position]
+
+
+def phase_histograms(run) -> dict[str, dict]:
+    """Latency summary of every span name over all processes.
+
+    Buckets are powers of two in microseconds: bucket k counts the spans
+    lasting [2^(k-1), 2^k) us (bucket 0: below 1 us).
+    """
+    durations = {}
+    for spans in run.values():
+        for name, _, start, end in spans:
+            if name in INSTANTS:
+                continue
+            durations.setdefault(name, []).append(end - start)
+    summary = {}
+    for name, values in sorted(durations.items()):
+        values.sort()
+        buckets = {}
+        for value in values:
+            bucket = int(math.log2(value / 1000)) + 1 if value >= 1000 else 0
+            buckets[bucket] = buckets.get(bucket, 0) + 1
+        summary[name] = {
+            "count": len(values),
+            "total_ns": sum(values),
+            "mean_ns": sum(values) / len(values),
+            "p50_ns": percentile(values, 0.5),
+            "p90_ns": percentile(values, 0.9),
+            "p99_ns": percentile(values, 0.99),
+            "max_ns": values[-1],
+            "histogram_us_log2": {str(k): buckets[k] for k in sorted(buckets)},
+        }
+    return summary
+
+
+def export_run(timeline_dir: Path, trace_file: Optional[Path] = None) -> dict:
+    """Write the Chrome trace and the histograms of a run; returns the latter.
+
+    The trace goes to `trace_file` (default: timeline.json in the directory)
+    and the histograms to histograms.json next to it.
+    """
+    timeline_dir = Path(timeline_dir)
+    run = with_bridge_spans(load_run(timeline_dir), load_pairs(timeline_dir))
+    trace_file = Path(trace_file) if trace_file is not None \
+        else timeline_dir / "timeline.json"
+    with open(trace_file, "w") as f:
+        json.dump(to_chrome_trace(run), f)
+    histograms = phase_histograms(run)
+    with open(trace_file.with_name("histograms.json"), "w") as f:
+        json.dump(histograms, f, indent=2)
+    return histograms
+
+
+def format_histograms(histograms: dict[str, dict]) -> str:
+    lines = [f"{'phase':<26} {'count':>8} {'mean':>10} {'p50':>10} "
+             f"{'p90':>10} {'p99':>10} {'max':>10}  (us)"]
+    for name, summary in histograms.items():
+        lines.append(
+            f"{name:<26} {summary['count']:>8} "
+            + " ".join(f"{summary[key] / 1000:>10.1f}" for key in
+                       ["mean_ns", "p50_ns", "p90_ns", "p99_ns", "max_ns"])
+        )
+    return "\n".join(lines)
@@ -0,0 +1,174 @@
+"""Minimal reader/writer for the robots of a Webots world (.wbt) file.
+
+Only the top-level Robot nodes are looked at: their `name` and `controller`
+fields (at depth 1 of the node) identify the robot and the controller it
+runs. Nested nodes, e.g. the motors and sensors, have their own `name` fields
+which are ignored.
+"""
+
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# strings, comments, braces/brackets and every other run of characters
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|#[^\n]*|[{}\[\]]|[^\s{}\[\]"#]+')
+
+# Webots' default name of a Robot node without a name field
+DEFAULT_ROBOT_NAME = "robot"
+
+
+def _tokens(text: str):
+    return [m for m in _TOKEN.finditer(text) if not m.group().startswith("#")]
+
+
+def _matching_close(tokens, open_index: int) -> int:
+    depth = 0
+    for i in range(open_index, len(tokens)):
+        token = tokens[i].group()
+        if token in ("{", "["):
+            depth += 1
+        elif token in ("}", "]"):
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError("Unbalanced braces in the world file.")
+
+
+def _top_level_robots(tokens):
+    # yields (start token, open brace token, close brace token) of every
+    # top-level Robot node, including an optional `DEF <id>` prefix
+    i = 0
+    while i < len(tokens):
+        token = tokens[i].group()
+        if token in ("{", "["):
+            i = _matching_close(tokens, i) + 1
+            continue
+        if token == "Robot" and i + 1 < len(tokens) \
+                and tokens[i + 1].group() == "{":
+            start = i - 2 if i >= 2 and tokens[i - 2].group() == "DEF" else i
+            close = _matching_close(tokens, i + 1)
+            yield start, i + 1, close
+            i = close + 1
+            continue
+        i += 1
+
+
+def _fields(tokens, open_index: int, close_index: int):
+    # depth-1 fields of a node: field name -> index of its first value token
+    fields = {}
+    i = open_index + 1
+    while i < close_index:
+        token = tokens[i].group()
+        if token in ("{", "["):
+            i = _matching_close(tokens, i) + 1
+            continue
+        if re.match(r"[A-Za-z_]\w*$", token) and token not in fields:
+            fields[token] = i + 1
+        i += 1
+    return fields
+
+
+def _string_field(tokens, fields, name: str) -> Optional[str]:
+    if name not in fields:
+        return None
+    value = tokens[fields[name]].group()
+    if not value.startswith('"'):
+        return None
+    return value[1:-1]
+
+
+def discover_robots(world_file: Path,
+                    controller: Optional[str] = "players") -> List[str]:
+    """Names of the top-level robots of a world, in file order.
+
+    Only robots running `controller` are returned, or every robot if it is
+    None.
+    """
+    text = Path(world_file).read_text()
+    tokens = _tokens(text)
+    robots = []
+    for _, open_index, close_index in _top_level_robots(tokens):
+        fields = _fields(tokens, open_index, close_index)
+        if controller is not None \
+                and _string_field(tokens, fields, "controller") != controller:
+            continue
+        name = _string_field(tokens, fields, "name")
+        robots.append(name if name is not None else DEFAULT_ROBOT_NAME)
+    if len(set(robots)) != len(robots):
+        raise ValueError(f"Robot names in '{Path(world_file).as_posix()}' "
+                         "are not unique.")
+    return robots
+
+
+def grid_positions(count: int, spacing: float) -> List[Tuple[float, float]]:
+    """`count` positions on a square grid centered on the origin."""
+    side = 1
+    while side * side < count:
+        side += 1
+    offset = (side - 1) * spacing / 2
+    return [((i % side) * spacing - offset, (i // side) * spacing - offset)
+            for i in range(count)]
+
+
+def replicate_robots(world_file: Path, count: int, spacing: float = 0.12,
+                     controller: str = "players") -> str:
+    """Text of the world with `count` copies of its first robot.
+
+    Every robot running `controller` is replaced by copies of the first one,
+    named R0..R<count-1> and placed on a grid on the floor.
+    """
+    text = Path(world_file).read_text()
+    tokens = _tokens(text)
+    robots = []
+    for start, open_index, close_index in _top_level_robots(tokens):
+        fields = _fields(tokens, open_index, close_index)
+        if _string_field(tokens, fields, "controller") == controller:
+            robots.append((start, open_index, close_index, fields))
+    if not robots:
+        raise ValueError(f"No robot with controller '{controller}' in "
+                         f"'{Path(world_file).as_posix()}'.")
+
+    start, open_index, close_index, fields = robots[0]
+    template_start = tokens[start].start()
+    template_end = tokens[close_index].end()
+    # replaced spans of the template, relative to its start
+    edits = []
+    if "name" in fields:
+        value = tokens[fields["name"]]
+        edits.append((value.start(), value.end(), '"{name}"'))
+    else:
+        brace = tokens[open_index]
+        edits.append((brace.end(), brace.end(), '\n  name "{name}"'))
+    if "translation" in fields:
+        first = tokens[fields["translation"]]
+        last = tokens[fields["translation"] + 2]
+        z = last.group()
+        edits.append((first.start(), last.end(), "{x:g} {y:g} " + z))
+    else:
+        brace = tokens[open_index]
+        edits.append((brace.end(), brace.end(), "\n  translation {x:g} {y:g} 0"))
+    # DEF names must be unique, the copies drop it
+    if start != open_index - 1:
+        edits.append((tokens[start].start(), tokens[open_index - 1].start(),
+                      ""))
+    edits.sort()
+
+    pattern = ""
+    cursor = template_start
+    for edit_start, edit_end, replacement in edits:
+        pattern += text[cursor:edit_start].replace("{", "{{") \
+            .replace("}", "}}") + replacement
+        cursor = edit_end
+    pattern += text[cursor:template_end].replace("{", "{{").replace("}", "}}")
+
+    copies = [pattern.format(name=f"R{i}", x=x, y=y)
+              for i, (x, y) in enumerate(grid_positions(count, spacing))]
+
+    # drop the original robots and put the copies where the first one was
+    out = text[:template_start] + "\n".join(copies)
+    cursor = template_end
+    for robot_start, _, robot_close, _ in robots[1:]:
+        out += text[cursor:tokens[robot_start].start()].rstrip() + "\n"
+        cursor = tokens[robot_close].end()
+    out += text[cursor:]
+    return out
@@ -0,0 +1,220 @@
+"""Lease-based work queue on a (shared) filesystem.
+
+Any number of worker processes, on one host or on several hosts that mount
+the same directory, take jobs from the queue. The queue is a directory of
+plain files, because SQLite's locking is not reliable on NFS:
+
+    jobs/<id>.json     the job (a JSON object), with its "order"
+    leases/<id>        held by the worker running the job; its mtime is the
+                       last heartbeat
+    done/<id>.json     the outcome of the job
+
+A lease is taken with an exclusive create, and a worker renews it while the
+job runs. A lease that has not been renewed for `lease_seconds` belongs to a
+dead worker: the next worker renames it away (only one rename succeeds) and
+runs the job again. A job that lost its worker `max_attempts` times is given
+up. Outcomes are hard-linked into place, which fails if the file exists, so
+each job's outcome is recorded exactly once even if a slow worker and its
+replacement both finish. Ages are measured against the filesystem's clock,
+so the hosts' clocks do not need to agree.
+"""
+
+import json
+import os
+import socket
+import uuid
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _write_json(path: Path, data) -> Path:
+    tmp = path.with_name(f".{path.name}.{worker_name()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    return tmp
+
+
+class Lease:
+    def __init__(self, job_id: str, job: dict, token: str, attempt: int):
+        self.job_id = job_id
+        self.job = job
+        self.token = token
+        self.attempt = attempt
+
+
+class WorkQueue:
+    def __init__(self, queue_dir: Path,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.queue_dir = Path(queue_dir)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.jobs_dir = self.queue_dir / "jobs"
+        self.leases_dir = self.queue_dir / "leases"
+        self.done_dir = self.queue_dir / "done"
+        for directory in [self.jobs_dir, self.leases_dir, self.done_dir]:
+            directory.mkdir(parents=True, exist_ok=True)
+
+    def _done(self, job_id: str) -> Path:
+        return self.done_dir / f"{job_id}.json"
+
+    def _lease(self, job_id: str) -> Path:
+        return self.leases_dir / job_id
+
+    def _fs_now(self) -> float:
+        # the clock of the file server, comparable with the leases' mtimes
+        probe = self.queue_dir / f".clock.{worker_name()}"
+        probe.touch()
+        now = probe.stat().st_mtime
+        probe.unlink()
+        return now
+
+    def put(self, job_id: str, job: dict, order: int = 0) -> bool:
+        """Queue a job unless it already succeeded; returns True if queued.
+
+        The outcome of a failed or abandoned job is dropped, so that the
+        job runs again.
+        """
+        outcome = self.outcome(job_id)
+        if outcome is not None:
+            if outcome.get("returncode") == 0:
+                return False
+            self._done(job_id).unlink(missing_ok=True)
+        job_file = self.jobs_dir / f"{job_id}.json"
+        os.replace(_write_json(job_file, {"order": order, "job": job}),
+                   job_file)
+        return True
+
+    def job_ids(self) -> list[str]:
+        return [job_file.stem for job_file in self.jobs_dir.glob("*.json")]
+
+    def outcome(self, job_id: str) -> Optional[dict]:
+        try:
+            with open(self._done(job_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def pending(self) -> list[str]:
+        """Jobs without an outcome, running or not, in queue order."""
+        pending = []
+        for job_file in self.jobs_dir.glob("*.json"):
+            if self._done(job_file.stem).exists():
+                continue
+            with open(job_file) as f:
+                pending.append((json.load(f)["order"], job_file.stem))
+        return [job_id for _, job_id in sorted(pending)]
+
+    def _take_lease(self, job_id: str, attempt: int) -> Optional[str]:
+        token = uuid.uuid4().hex
+        try:
+            fd = os.open(self._lease(job_id),
+                         os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, "w") as f:
+            json.dump({"worker": worker_name(), "token": token,
+                       "attempt": attempt}, f)
+        return token
+
+    def _break_stale_lease(self, job_id: str, now: float) -> Optional[int]:
+        """Remove the lease of a dead worker; returns its attempt number.
+
+        Returns None if the lease is alive or another worker broke it first.
+        """
+        lease = self._lease(job_id)
+        try:
+            if now - lease.stat().st_mtime < self.lease_seconds:
+                return None
+            stale = lease.with_name(f".{job_id}.{worker_name()}.stale")
+            lease.rename(stale)
+        except FileNotFoundError:
+            return None
+        try:
+            with open(stale) as f:
+                attempt = json.load(f)["attempt"]
+        except (OSError, ValueError, KeyError):
+            attempt = 1
+        stale.unlink()
+        return attempt
+
+    def claim(self) -> Optional[Lease]:
+        """Lease the first pending job that nobody holds, or None."""
+        now = None
+        for job_id in self.pending():
+            attempt = 1
+            token = self._take_lease(job_id, attempt)
+            if token is None:
+                if now is None:
+                    now = self._fs_now()
+                previous = self._break_stale_lease(job_id, now)
+                if previous is None:
+                    continue
+                if previous >= self.max_attempts:
+                    self._record(job_id, {
+                        "returncode": None,
+                        "abandoned": f"worker lost {previous} time(s)",
+                    })
+                    continue
+                attempt = previous + 1
+                token = self._take_lease(job_id, attempt)
+                if token is None:
+                    continue
+            # finished between listing and leasing
+            if self._done(job_id).exists():
+                self._release(job_id, token)
+                continue
+            with open(self.jobs_dir / f"{job_id}.json") as f:
+                job = json.load(f)["job"]
+            return Lease(job_id, job, token, attempt)
+        return None
+
+    def _holds(self, job_id: str, token: str) -> bool:
+        try:
+            with open(self._lease(job_id)) as f:
+                return json.load(f)["token"] == token
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def renew(self, lease: Lease) -> bool:
+        """Heartbeat; returns False if the lease was taken over."""
+        if not self._holds(lease.job_id, lease.token):
+            return False
+        try:
+            os.utime(self._lease(lease.job_id))
+        except FileNotFoundError:
+            # broken as stale by another worker since the check
+            return False
+        return True
+
+    def _release(self, job_id: str, token: str) -> None:
+        if self._holds(job_id, token):
+            self._lease(job_id).unlink(missing_ok=True)
+
+    def _record(self, job_id: str, outcome: dict) -> bool:
+        tmp = _write_json(self._done(job_id), outcome)
+        try:
+            os.link(tmp, self._done(job_id))
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            tmp.unlink()
+
+    def complete(self, lease: Lease, outcome: dict) -> bool:
+        """Record the outcome of a leased job and release the lease.
+
+        Returns False if another worker recorded an outcome first.
+        """
+        recorded = self._record(lease.job_id, dict(
+            outcome, worker=worker_name(), attempt=lease.attempt
+        ))
+        self._release(lease.job_id, lease.token)
+        return recorded